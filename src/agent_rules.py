@@ -0,0 +1,187 @@
+###
+# Per agent rules of the CPU engines
+# the game, payoff, mutation and inheritance rules of the agent functions in
+# model.py, on columnar numpy arrays. Both CPU engines (batch_engine.py and
+# domain_decomposition.py) call these, they only differ in how they draw the
+# random numbers passed in and in how agents are laid out.
+# Environment values may be scalars or per agent arrays.
+###
+from typing import Callable, Dict
+
+import numpy as np
+
+# these mirror the constants in model.py
+AGENT_STRATEGY_COOP: int = 0
+AGENT_STRATEGY_DEFECT: int = 1
+AGENT_STRATEGY_TIT_FOR_TAT: int = 2
+AGENT_STRATEGY_RANDOM: int = 3
+AGENT_RESULT_COOP: int = 0
+AGENT_RESULT_DEFECT: int = 1
+
+
+def strategy_id(strategies: np.ndarray, trait: np.ndarray) -> np.ndarray:
+    # "base 10" id of (strategy vs own trait, strategy vs other traits)
+    rows = np.arange(trait.size)
+    strat_my = strategies[rows, trait]
+    if strategies.shape[1] > 1:
+        strat_other = strategies[rows, np.where(trait == 0, 1, 0)]
+    else:
+        strat_other = strat_my
+    return (strat_my.astype(np.int64) * 10 + strat_other).astype(np.uint8)
+
+
+def random_population(
+    rng: np.random.Generator, environment: dict
+) -> Dict[str, np.ndarray]:
+    # init_fn layout: agents on distinct random cells, energy from
+    # N(init_energy_mu, init_energy_sigma) and strategies from the weights
+    env_max = int(environment["env_max"])
+    trait_count = int(environment["agent_trait_count"])
+    weights = np.asarray(environment["agent_strategy_weights"], dtype=np.float64)
+    weights = weights / weights.sum()
+    n = min(int(environment["init_agent_count"]), env_max * env_max)
+    cells = rng.choice(env_max * env_max, n, replace=False)
+    energy = np.maximum(
+        rng.normal(environment["init_energy_mu"], environment["init_energy_sigma"], n),
+        environment["init_energy_min"],
+    )
+    if environment["max_energy"] > 0.0:
+        energy = np.minimum(energy, environment["max_energy"])
+    trait = rng.integers(0, trait_count, n).astype(np.uint8)
+    if environment["strategy_pure"] == 1:
+        strategy = rng.choice(len(weights), n, p=weights)
+        strategies = np.repeat(strategy[:, None], trait_count, axis=1)
+    elif environment["strategy_per_trait"] == 1:
+        strategies = rng.choice(len(weights), (n, trait_count), p=weights)
+    else:
+        # one strategy for matching traits, one for different traits
+        pair = rng.choice(len(weights), (n, 2), p=weights)
+        strategies = np.where(
+            np.arange(trait_count)[None, :] == trait[:, None], pair[:, :1], pair[:, 1:]
+        )
+    strategies = strategies.astype(np.uint8)
+    return {
+        "x_a": (cells // env_max).astype(np.int32),
+        "y_a": (cells % env_max).astype(np.int32),
+        "energy": energy.astype(np.float32),
+        "agent_trait": trait,
+        "agent_strategies": strategies,
+        "agent_strategy_id": strategy_id(strategies, trait),
+    }
+
+
+def decide(
+    agents: Dict[str, np.ndarray],
+    me: np.ndarray,
+    opponent_id: np.ndarray,
+    slot: int,
+    strategy: np.ndarray,
+    random_roll: np.ndarray,
+    noise_roll: np.ndarray,
+    env_noise,
+) -> np.ndarray:
+    # True = cooperate, see play_response
+    coop = strategy == AGENT_STRATEGY_COOP
+    remembered = agents["game_memory"][me, slot] == opponent_id
+    coop |= (strategy == AGENT_STRATEGY_TIT_FOR_TAT) & (
+        ~remembered | (agents["game_memory_choices"][me, slot] == AGENT_RESULT_COOP)
+    )
+    coop |= (strategy == AGENT_STRATEGY_RANDOM) & (random_roll > 0.5)
+    return coop ^ (noise_roll < env_noise)
+
+
+def payoff(
+    my_coop: np.ndarray,
+    other_coop: np.ndarray,
+    payoff_cc,
+    payoff_cd,
+    payoff_dc,
+    payoff_dd,
+) -> np.ndarray:
+    return np.where(
+        my_coop,
+        np.where(other_coop, payoff_cc, payoff_cd),
+        np.where(other_coop, payoff_dc, payoff_dd),
+    )
+
+
+def remember(
+    agents: Dict[str, np.ndarray],
+    me: np.ndarray,
+    opponent_id: np.ndarray,
+    slot: int,
+    strategy: np.ndarray,
+    opponent_coop: np.ndarray,
+) -> None:
+    # tit for tat agents keep the opponent and its choice in the slot of
+    # the direction they played in
+    tit_for_tat = strategy == AGENT_STRATEGY_TIT_FOR_TAT
+    rows = me[tit_for_tat]
+    agents["game_memory"][rows, slot] = opponent_id[tit_for_tat]
+    agents["game_memory_choices"][rows, slot] = np.where(
+        opponent_coop[tit_for_tat], AGENT_RESULT_COOP, AGENT_RESULT_DEFECT
+    )
+
+
+def mutate(
+    strategies: np.ndarray,
+    roll: np.ndarray,
+    shift: np.ndarray,
+    rate,
+    strategy_count: int,
+) -> np.ndarray:
+    # swap to a different strategy (shift in 1 .. strategy_count - 1) where
+    # roll < rate
+    return np.where(
+        roll < rate, (strategies + shift) % strategy_count, strategies
+    ).astype(np.uint8)
+
+
+def inherit_strategies(
+    strategies: np.ndarray,
+    trait: np.ndarray,
+    pure: np.ndarray,
+    per_trait: np.ndarray,
+    mutate_fn: Callable[[np.ndarray], np.ndarray],
+) -> np.ndarray:
+    # strategies of the children of parents with these strategies and traits,
+    # pure / per_trait are per parent. mutate_fn mutates a (parents, columns)
+    # array, it is called for every mode in the order pure, per trait, kin.
+    trait_count = strategies.shape[1]
+    children = strategies.copy()
+    kin = ~pure & ~per_trait
+    pure_strategy = mutate_fn(strategies[:, :1])
+    per_trait_strategies = mutate_fn(strategies)
+    # kin: strategy vs own trait and strategy vs other traits mutate apart
+    parent_id = strategy_id(strategies, trait)
+    pair = mutate_fn(
+        np.stack([parent_id // 10, parent_id % 10], axis=1).astype(np.uint8)
+    )
+    kin_strategies = np.where(
+        np.arange(trait_count)[None, :] == trait[:, None], pair[:, :1], pair[:, 1:]
+    )
+    children[pure] = np.repeat(pure_strategy, trait_count, axis=1)[pure]
+    children[per_trait] = per_trait_strategies[per_trait]
+    children[kin] = kin_strategies[kin]
+    return children.astype(np.uint8)
+
+
+def child_energy(
+    parent_energy: np.ndarray,
+    normal: np.ndarray,
+    inheritence,
+    init_energy_mu,
+    init_energy_sigma,
+    init_energy_min,
+    max_energy,
+) -> np.ndarray:
+    # a share of the parent's energy, or a fresh N(mu, sigma) draw when
+    # reproduction_inheritence is not in (0, 1]
+    inheritence = np.asarray(inheritence)
+    energy = np.where(
+        (inheritence <= 0.0) | (inheritence > 1.0),
+        normal * init_energy_sigma + init_energy_mu,
+        inheritence * parent_energy,
+    )
+    return np.clip(energy, init_energy_min, max_energy)
+
@@ -0,0 +1,1014 @@
+###
+# Batched CPU engine for the prisoner's dilemma ABM
+# runs K independent replicates of the model in model.py at once. The agents
+# of all replicates live in one set of columnar arrays and grid occupancy is
+# a (K, env_max, env_max) array with a leading replicate axis, so every phase
+# of a step (search, play, move, reproduce, punish) runs once over the whole
+# batch instead of once per simulation.
+# Replicates can differ in seed and in any scalar environment property
+# (cost_of_living, travel_cost, payoffs, ...), the grid size and the
+# number of traits / strategies are shared.
+# Every replicate draws from its own (seed, step) random stream, so its
+# result depends on its seed and environment only, not on which replicates
+# share its batch. The engine applies the rules of the agent functions
+# (agent_rules.py, shared with domain_decomposition.py), its results are
+# not bitwise (or claimed statistically) equal to GPU runs.
+###
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import agent_rules
+from schema import cpu_agent_columns
+from warm_start import check_snapshot, cpu_population
+
+# these mirror the constants in model.py
+AGENT_MOVE_RESULT_NONE: int = 0
+AGENT_MOVE_RESULT_MOVED: int = 1
+AGENT_MOVE_RESULT_FAILED: int = 2
+ID_NOT_SET: int = 0
+# why a replicate stopped, 0 = still running / ran for all steps
+STOP_REASON_NONE: int = 0
+STOP_REASON_EXTINCT: int = 1
+STOP_REASON_FIXATION: int = 2
+STOP_REASON_STEADY_STATE: int = 3
+# perf_counters of every step, the iterations are the rounds each phase ran
+PERF_COUNTER_NAMES: List[str] = [
+    "games",
+    "move_contests_lost",
+    "reproduction_claims_failed",
+    "no_games",
+    "play_iterations",
+    "move_iterations",
+    "god_iterations",
+]
+(
+    PERF_COUNTER_GAMES,
+    PERF_COUNTER_MOVE_CONTESTS_LOST,
+    PERF_COUNTER_REPRODUCTION_CLAIMS_FAILED,
+    PERF_COUNTER_NO_GAMES,
+    PERF_COUNTER_PLAY_ITERATIONS,
+    PERF_COUNTER_MOVE_ITERATIONS,
+    PERF_COUNTER_GOD_ITERATIONS,
+) = range(len(PERF_COUNTER_NAMES))
+
+# moore neighbourhood in the order used by pos_from_moore_seq, sequence i and
+# SPACES_WITHIN_RADIUS - 1 - i are opposite directions.
+SPACES_WITHIN_RADIUS: int = 8
+MOORE_X_OFFSETS: np.ndarray = np.array([-1, -1, -1, 0, 0, 1, 1, 1], dtype=np.int32)
+MOORE_Y_OFFSETS: np.ndarray = np.array([-1, 0, 1, -1, 1, -1, 0, 1], dtype=np.int32)
+
+# defaults mirror the configuration section of model.py, on a smaller grid
+DEFAULT_ENVIRONMENT: dict = {
+    "env_max": 2**6,
+    "init_agent_count": int(2**12 * 0.16),
+    "max_agents": int(2**12 * 0.5),
+    "cost_of_living": 1.0,
+    "travel_cost": 0.5,
+    "reproduce_min_energy": 100.0,
+    "reproduce_cost": 50.0,
+    "reproduction_inheritence": 0.0,
+    "max_children_per_step": 1,
+    "payoff_cc": 3.0,
+    "payoff_dc": 5.0,
+    "payoff_cd": -1.0,
+    "payoff_dd": 0.0,
+    "max_energy": 150.0,
+    "init_energy_mu": 50.0,
+    "init_energy_sigma": 10.0,
+    "init_energy_min": 5.0,
+    "env_noise": 0.0,
+    "mutation_rate": 0.0,
+    "strategy_pure": 0,
+    "strategy_per_trait": 0,
+    "agent_trait_count": 4,
+    "agent_strategy_weights": [1 / 4, 1 / 4, 1 / 4, 1 / 4],
+}
+
+# properties that define array shapes, these can not differ between replicates
+SHARED_PROPERTIES: List[str] = [
+    "env_max",
+    "agent_trait_count",
+    "agent_strategy_weights",
+]
+
+
+# below this share of occupied cells the engine switches to the sparse cell
+# index, and back to the dense one above twice this share.
+SPARSE_DENSITY_THRESHOLD: float = 0.02
+
+
+# tiled mode: bytes of dense cell index per cell, and of per agent
+# temporaries in the neighbourhood scans (8 neighbours of row, id, roll,
+# position and key), used to size tiles and chunks to the memory budget.
+CELL_INDEX_BYTES: int = 4
+TILE_ROW_BYTES: int = 320
+
+
+class DenseCellIndex:
+    # (replicate, x, y) -> agent row, one int32 per grid cell
+    name: str = "dense"
+
+    def __init__(self, replicates: int, env_max: int):
+        self.cells: np.ndarray = np.full(
+            (replicates, env_max, env_max), -1, dtype=np.int32
+        )
+
+    def rebuild(
+        self, replicate: np.ndarray, x: np.ndarray, y: np.ndarray, rows: np.ndarray
+    ) -> None:
+        self.cells.fill(-1)
+        self.cells[replicate, x, y] = rows
+
+    def lookup(self, replicate: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        return self.cells[replicate, x, y]
+
+    def clear(self, replicate: np.ndarray, x: np.ndarray, y: np.ndarray) -> None:
+        self.cells[replicate, x, y] = -1
+
+    def assign(
+        self, replicate: np.ndarray, x: np.ndarray, y: np.ndarray, rows: np.ndarray
+    ) -> None:
+        self.cells[replicate, x, y] = rows
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.cells.nbytes)
+
+
+class SparseCellIndex:
+    # sorted cell keys of occupied cells and their agent rows, so memory and
+    # lookups scale with the number of agents rather than the grid area.
+    # Cleared cells keep their key with row -1 until the next rebuild.
+    name: str = "sparse"
+
+    def __init__(self, replicates: int, env_max: int):
+        self.env_max: int = env_max
+        self.keys: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.rows: np.ndarray = np.zeros(0, dtype=np.int32)
+
+    def _key(self, replicate: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        replicate, x, y = np.broadcast_arrays(replicate, x, y)
+        return (replicate.astype(np.int64) * self.env_max + x) * self.env_max + y
+
+    def _find(self, key: np.ndarray) -> tuple:
+        if self.keys.size == 0:
+            return np.zeros(key.shape, dtype=np.int64), np.zeros(key.shape, dtype=bool)
+        position = np.minimum(np.searchsorted(self.keys, key), self.keys.size - 1)
+        return position, self.keys[position] == key
+
+    def rebuild(
+        self, replicate: np.ndarray, x: np.ndarray, y: np.ndarray, rows: np.ndarray
+    ) -> None:
+        key = self._key(replicate, x, y)
+        order = np.argsort(key)
+        self.keys = key[order]
+        self.rows = np.asarray(rows, dtype=np.int32)[order]
+
+    def lookup(self, replicate: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        position, found = self._find(self._key(replicate, x, y))
+        if self.rows.size == 0:
+            return np.full(position.shape, -1, dtype=np.int32)
+        return np.where(found, self.rows[position], -1).astype(np.int32)
+
+    def clear(self, replicate: np.ndarray, x: np.ndarray, y: np.ndarray) -> None:
+        position, found = self._find(self._key(replicate, x, y))
+        self.rows[position[found]] = -1
+
+    def assign(
+        self, replicate: np.ndarray, x: np.ndarray, y: np.ndarray, rows: np.ndarray
+    ) -> None:
+        key = self._key(replicate, x, y)
+        rows = np.broadcast_to(np.asarray(rows, dtype=np.int32), key.shape)
+        position, found = self._find(key)
+        self.rows[position[found]] = rows[found]
+        # new keys are merged in, keeping the keys sorted
+        new_key = key[~found]
+        order = np.argsort(new_key)
+        new_key = new_key[order]
+        insert_at = np.searchsorted(self.keys, new_key)
+        self.keys = np.insert(self.keys, insert_at, new_key)
+        self.rows = np.insert(self.rows, insert_at, rows[~found][order])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.keys.nbytes + self.rows.nbytes)
+
+
+class ReplicateRandom:
+    # one numpy Generator per replicate, keyed by (seed, step). Every draw
+    # takes the replicate and id of each agent, a replicate consumes its own
+    # stream in id order. Ids of a replicate are handed out in the same order
+    # whatever shares its batch, so its draws depend neither on the other
+    # replicates nor on the row order (tiling).
+    def __init__(self, seeds: List[int], step: int):
+        self.generators = [np.random.default_rng([seed, step]) for seed in seeds]
+
+    def _draw(
+        self,
+        replicate: np.ndarray,
+        ids: np.ndarray,
+        columns: Tuple[int, ...],
+        draw: Callable[[np.random.Generator, tuple], np.ndarray],
+    ) -> np.ndarray:
+        order = np.lexsort((ids, replicate))
+        replicate = replicate[order]
+        sizes = np.bincount(replicate, minlength=len(self.generators))
+        parts = [
+            draw(self.generators[k], (int(size),) + columns)
+            for k, size in enumerate(sizes)
+            if size > 0
+        ]
+        if not parts:
+            return draw(self.generators[0], (0,) + columns)
+        values = np.concatenate(parts)
+        out = np.empty_like(values)
+        out[order] = values
+        return out
+
+    def random(
+        self,
+        replicate: np.ndarray,
+        ids: np.ndarray,
+        columns: Tuple[int, ...] = (),
+        dtype=np.float64,
+    ) -> np.ndarray:
+        return self._draw(
+            replicate, ids, columns, lambda rng, shape: rng.random(shape, dtype=dtype)
+        )
+
+    def integers(
+        self,
+        low: int,
+        high: int,
+        replicate: np.ndarray,
+        ids: np.ndarray,
+        columns: Tuple[int, ...] = (),
+    ) -> np.ndarray:
+        return self._draw(
+            replicate, ids, columns, lambda rng, shape: rng.integers(low, high, shape)
+        )
+
+    def normal(self, replicate: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        return self._draw(
+            replicate, ids, (), lambda rng, shape: rng.normal(size=shape)
+        )
+
+
+class BatchSimulation:
+    def __init__(
+        self,
+        seeds: List[int],
+        environment: Optional[dict] = None,
+        replicate_environments: Optional[List[dict]] = None,
+        sparse_density_threshold: float = SPARSE_DENSITY_THRESHOLD,
+        tile_memory_budget: int = 0,
+        initial_population: Optional[Dict[str, np.ndarray]] = None,
+        stop_on_fixation: bool = False,
+        steady_state_window: int = 0,
+        steady_state_epsilon: float = 0.001,
+    ):
+        if len(seeds) < 1:
+            raise ValueError("a batch needs at least one replicate")
+        self.seeds: List[int] = [int(seed) for seed in seeds]
+        self.replicates: int = len(self.seeds)
+        base = dict(DEFAULT_ENVIRONMENT)
+        base.update(environment or {})
+        overrides = replicate_environments or [{}] * self.replicates
+        if len(overrides) != self.replicates:
+            raise ValueError("need one environment override per replicate")
+        self.environments: List[dict] = [dict(base, **o) for o in overrides]
+        for name in SHARED_PROPERTIES:
+            if any(e[name] != base[name] for e in self.environments):
+                raise ValueError(f"{name} must be the same for all replicates")
+
+        self.env_max: int = int(base["env_max"])
+        self.trait_count: int = int(base["agent_trait_count"])
+        weights = np.asarray(base["agent_strategy_weights"], dtype=np.float64)
+        self.strategy_weights: np.ndarray = weights / weights.sum()
+        self.strategy_count: int = len(weights)
+        self.population_count_bins: int = self.strategy_count**2
+        # per replicate values of every scalar property, indexed by replicate
+        self.env: Dict[str, np.ndarray] = {
+            name: np.asarray([e[name] for e in self.environments])
+            for name in base
+            if name not in SHARED_PROPERTIES
+        }
+
+        self.step_counter: int = 0
+        self.next_id: int = ID_NOT_SET + 1
+        self.sparse_density_threshold: float = sparse_density_threshold
+        self.cell_index = DenseCellIndex(self.replicates, self.env_max)
+        # (step, cell index, density) every time the cell index changes
+        self.cell_index_switches: List[tuple] = []
+        # tiled mode, 0 = process every phase over all agents at once
+        self.tile_memory_budget: int = tile_memory_budget
+        self.tile_side: int = self.env_max
+        self.agents: Dict[str, np.ndarray] = self._empty_agents(0)
+        # warm start: every replicate starts from this population snapshot
+        # (warm_start.py) instead of a random one
+        if initial_population is not None:
+            check_snapshot(initial_population, self.env_max, self.trait_count)
+        self.initial_population = initial_population
+        self._init_population()
+        self._reset_step_state()
+        # early stopping, the rules of _stop_reason in model.py per replicate.
+        # Stopped replicates move to stopped_agents and take no more steps.
+        self.stop_on_fixation: bool = stop_on_fixation
+        self.steady_state_window: int = steady_state_window
+        self.steady_state_epsilon: float = steady_state_epsilon
+        self.stop_reason: np.ndarray = np.full(
+            self.replicates, STOP_REASON_NONE, dtype=np.uint8
+        )
+        self.stop_step: np.ndarray = np.zeros(self.replicates, dtype=np.int64)
+        self.stopped_agents: Dict[str, np.ndarray] = self._empty_agents(0)
+        self.stopped_counts: np.ndarray = np.zeros(
+            (self.replicates, self.population_count_bins), dtype=np.int64
+        )
+        # ring buffer of the strategy shares of the last steady_state_window steps
+        self.share_window: np.ndarray = np.zeros(
+            (self.replicates, max(steady_state_window, 1), self.population_count_bins)
+        )
+        self.population_strat_count: np.ndarray = self._count()
+        self.step_logs: List[List[dict]] = [[] for _ in range(self.replicates)]
+        self.telemetry: Dict[str, object] = {}
+
+    # agent variables, one row per agent of any replicate (see schema.py)
+    def _empty_agents(self, n: int) -> Dict[str, np.ndarray]:
+        return {
+            "replicate": np.zeros(n, dtype=np.int32),
+            **cpu_agent_columns(self.trait_count, SPACES_WITHIN_RADIUS, n),
+        }
+
+    @property
+    def agent_count(self) -> int:
+        return int(self.agents["id"].size)
+
+    def _agent_env(self, name: str, rows: np.ndarray) -> np.ndarray:
+        # per agent value of a (possibly per replicate) environment property
+        return self.env[name][self.agents["replicate"][rows]]
+
+    def _new_ids(self, n: int) -> np.ndarray:
+        ids = np.arange(self.next_id, self.next_id + n, dtype=np.int64)
+        self.next_id += n
+        return ids
+
+    def _init_population(self) -> None:
+        parts: List[Dict[str, np.ndarray]] = []
+        for k, seed in enumerate(self.seeds):
+            if self.initial_population is not None:
+                agents = {
+                    "replicate": np.full(
+                        self.initial_population["x_a"].size, k, dtype=np.int32
+                    ),
+                    **cpu_population(
+                        self.initial_population, SPACES_WITHIN_RADIUS, self.next_id
+                    ),
+                }
+                self.next_id += agents["id"].size
+                parts.append(agents)
+                continue
+            population = agent_rules.random_population(
+                np.random.default_rng([seed]), self.environments[k]
+            )
+            n = population["x_a"].size
+            agents = self._empty_agents(n)
+            agents["replicate"][:] = k
+            for name, values in population.items():
+                agents[name][:] = values
+            agents["id"][:] = self._new_ids(n)
+            parts.append(agents)
+        self.agents = {
+            name: np.concatenate([part[name] for part in parts])
+            for name in self.agents
+        }
+        if self.tile_memory_budget > 0:
+            self._sort_by_tile()
+        self._rebuild_cells()
+
+    def _density(self) -> float:
+        return self.agent_count / (self.replicates * self.env_max * self.env_max)
+
+    def _sort_by_tile(self) -> None:
+        # order agents by (replicate, tile, x, y), so consecutive rows are
+        # spatial neighbours and a chunk of rows only touches the cells of a
+        # few tiles (plus their one cell halo).
+        # the tile side is chosen so that a tile's cells and the temporaries
+        # of the agents in it fit in the memory budget.
+        density = max(self._density(), 1 / (self.env_max * self.env_max))
+        side = int(
+            np.sqrt(
+                self.tile_memory_budget / (CELL_INDEX_BYTES + density * TILE_ROW_BYTES)
+            )
+        )
+        self.tile_side = int(np.clip(side - 2, 1, self.env_max))
+        a = self.agents
+        tiles_per_row = -(-self.env_max // self.tile_side)
+        tile = (
+            a["replicate"].astype(np.int64) * tiles_per_row
+            + a["x_a"] // self.tile_side
+        ) * tiles_per_row + a["y_a"] // self.tile_side
+        key = (tile * self.tile_side + a["x_a"] % self.tile_side) * self.tile_side + (
+            a["y_a"] % self.tile_side
+        )
+        # rows stay almost sorted between steps, which a stable sort exploits
+        order = np.argsort(key, kind="stable")
+        for name in a:
+            a[name] = a[name][order]
+
+    def _row_chunks(self, n: int) -> List[slice]:
+        # slices of at most as many rows as fit in the memory budget
+        if self.tile_memory_budget <= 0:
+            return [slice(0, n)]
+        rows = max(self.tile_memory_budget // TILE_ROW_BYTES, 1)
+        return [slice(first, min(first + rows, n)) for first in range(0, n, rows)]
+
+    def _rebuild_cells(self) -> None:
+        # pick the cell index for the current density, with some hysteresis
+        # so a population hovering around the threshold does not flip-flop.
+        density = self._density()
+        if isinstance(self.cell_index, DenseCellIndex):
+            if density < self.sparse_density_threshold:
+                self.cell_index = SparseCellIndex(self.replicates, self.env_max)
+        elif density >= 2 * self.sparse_density_threshold:
+            self.cell_index = DenseCellIndex(self.replicates, self.env_max)
+        if (
+            not self.cell_index_switches
+            or self.cell_index_switches[-1][1] != self.cell_index.name
+        ):
+            self.cell_index_switches.append(
+                (self.step_counter, self.cell_index.name, density)
+            )
+        a = self.agents
+        self.cell_index.rebuild(
+            a["replicate"],
+            a["x_a"],
+            a["y_a"],
+            np.arange(self.agent_count, dtype=np.int32),
+        )
+
+    def _reset_step_state(self) -> None:
+        n = self.agent_count
+        self.alive: np.ndarray = np.ones(n, dtype=bool)
+        self.is_new: np.ndarray = np.zeros(n, dtype=bool)
+        self.games_played: np.ndarray = np.zeros(n, dtype=np.uint8)
+        self.move_result: np.ndarray = np.full(n, AGENT_MOVE_RESULT_NONE, np.uint8)
+        # (replicates, counters) of this step
+        self.perf_counters: np.ndarray = np.zeros(
+            (self.replicates, len(PERF_COUNTER_NAMES)), dtype=np.int64
+        )
+
+    def _count_events(self, counter: int, rows: np.ndarray) -> None:
+        self.perf_counters[:, counter] += np.bincount(
+            self.agents["replicate"][rows], minlength=self.replicates
+        )
+
+    def _count_iteration(self, counter: int, rows: np.ndarray) -> None:
+        # one more round for every replicate that still had agents in it
+        self.perf_counters[:, counter] += (
+            np.bincount(self.agents["replicate"][rows], minlength=self.replicates) > 0
+        )
+
+    def _kill(self, rows: np.ndarray) -> None:
+        rows = rows[self.alive[rows]]
+        a = self.agents
+        self.alive[rows] = False
+        self.cell_index.clear(a["replicate"][rows], a["x_a"][rows], a["y_a"][rows])
+
+    def _neighbour_positions(
+        self, rows: np.ndarray, sequence: np.ndarray
+    ) -> tuple:
+        # wrapped (x, y) of the moore neighbour at each sequence index
+        a = self.agents
+        new_x = (a["x_a"][rows, None] + MOORE_X_OFFSETS[sequence]) % self.env_max
+        new_y = (a["y_a"][rows, None] + MOORE_Y_OFFSETS[sequence]) % self.env_max
+        return new_x, new_y
+
+    def _neighbours(self, rows: np.ndarray) -> np.ndarray:
+        # (rows, SPACES_WITHIN_RADIUS) row of each neighbour, -1 if empty
+        sequence = np.arange(SPACES_WITHIN_RADIUS)[None, :]
+        new_x, new_y = self._neighbour_positions(rows, sequence)
+        return self.cell_index.lookup(
+            self.agents["replicate"][rows, None], new_x, new_y
+        )
+
+    def _free_neighbour(
+        self, rows: np.ndarray, start: np.ndarray
+    ) -> tuple:
+        # first free neighbouring cell, scanning the sequence from start
+        chunks = self._row_chunks(rows.size)
+        if len(chunks) > 1:
+            parts = [self._free_neighbour(rows[c], start[c]) for c in chunks]
+            return tuple(np.concatenate(part) for part in zip(*parts))
+        sequence = (start[:, None] + np.arange(SPACES_WITHIN_RADIUS)[None, :]) % (
+            SPACES_WITHIN_RADIUS
+        )
+        new_x, new_y = self._neighbour_positions(rows, sequence)
+        free = (
+            self.cell_index.lookup(self.agents["replicate"][rows, None], new_x, new_y)
+            < 0
+        )
+        found = free.any(axis=1)
+        first = free.argmax(axis=1)
+        pick = np.arange(rows.size)
+        return new_x[pick, first], new_y[pick, first], found
+
+    def _claim(
+        self, rows: np.ndarray, new_x: np.ndarray, new_y: np.ndarray, roll: np.ndarray
+    ) -> np.ndarray:
+        # resolve competing requests for the same cell: the highest roll wins,
+        # ties go to the higher id (as in move_response / god_multiply)
+        key = (
+            self.agents["replicate"][rows].astype(np.int64) * self.env_max + new_x
+        ) * self.env_max + new_y
+        order = np.lexsort((self.agents["id"][rows], roll, key))
+        sorted_key = key[order]
+        last = np.ones(rows.size, dtype=bool)
+        last[:-1] = sorted_key[1:] != sorted_key[:-1]
+        winners = np.zeros(rows.size, dtype=bool)
+        winners[order[last]] = True
+        return winners
+
+    def _decide(
+        self,
+        rng: ReplicateRandom,
+        me: np.ndarray,
+        opponent: np.ndarray,
+        slot: int,
+        strategy: np.ndarray,
+    ) -> np.ndarray:
+        a = self.agents
+        replicate, ids = a["replicate"][me], a["id"][me]
+        random_roll = rng.random(replicate, ids)
+        noise_roll = rng.random(replicate, ids)
+        return agent_rules.decide(
+            a,
+            me,
+            a["id"][opponent],
+            slot,
+            strategy,
+            random_roll,
+            noise_roll,
+            self._agent_env("env_noise", me),
+        )
+
+    def _payoff(
+        self, rows: np.ndarray, my_coop: np.ndarray, other_coop: np.ndarray
+    ) -> np.ndarray:
+        return agent_rules.payoff(
+            my_coop,
+            other_coop,
+            self._agent_env("payoff_cc", rows),
+            self._agent_env("payoff_cd", rows),
+            self._agent_env("payoff_dc", rows),
+            self._agent_env("payoff_dd", rows),
+        )
+
+    def _play(self, rng: ReplicateRandom) -> None:
+        # pdgame submodel: the higher roller of each neighbouring pair
+        # challenges, one direction of the moore sequence per round.
+        a = self.agents
+        n = self.agent_count
+        die_roll = rng.random(a["replicate"], a["id"], dtype=np.float32)
+        neighbours = np.empty((n, SPACES_WITHIN_RADIUS), dtype=np.int32)
+        challenge = np.empty((n, SPACES_WITHIN_RADIUS), dtype=bool)
+        # search and game list fused, one chunk of rows at a time
+        for chunk in self._row_chunks(n):
+            rows = np.arange(chunk.start, chunk.stop)
+            chunk_neighbours = self._neighbours(rows)
+            neighbour_rows = np.maximum(chunk_neighbours, 0)
+            neighbour_roll = die_roll[neighbour_rows]
+            my_roll = die_roll[rows, None]
+            neighbours[chunk] = chunk_neighbours
+            challenge[chunk] = (chunk_neighbours >= 0) & (
+                (my_roll > neighbour_roll)
+                | (
+                    (my_roll == neighbour_roll)
+                    & (a["id"][rows, None] > a["id"][neighbour_rows])
+                )
+            )
+        for sequence in range(SPACES_WITHIN_RADIUS):
+            challengers = np.flatnonzero(challenge[:, sequence] & self.alive)
+            responders = neighbours[challengers, sequence]
+            playing = self.alive[responders]
+            challengers = challengers[playing]
+            responders = responders[playing]
+            if challengers.size == 0:
+                continue
+            self._count_events(PERF_COUNTER_GAMES, challengers)
+            self._count_iteration(PERF_COUNTER_PLAY_ITERATIONS, challengers)
+            response_sequence = SPACES_WITHIN_RADIUS - 1 - sequence
+            trait = a["agent_trait"]
+            challenger_strategy = a["agent_strategies"][
+                challengers, trait[responders]
+            ]
+            responder_strategy = a["agent_strategies"][responders, trait[challengers]]
+            challenger_coop = self._decide(
+                rng, challengers, responders, sequence, challenger_strategy
+            )
+            responder_coop = self._decide(
+                rng, responders, challengers, response_sequence, responder_strategy
+            )
+            for me, my_coop, other_coop in (
+                (challengers, challenger_coop, responder_coop),
+                (responders, responder_coop, challenger_coop),
+            ):
+                a["energy"][me] = np.minimum(
+                    a["energy"][me] + self._payoff(me, my_coop, other_coop),
+                    self._agent_env("max_energy", me),
+                )
+                self.games_played[me] += 1
+            agent_rules.remember(
+                a,
+                challengers,
+                a["id"][responders],
+                sequence,
+                challenger_strategy,
+                responder_coop,
+            )
+            agent_rules.remember(
+                a,
+                responders,
+                a["id"][challengers],
+                response_sequence,
+                responder_strategy,
+                challenger_coop,
+            )
+            players = np.concatenate([challengers, responders])
+            self._kill(players[a["energy"][players] <= 0])
+        # had someone to play, but every opponent died first
+        self._count_events(
+            PERF_COUNTER_NO_GAMES,
+            np.flatnonzero(
+                self.alive[:n]
+                & (self.games_played[:n] == 0)
+                & (neighbours >= 0).any(axis=1)
+            ),
+        )
+
+    def _move(self, rng: ReplicateRandom) -> None:
+        # movement submodel: agents that did not play pay the travel cost and
+        # try to claim a free neighbouring cell, losers try again.
+        a = self.agents
+        rows = np.flatnonzero(self.alive & (self.games_played == 0))
+        a["energy"][rows] -= self._agent_env("travel_cost", rows)
+        self._kill(rows[a["energy"][rows] <= 0])
+        rows = rows[self.alive[rows]]
+        self.move_result[rows] = AGENT_MOVE_RESULT_FAILED
+        replicate, ids = a["replicate"][rows], a["id"][rows]
+        roll = rng.random(replicate, ids)
+        start = rng.integers(0, SPACES_WITHIN_RADIUS, replicate, ids)
+        for _ in range(SPACES_WITHIN_RADIUS):
+            new_x, new_y, found = self._free_neighbour(rows, start)
+            rows, roll, start = rows[found], roll[found], start[found]
+            new_x, new_y = new_x[found], new_y[found]
+            if rows.size == 0:
+                break
+            winners = self._claim(rows, new_x, new_y, roll)
+            self._count_iteration(PERF_COUNTER_MOVE_ITERATIONS, rows)
+            self._count_events(PERF_COUNTER_MOVE_CONTESTS_LOST, rows[~winners])
+            moving = rows[winners]
+            replicate = a["replicate"][moving]
+            self.cell_index.clear(replicate, a["x_a"][moving], a["y_a"][moving])
+            a["x_a"][moving] = new_x[winners]
+            a["y_a"][moving] = new_y[winners]
+            self.cell_index.assign(replicate, new_x[winners], new_y[winners], moving)
+            self.move_result[moving] = AGENT_MOVE_RESULT_MOVED
+            rows, roll, start = rows[~winners], roll[~winners], start[~winners]
+
+    def _mutate(
+        self,
+        rng: ReplicateRandom,
+        parents: np.ndarray,
+        strategies: np.ndarray,
+        rate: np.ndarray,
+    ) -> np.ndarray:
+        if self.strategy_count < 2:
+            return strategies
+        replicate, ids = self.agents["replicate"][parents], self.agents["id"][parents]
+        columns = strategies.shape[1:]
+        roll = rng.random(replicate, ids, columns)
+        shift = rng.integers(1, self.strategy_count, replicate, ids, columns)
+        return agent_rules.mutate(strategies, roll, shift, rate, self.strategy_count)
+
+    def _inherit_strategies(
+        self, rng: ReplicateRandom, parents: np.ndarray
+    ) -> np.ndarray:
+        a = self.agents
+        rate = self._agent_env("mutation_rate", parents)[:, None]
+        pure = self._agent_env("strategy_pure", parents) == 1
+        per_trait = ~pure & (self._agent_env("strategy_per_trait", parents) == 1)
+        return agent_rules.inherit_strategies(
+            a["agent_strategies"][parents],
+            a["agent_trait"][parents],
+            pure,
+            per_trait,
+            lambda strategies: self._mutate(rng, parents, strategies, rate),
+        )
+
+    def _spawn(
+        self,
+        rng: ReplicateRandom,
+        parents: np.ndarray,
+        new_x: np.ndarray,
+        new_y: np.ndarray,
+    ) -> None:
+        a = self.agents
+        n = parents.size
+        # children get their ids in parent id order, not row order (tiling)
+        order = np.lexsort((a["id"][parents], a["replicate"][parents]))
+        parents, new_x, new_y = parents[order], new_x[order], new_y[order]
+        energy = agent_rules.child_energy(
+            a["energy"][parents],
+            rng.normal(a["replicate"][parents], a["id"][parents]),
+            self._agent_env("reproduction_inheritence", parents),
+            self._agent_env("init_energy_mu", parents),
+            self._agent_env("init_energy_sigma", parents),
+            self._agent_env("init_energy_min", parents),
+            self._agent_env("max_energy", parents),
+        )
+        children = self._empty_agents(n)
+        children["replicate"][:] = a["replicate"][parents]
+        children["x_a"][:] = new_x
+        children["y_a"][:] = new_y
+        children["id"][:] = self._new_ids(n)
+        children["energy"][:] = energy
+        children["agent_trait"][:] = a["agent_trait"][parents]
+        children["agent_strategies"][:] = self._inherit_strategies(rng, parents)
+        children["agent_strategy_id"][:] = agent_rules.strategy_id(
+            children["agent_strategies"], children["agent_trait"]
+        )
+        first = self.agent_count
+        for name in a:
+            a[name] = np.concatenate([a[name], children[name]])
+        self.alive = np.concatenate([self.alive, np.ones(n, dtype=bool)])
+        self.is_new = np.concatenate([self.is_new, np.ones(n, dtype=bool)])
+        self.games_played = np.concatenate(
+            [self.games_played, np.zeros(n, dtype=np.uint8)]
+        )
+        self.move_result = np.concatenate(
+            [self.move_result, np.full(n, AGENT_MOVE_RESULT_NONE, np.uint8)]
+        )
+        self.cell_index.assign(
+            children["replicate"], new_x, new_y, np.arange(first, first + n)
+        )
+
+    def _alive_per_replicate(self) -> np.ndarray:
+        return np.bincount(
+            self.agents["replicate"][self.alive], minlength=self.replicates
+        )
+
+    def _reproduce(self, rng: ReplicateRandom) -> None:
+        # neighbourhood + god submodels: agents with enough energy claim a
+        # free neighbouring cell for a child, the highest roll wins.
+        a = self.agents
+        spawned = np.zeros(self.agent_count, dtype=np.int32)
+        for _ in range(SPACES_WITHIN_RADIUS):
+            overpopulated = self._alive_per_replicate() > self.env["max_agents"]
+            n = spawned.size
+            candidate = (
+                self.alive[:n]
+                & ~self.is_new[:n]
+                & (a["energy"][:n] >= self._agent_env("reproduce_min_energy", slice(0, n)))
+                & (spawned < self._agent_env("max_children_per_step", slice(0, n)))
+                & ~overpopulated[a["replicate"][:n]]
+            )
+            rows = np.flatnonzero(candidate)
+            if rows.size == 0:
+                break
+            replicate, ids = a["replicate"][rows], a["id"][rows]
+            roll = rng.random(replicate, ids)
+            start = rng.integers(0, SPACES_WITHIN_RADIUS, replicate, ids)
+            new_x, new_y, found = self._free_neighbour(rows, start)
+            # nowhere to put a child, this will not change in this step
+            spawned[rows[~found]] = np.iinfo(np.int32).max
+            rows, roll = rows[found], roll[found]
+            new_x, new_y = new_x[found], new_y[found]
+            if rows.size == 0:
+                break
+            winners = self._claim(rows, new_x, new_y, roll)
+            self._count_iteration(PERF_COUNTER_GOD_ITERATIONS, rows)
+            self._count_events(PERF_COUNTER_REPRODUCTION_CLAIMS_FAILED, rows[~winners])
+            parents = rows[winners]
+            a["energy"][parents] -= self._agent_env("reproduce_cost", parents)
+            spawned[parents] += 1
+            self._spawn(rng, parents, new_x[winners], new_y[winners])
+
+    def _punish(self) -> None:
+        # environmental_punishment: cull over the hard limit (newest first),
+        # then everyone except newborns pays the cost of living.
+        a = self.agents
+        over_limit = self._alive_per_replicate() > self.env["max_agents"]
+        rows = np.flatnonzero(self.alive & over_limit[a["replicate"]])
+        if rows.size:
+            replicate = a["replicate"][rows]
+            # ids only grow, so ranking by id keeps the oldest agents
+            order = np.lexsort((a["id"][rows], replicate))
+            sorted_replicate = replicate[order]
+            rank = np.empty(rows.size, dtype=np.int64)
+            rank[order] = np.arange(rows.size) - np.searchsorted(
+                sorted_replicate, sorted_replicate, side="left"
+            )
+            self._kill(rows[rank >= self.env["max_agents"][replicate]])
+        rows = np.flatnonzero(self.alive & ~self.is_new)
+        energy = np.minimum(a["energy"][rows], self._agent_env("max_energy", rows))
+        a["energy"][rows] = energy - self._agent_env("cost_of_living", rows)
+        self._kill(rows[a["energy"][rows] <= 0])
+
+    def _compact(self) -> None:
+        keep = self.alive
+        for name in self.agents:
+            self.agents[name] = self.agents[name][keep]
+        if self.tile_memory_budget > 0:
+            self._sort_by_tile()
+        self._rebuild_cells()
+
+    def _count(self) -> np.ndarray:
+        # (replicates, strategy bins) counts, binned as get_pop_index
+        a = self.agents
+        strategy_id = a["agent_strategy_id"].astype(np.int64)
+        pop_index = (strategy_id // 10) * self.strategy_count + strategy_id % 10
+        return np.bincount(
+            a["replicate"].astype(np.int64) * self.population_count_bins + pop_index,
+            minlength=self.replicates * self.population_count_bins,
+        ).reshape(self.replicates, self.population_count_bins)
+
+    def step(self) -> None:
+        # one random stream per replicate and step, so any step of a
+        # replicate can be replayed from its state at the start and its seed.
+        rng = ReplicateRandom(self.seeds, self.step_counter)
+        timings: Dict[str, float] = {}
+        self._reset_step_state()
+        for phase, run in (
+            ("play", self._play),
+            ("move", self._move),
+            ("reproduce", self._reproduce),
+        ):
+            start = time.perf_counter()
+            run(rng)
+            timings[phase] = time.perf_counter() - start
+        start = time.perf_counter()
+        self._punish()
+        self._compact()
+        self.population_strat_count = self._count() + self.stopped_counts
+        timings["punish"] = time.perf_counter() - start
+        switches = len(self.cell_index_switches)
+        self.telemetry = dict(
+            timings,
+            cell_index=self.cell_index.name,
+            cell_index_bytes=self.cell_index.nbytes,
+            cell_index_switched=switches > 1
+            and self.cell_index_switches[-1][0] == self.step_counter,
+            density=self._density(),
+            tile_side=self.tile_side,
+            tile_chunks=len(self._row_chunks(self.agent_count)),
+            **dict(zip(PERF_COUNTER_NAMES, self.perf_counters.sum(axis=0).tolist())),
+        )
+        self.step_counter += 1
+        self._stop(self._stop_reasons())
+
+    @property
+    def running(self) -> np.ndarray:
+        return self.stop_reason == STOP_REASON_NONE
+
+    def _stop_reasons(self) -> np.ndarray:
+        # why each running replicate stops after this step (precedence as in
+        # _stop_reason: extinct, fixation, steady state)
+        counts = self.population_strat_count
+        running = self.running
+        reason = np.full(self.replicates, STOP_REASON_NONE, dtype=np.uint8)
+        if self.steady_state_window > 0:
+            total = counts.sum(axis=1, keepdims=True)
+            shares = np.divide(
+                counts, total, out=np.zeros(counts.shape), where=total > 0
+            )
+            # every running replicate has run the same steps
+            slot = (self.step_counter - 1) % self.steady_state_window
+            self.share_window[running, slot] = shares[running]
+            if self.step_counter >= self.steady_state_window:
+                spread = self.share_window.max(axis=1) - self.share_window.min(axis=1)
+                reason[(spread < self.steady_state_epsilon).all(axis=1)] = (
+                    STOP_REASON_STEADY_STATE
+                )
+        strategies_alive = (counts > 0).sum(axis=1)
+        if self.stop_on_fixation:
+            # with mutation a lost strategy can come back
+            fixed = (strategies_alive == 1) & (self.env["mutation_rate"] <= 0.0)
+            reason[fixed] = STOP_REASON_FIXATION
+        reason[strategies_alive == 0] = STOP_REASON_EXTINCT
+        reason[~running] = STOP_REASON_NONE
+        return reason
+
+    def _stop(self, reason: np.ndarray) -> None:
+        # stopped replicates keep their final population and counts
+        stopping = np.flatnonzero(reason != STOP_REASON_NONE)
+        if stopping.size == 0:
+            return
+        self.stop_reason[stopping] = reason[stopping]
+        self.stop_step[stopping] = self.step_counter
+        self.stopped_counts[stopping] = self.population_strat_count[stopping]
+        a = self.agents
+        stopped = np.isin(a["replicate"], stopping)
+        for name in a:
+            self.stopped_agents[name] = np.concatenate(
+                [self.stopped_agents[name], a[name][stopped]]
+            )
+            a[name] = a[name][~stopped]
+        self._rebuild_cells()
+
+    def _log_step(self) -> None:
+        for k in range(self.replicates):
+            if not self.running[k] and self.stop_step[k] != self.step_counter:
+                continue
+            counts = self.population_strat_count[k]
+            self.step_logs[k].append(
+                {
+                    "step_index": self.step_counter,
+                    "environment": {
+                        "population_strat_count": counts.tolist(),
+                        "perf_counters": self.perf_counters[k].tolist(),
+                    },
+                    "agents": {"prisoner": {"default": {"count": int(counts.sum())}}},
+                }
+            )
+
+    def snapshot_grid(self, replicate: int = 0, variable: str = "agent_trait") -> np.ndarray:
+        # cell -> agent variable of one replicate, -1 for empty cells
+        stopped = not self.running[replicate]
+        a = self.stopped_agents if stopped else self.agents
+        mine = a["replicate"] == replicate
+        grid = np.full((self.env_max, self.env_max), -1, dtype=np.int64)
+        grid[a["x_a"][mine], a["y_a"][mine]] = a[variable][mine]
+        return grid
+
+    def simulate(
+        self,
+        steps: int,
+        log_every_n_steps: int = 1,
+        step_callback: Optional[Callable[["BatchSimulation"], None]] = None,
+    ) -> None:
+        for _ in range(steps):
+            self.step()
+            if log_every_n_steps > 0 and self.step_counter % log_every_n_steps == 0:
+                self._log_step()
+            if step_callback is not None:
+                step_callback(self)
+            if not self.running.any():
+                # every replicate is extinct or stopped early
+                break
+
+    def export_logs(self, paths: List[str]) -> None:
+        # one log per replicate, in the layout of the FLAMEGPU JSON logger so
+        # the analysis scripts can read both.
+        if len(paths) != self.replicates:
+            raise ValueError("need one log path per replicate")
+        for k, path in enumerate(paths):
+            environment = {
+                name: value.item() if hasattr(value, "item") else value
+                for name, value in (
+                    (name, self.env[name][k]) for name in self.env
+                )
+            }
+            counts = self.population_strat_count[k]
+            steps = self.step_counter if self.running[k] else int(self.stop_step[k])
+            log = {
+                "config": {
+                    "random_seed": self.seeds[k],
+                    "steps": self.step_counter,
+                    "environment": environment,
+                },
+                "steps": self.step_logs[k],
+                "exit": {
+                    "step_index": steps,
+                    "cell_index_switches": self.cell_index_switches,
+                    "environment": {
+                        "population_strat_count": counts.tolist(),
+                        "stop_reason": int(self.stop_reason[k]),
+                        "stop_step": int(self.stop_step[k]),
+                    },
+                    "agents": {"prisoner": {"default": {"count": int(counts.sum())}}},
+                },
+            }
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as log_file:
+                json.dump(log, log_file)
+
+
+if __name__ == "__main__":
+    batch = BatchSimulation(seeds=list(range(8)))
+    for _ in range(100):
+        start = time.perf_counter()
+        batch.step()
+        print(
+            f"step {batch.step_counter}: {time.perf_counter() - start:.4f}s, "
+            f"agents per replicate {batch.population_strat_count.sum(axis=1)}"
+        )
+        print(
+            "  "
+            + ", ".join(f"{name} {batch.telemetry[name]}" for name in PERF_COUNTER_NAMES)
+        )
+        if batch.telemetry["cell_index_switched"]:
+            print(f"switched to the {batch.telemetry['cell_index']} cell index")
@@ -0,0 +1,151 @@
+###
+# Sparse checkpoints and deterministic replay of decomposed CPU runs
+# domain_decomposition.py draws every random number from (seed, step, agent
+# id, stream), so the full state of a run after step N is just its agents,
+# N, the seed and the environment. A checkpoint directory holds
+#   config.json                 seed, environment and workers of the run
+#   step_NNNNNNNN/rank_RRR.npz  agents of each worker's strip after step N
+# A directory only ever holds one run: starting a different run (seed,
+# environment or worker count) in it raises, and loading a step reads exactly
+# the strips of the configured workers.
+# Replaying to any step loads the nearest earlier checkpoint and runs the
+# remaining steps (with any number of workers), at most every_n_steps steps:
+#   python src/checkpoints.py DIR --step 7342 [--out state.npz] [--workers N]
+###
+import argparse
+import glob
+import json
+import os
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CONFIG_FILE: str = "config.json"
+STEP_PATTERN: str = "step_%08d"
+RANK_PATTERN: str = "rank_%03d.npz"
+
+
+def write_config(directory: str, seed: int, environment: dict, workers: int) -> None:
+    # as read back, so it compares equal to an existing config.json
+    config = json.loads(
+        json.dumps({"random_seed": seed, "environment": environment, "workers": workers})
+    )
+    if os.path.exists(os.path.join(directory, CONFIG_FILE)):
+        if read_config(directory) != config:
+            raise FileExistsError(
+                f"{directory} holds checkpoints of another run "
+                "(seed, environment or workers differ)"
+            )
+    elif checkpoint_steps(directory):
+        raise FileExistsError(f"{directory} holds checkpoints of an unknown run")
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, CONFIG_FILE), "w") as config_file:
+        json.dump(config, config_file)
+
+
+def read_config(directory: str) -> dict:
+    with open(os.path.join(directory, CONFIG_FILE), "r") as config_file:
+        return json.load(config_file)
+
+
+def write_checkpoint(
+    directory: str, step: int, rank: int, agents: Dict[str, np.ndarray]
+) -> None:
+    # each worker writes its own strip, no synchronisation needed
+    step_directory = os.path.join(directory, STEP_PATTERN % step)
+    os.makedirs(step_directory, exist_ok=True)
+    np.savez(os.path.join(step_directory, RANK_PATTERN % rank), **agents)
+
+
+def checkpoint_steps(directory: str) -> List[int]:
+    return sorted(
+        int(os.path.basename(path)[len("step_") :])
+        for path in glob.glob(os.path.join(directory, "step_*"))
+    )
+
+
+def _strip_paths(directory: str, step: int) -> List[str]:
+    step_directory = os.path.join(directory, STEP_PATTERN % step)
+    if not os.path.exists(os.path.join(directory, CONFIG_FILE)):
+        return sorted(glob.glob(os.path.join(step_directory, "*.npz")))
+    workers = int(read_config(directory)["workers"])
+    paths = [os.path.join(step_directory, RANK_PATTERN % rank) for rank in range(workers)]
+    missing = sum(not os.path.exists(path) for path in paths)
+    if 0 < missing < workers:
+        raise FileNotFoundError(
+            f"checkpoint of step {step} in {directory} lacks {missing} of "
+            f"{workers} strips"
+        )
+    return paths if missing == 0 else []
+
+
+def load_checkpoint(directory: str, step: int) -> Dict[str, np.ndarray]:
+    # agents of all strips after step, ordered by id
+    parts: List[Dict[str, np.ndarray]] = []
+    for path in _strip_paths(directory, step):
+        with np.load(path) as strip:
+            parts.append({name: strip[name] for name in strip.files})
+    if not parts:
+        raise FileNotFoundError(f"no checkpoint of step {step} in {directory}")
+    agents = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+    order = np.argsort(agents["id"], kind="stable")
+    agents = {name: values[order] for name, values in agents.items()}
+    if np.any(agents["id"][1:] == agents["id"][:-1]):
+        raise ValueError(f"checkpoint of step {step} in {directory} repeats agents")
+    return agents
+
+
+def nearest_checkpoint(directory: str, step: int) -> int:
+    earlier = [s for s in checkpoint_steps(directory) if s <= step]
+    if not earlier:
+        raise ValueError(f"no checkpoint at or before step {step} in {directory}")
+    return earlier[-1]
+
+
+def replay(
+    directory: str, step: int, workers: Optional[int] = None
+) -> Tuple[int, Dict[str, np.ndarray]]:
+    # (checkpoint replayed from, agents after step)
+    from domain_decomposition import DecomposedSimulation
+
+    start = nearest_checkpoint(directory, step)
+    config = read_config(directory)
+    agents = load_checkpoint(directory, start)
+    if start == step:
+        return start, agents
+    simulation = DecomposedSimulation(
+        config["random_seed"],
+        config["environment"],
+        workers=workers,
+        initial_state=(start, agents),
+    )
+    with tempfile.TemporaryDirectory() as state_directory:
+        simulation.simulate(step - start, final_state_directory=state_directory)
+        if simulation.step_counter != step:
+            raise ValueError(
+                f"the run ended (no agents left) at step {simulation.step_counter}"
+            )
+        return start, load_checkpoint(state_directory, step)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay a run to any step")
+    parser.add_argument("directory", help="checkpoint directory of the run")
+    parser.add_argument("--step", type=int, required=True)
+    parser.add_argument("--out", default=None, help="write the agents as .npz")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    start, agents = replay(args.directory, args.step, args.workers)
+    print(f"replayed steps {start} to {args.step}: {agents['id'].size} agents")
+    strategy_ids, counts = np.unique(agents["agent_strategy_id"], return_counts=True)
+    for strategy_id, count in zip(strategy_ids.tolist(), counts.tolist()):
+        print(f"strategy id {strategy_id:02d}: {count}")
+    if args.out:
+        np.savez(args.out, **agents)
+        print(f"agent state written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+###
+# Connected component (cluster) analysis of strategies on the grid
+# works on a grid snapshot (cell -> agent_strategy_id) and labels clusters of
+# same-strategy agents using the wrapped moore neighbourhood from model.py
+# (pos_from_moore_seq), so diagonal neighbours are connected and the grid is
+# a torus.
+###
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# value used for cells without an agent
+EMPTY_CELL: int = -1
+
+
+def _compress(parent: np.ndarray, active: np.ndarray) -> None:
+    # pointer jumping until every active node points directly at its root
+    while active.size:
+        node_parent = parent[active]
+        grand_parent = parent[node_parent]
+        moving = node_parent != grand_parent
+        active = active[moving]
+        parent[active] = grand_parent[moving]
+
+
+def _same_strategy_edges(
+    grid: np.ndarray, occupied: np.ndarray, run_root: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    # edges between horizontal runs in one row and the next row (wrapped),
+    # covering the south-west, south and south-east moore neighbours. The
+    # west / east neighbours are already merged into the runs.
+    cols = grid.shape[1]
+    grid_wrap = np.pad(grid, ((0, 1), (1, 1)), mode="wrap")
+    root_wrap = np.pad(run_root, ((0, 1), (1, 1)), mode="wrap")
+    src_parts: List[np.ndarray] = []
+    dst_parts: List[np.ndarray] = []
+    for dy in (-1, 0, 1):
+        below = grid_wrap[1:, 1 + dy : cols + 1 + dy]
+        same = occupied & (grid == below)
+        src = run_root[same]
+        dst = root_wrap[1:, 1 + dy : cols + 1 + dy][same]
+        # neighbouring cells of one run mostly touch the same run below
+        keep = np.ones(src.size, dtype=bool)
+        keep[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        src_parts.append(src[keep])
+        dst_parts.append(dst[keep])
+    # runs that wrap around the east / west edge of the grid
+    same = occupied[:, 0] & (grid[:, 0] == grid[:, -1])
+    src_parts.append(run_root[:, -1][same])
+    dst_parts.append(run_root[:, 0][same])
+    return np.concatenate(src_parts), np.concatenate(dst_parts)
+
+
+def label_clusters(grid: np.ndarray, empty: int = EMPTY_CELL) -> np.ndarray:
+    # returns an array shaped like grid where every occupied cell holds the
+    # flat index of the first cell of its cluster, and empty cells hold -1.
+    # 1. merge horizontal runs of the same strategy with a running maximum
+    # 2. vectorised union-find over the runs: hook the larger root onto the
+    #    smaller one for every edge that still spans two trees, pointer-jump
+    #    the hooked roots and move the edges to the new roots. Roots only
+    #    ever point at smaller indices, so no cycles can form.
+    if grid.ndim != 2:
+        raise ValueError("grid snapshot must be two dimensional")
+    occupied = grid != empty
+    index = np.arange(grid.size, dtype=np.int32).reshape(grid.shape)
+    continues = np.zeros(grid.shape, dtype=bool)
+    continues[:, 1:] = occupied[:, 1:] & (grid[:, 1:] == grid[:, :-1])
+    run_root = np.maximum.accumulate(np.where(continues, 0, index), axis=1)
+    src, dst = _same_strategy_edges(grid, occupied, run_root)
+
+    parent = run_root.ravel().copy()
+    while True:
+        spanning = src != dst
+        if not spanning.any():
+            break
+        src = src[spanning]
+        dst = dst[spanning]
+        hooked = np.maximum(src, dst)
+        parent[hooked] = np.minimum(src, dst)
+        _compress(parent, hooked)
+        src = parent[src]
+        dst = parent[dst]
+
+    # runs hooked in earlier rounds may still point at an old root
+    _compress(parent, np.flatnonzero(occupied & ~continues).astype(np.int32))
+    return np.where(occupied, parent[run_root], -1).astype(np.int32)
+
+
+def cluster_sizes(
+    grid: np.ndarray, empty: int = EMPTY_CELL
+) -> Tuple[np.ndarray, np.ndarray]:
+    # (strategy per cluster, size per cluster) for every cluster in the grid
+    labels = label_clusters(grid, empty).ravel()
+    counts = np.bincount(labels[labels >= 0], minlength=labels.size)
+    roots = np.flatnonzero(counts)
+    return grid.ravel()[roots], counts[roots]
+
+
+def size_class_histogram(sizes: np.ndarray, classes: int) -> np.ndarray:
+    # log2 size classes: 1, 2-3, 4-7, ... the last class collects the rest
+    if sizes.size == 0:
+        return np.zeros(classes, dtype=np.int64)
+    size_class = np.minimum(np.log2(sizes).astype(np.int64), classes - 1)
+    return np.bincount(size_class, minlength=classes)
+
+
+def cluster_summary(
+    grid: np.ndarray, empty: int = EMPTY_CELL, size_classes: int = 16
+) -> Dict[int, dict]:
+    # per strategy: number of clusters, largest cluster, sizes (descending)
+    # and a log2 size class histogram.
+    strategies, sizes = cluster_sizes(grid, empty)
+    summary: Dict[int, dict] = {}
+    if sizes.size == 0:
+        return summary
+    order = np.argsort(strategies, kind="stable")
+    strategies = strategies[order]
+    sizes = sizes[order]
+    boundaries = np.flatnonzero(np.diff(strategies)) + 1
+    for strategy_sizes, strategy in zip(
+        np.split(sizes, boundaries), strategies[np.r_[0, boundaries]]
+    ):
+        if strategy_sizes.size == 0:
+            continue
+        strategy_sizes = np.sort(strategy_sizes)[::-1]
+        summary[int(strategy)] = {
+            "cluster_count": int(strategy_sizes.size),
+            "largest": int(strategy_sizes[0]),
+            "agent_count": int(strategy_sizes.sum()),
+            "sizes": strategy_sizes,
+            "size_classes": size_class_histogram(strategy_sizes, size_classes),
+        }
+    return summary
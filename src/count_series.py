@@ -0,0 +1,192 @@
+###
+# Compressed time series of strategy counts
+# rows of (step, population_strat_count[bins]) are written in blocks of up to
+# block_steps rows. Within a block every column is delta encoded against the
+# previous row (the first row against 0), zig-zag mapped to unsigned and
+# written as LEB128 varints, so slowly changing counts take one byte each.
+#   header  "PDCS" uint16 version, uint16 bins
+#   blocks  varint bytes, row major (step, bin 0, .. bin n-1)
+#   index   per block: uint64 offset, uint32 rows, uint32 first step, uint32 last step
+#   footer  uint64 index offset, uint32 block count, "PDCS"
+# The index lets readers decode only the blocks covering a step range.
+# Encoding and decoding are vectorised with numpy. Given an output pipeline
+# (output_pipeline.py) the writer double buffers its rows and blocks are
+# encoded and written in the background.
+###
+import os
+import struct
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from output_pipeline import DoubleBuffer, OutputPipeline
+
+MAGIC: bytes = b"PDCS"
+VERSION: int = 1
+HEADER = struct.Struct("<4sHH")
+BLOCK_INDEX = np.dtype(
+    [("offset", "<u8"), ("rows", "<u4"), ("first_step", "<u4"), ("last_step", "<u4")]
+)
+FOOTER = struct.Struct("<QI4s")
+# 64 bit values need at most 10 varint bytes
+MAX_VARINT_BYTES: int = 10
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    # signed int64 -> zig-zag -> LEB128
+    values = np.asarray(values, dtype=np.int64).ravel()
+    zigzag = ((values << 1) ^ (values >> 63)).view(np.uint64)
+    length = np.ones(len(zigzag), dtype=np.int64)
+    for k in range(1, MAX_VARINT_BYTES):
+        length += zigzag >= np.uint64(1 << (7 * k))
+    offsets = np.cumsum(length) - length
+    out = np.empty(int(length.sum()), dtype=np.uint8)
+    for k in range(MAX_VARINT_BYTES):
+        rows = np.flatnonzero(length > k)
+        if len(rows) == 0:
+            break
+        byte = (zigzag[rows] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (length[rows] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[rows] + k] = (byte | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def decode_varints(data: bytes) -> np.ndarray:
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if len(raw) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    position = np.arange(len(raw)) - np.repeat(starts, ends - starts + 1)
+    parts = (raw & 0x7F).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    zigzag = np.bitwise_or.reduceat(parts, starts)
+    return ((zigzag >> np.uint64(1)).astype(np.int64)) ^ -(zigzag & np.uint64(1)).astype(
+        np.int64
+    )
+
+
+def encode_block(rows: np.ndarray) -> bytes:
+    rows = np.asarray(rows, dtype=np.int64)
+    return encode_varints(np.diff(rows, axis=0, prepend=0))
+
+
+def decode_block(data: bytes, columns: int) -> np.ndarray:
+    return np.cumsum(decode_varints(data).reshape(-1, columns), axis=0)
+
+
+class CountSeriesWriter:
+    def __init__(
+        self,
+        path: str,
+        bins: int,
+        block_steps: int = 1024,
+        pipeline: Optional[OutputPipeline] = None,
+    ):
+        self.path = path
+        self.bins = bins
+        self.block_steps = max(1, block_steps)
+        self.pipeline = pipeline
+        self._buffers = DoubleBuffer(
+            lambda: np.zeros((self.block_steps, bins + 1), dtype=np.int64)
+        )
+        self.rows = self._buffers.front
+        self.size = 0
+        self.index: List[tuple] = []
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, bins))
+
+    def append(self, step: int, counts) -> None:
+        self.rows[self.size, 0] = step
+        self.rows[self.size, 1:] = counts
+        self.size += 1
+        if self.size == self.block_steps:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.size == 0:
+            return
+        rows, release = self._buffers.swap()
+        self.rows = self._buffers.front
+        self._submit(self._write_block, rows[: self.size], release)
+        self.size = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._submit(self._write_index)
+
+    def _submit(self, task, *args) -> None:
+        if self.pipeline is None:
+            task(*args)
+        else:
+            self.pipeline.submit(self.path, task, *args)
+
+    def _write_block(self, rows: np.ndarray, release) -> None:
+        try:
+            self.index.append(
+                (self._file.tell(), len(rows), int(rows[0, 0]), int(rows[-1, 0]))
+            )
+            self._file.write(encode_block(rows))
+        finally:
+            release()
+
+    def _write_index(self) -> None:
+        index_offset = self._file.tell()
+        self._file.write(np.array(self.index, dtype=BLOCK_INDEX).tobytes())
+        self._file.write(FOOTER.pack(index_offset, len(self.index), MAGIC))
+        self._file.close()
+
+
+class CountSeries:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as series:
+            magic, version, self.bins = HEADER.unpack(series.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a count series (version {VERSION})")
+            series.seek(-FOOTER.size, os.SEEK_END)
+            index_offset, blocks, magic = FOOTER.unpack(series.read(FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} was not closed, its block index is missing")
+            series.seek(index_offset)
+            self.index = np.frombuffer(
+                series.read(blocks * BLOCK_INDEX.itemsize), dtype=BLOCK_INDEX
+            )
+            self._end = index_offset
+
+    def __len__(self) -> int:
+        return int(self.index["rows"].sum())
+
+    def read(
+        self, first_step: Optional[int] = None, last_step: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # (steps, counts[steps, bins]) of first_step <= step <= last_step
+        lo = 0 if first_step is None else first_step
+        hi = np.iinfo(np.int64).max if last_step is None else last_step
+        wanted = np.flatnonzero(
+            (self.index["last_step"] >= lo) & (self.index["first_step"] <= hi)
+        )
+        ends = np.append(self.index["offset"][1:], self._end)
+        blocks = []
+        with open(self.path, "rb") as series:
+            for b in wanted:
+                series.seek(int(self.index["offset"][b]))
+                data = series.read(int(ends[b] - self.index["offset"][b]))
+                blocks.append(decode_block(data, self.bins + 1))
+        if not blocks:
+            return np.zeros(0, np.int64), np.zeros((0, self.bins), np.int64)
+        rows = np.concatenate(blocks)
+        rows = rows[(rows[:, 0] >= lo) & (rows[:, 0] <= hi)]
+        return rows[:, 0], rows[:, 1:]
+
+
+def log_series_path(log_path: str) -> Optional[str]:
+    # the series of a JSON run log: <log>.counts for single runs, or
+    # population_strat_count.counts in a sweep run's output subdirectory
+    for path in (
+        os.path.splitext(log_path)[0] + ".counts",
+        os.path.join(os.path.dirname(log_path), "population_strat_count.counts"),
+    ):
+        if os.path.exists(path):
+            return path
+    return None
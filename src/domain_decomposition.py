@@ -0,0 +1,848 @@
+###
+# Domain decomposed CPU execution of a single prisoner's dilemma run
+# the env_max x env_max torus is split into strips of whole x lines, one per
+# worker process. Each worker owns the agents in its strip (as private numpy
+# arrays) and publishes what its neighbours need into per-cell fields held in
+# multiprocessing.shared_memory: agent id, trait, die roll, game decisions,
+# movement / reproduction requests and claim winners. Between phases the
+# workers meet at a barrier, after which the one cell halo lines of the
+# adjacent strips can be read straight from the shared fields.
+#
+# cross-boundary interactions resolve deterministically:
+# - games: both players publish their decision, each owner applies its own
+#   agent's payoff.
+# - moves / births: the owner of the target cell resolves competing
+#   requests (highest roll, then highest id), the requester's owner applies
+#   the outcome. Agents that end up in another strip migrate at the end of
+#   the step through shared outboxes.
+# random numbers come from a counter based generator keyed by (seed, step,
+# agent id, stream), so a run gives the same result for any worker count, and
+# can be resumed from a checkpoint of its agents (checkpoints.py).
+###
+import json
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import agent_rules
+from batch_engine import (
+    DEFAULT_ENVIRONMENT,
+    ID_NOT_SET,
+    MOORE_X_OFFSETS,
+    MOORE_Y_OFFSETS,
+    SPACES_WITHIN_RADIUS,
+)
+from checkpoints import write_checkpoint, write_config
+from frame_renderer import FrameWriter
+from schema import cpu_agent_layout
+
+# random streams, games use 4 streams per round
+STREAM_DIE_ROLL: int = 1
+STREAM_MOVE_ROLL: int = 2
+STREAM_MOVE_START: int = 3
+STREAM_REPRODUCE_ROLL: int = 4
+STREAM_REPRODUCE_START: int = 5
+STREAM_CHILD: int = 8
+STREAM_GAME: int = 64
+
+NO_REQUEST: int = -1
+
+_MASK: int = 2**64 - 1
+
+
+def _mix_int(z: int) -> int:
+    # splitmix64 on a python int
+    z = (z + 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return z ^ (z >> 31)
+
+
+def _mix(z: np.ndarray) -> np.ndarray:
+    # splitmix64 on uint64 arrays (wraps around like the python version)
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def counter_uniform(
+    seed: int, step: int, stream: int, ids: np.ndarray
+) -> np.ndarray:
+    # uniform [0, 1) per id, the same for a given (seed, step, stream, id)
+    # no matter which process draws it or in which order.
+    key = _mix_int(_mix_int(_mix_int(seed & _MASK) ^ step) ^ stream)
+    z = _mix(np.asarray(ids, dtype=np.int64).astype(np.uint64) ^ np.uint64(key))
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def counter_normal(
+    seed: int, step: int, stream: int, ids: np.ndarray
+) -> np.ndarray:
+    # box-muller over two streams
+    u1 = counter_uniform(seed, step, stream, ids)
+    u2 = counter_uniform(seed, step, stream + 1, ids)
+    return np.sqrt(-2.0 * np.log1p(-u1)) * np.cos(2.0 * np.pi * u2)
+
+
+def _strip_bounds(rank: int, workers: int, env_max: int) -> Tuple[int, int]:
+    return rank * env_max // workers, (rank + 1) * env_max // workers
+
+
+def _agent_columns(trait_count: int) -> Dict[str, Tuple[tuple, type]]:
+    # per agent variables, (shape after the agent axis, dtype), see schema.py
+    return cpu_agent_layout(trait_count, SPACES_WITHIN_RADIUS)
+
+
+def _shared_layout(
+    env_max: int, workers: int, trait_count: int, bins: int, steps: int
+) -> Dict[str, Tuple[tuple, type]]:
+    # every shared array, name -> (shape, dtype)
+    grid = (env_max, env_max)
+    # agents leaving a strip land on the edge line of a neighbouring strip
+    migration_capacity = 2 * env_max
+    layout: Dict[str, Tuple[tuple, type]] = {
+        "cell_id": (grid, np.int64),
+        "cell_trait": (grid, np.uint8),
+        "cell_roll": (grid, np.float32),
+        "cell_coop_challenger": (grid, np.uint8),
+        "cell_coop_responder": (grid, np.uint8),
+        "cell_request": (grid, np.int8),
+        "cell_request_roll": (grid, np.float64),
+        "cell_winner": (grid, np.int8),
+        # double buffered per worker values for reductions
+        "reduce": ((2, workers, bins), np.int64),
+        "cull_ids": ((env_max * env_max,), np.int64),
+        "migrant_count": ((workers,), np.int64),
+        "population_strat_count": ((steps + 1, workers, bins), np.int64),
+        "steps_completed": ((1,), np.int64),
+    }
+    for name, (shape, dtype) in _agent_columns(trait_count).items():
+        layout[f"migrant_{name}"] = ((workers, migration_capacity) + shape, dtype)
+    return layout
+
+
+def _attach(
+    layout: Dict[str, Tuple[tuple, type]], names: Dict[str, str]
+) -> Tuple[Dict[str, np.ndarray], List[shared_memory.SharedMemory]]:
+    handles: List[shared_memory.SharedMemory] = []
+    arrays: Dict[str, np.ndarray] = {}
+    for name, (shape, dtype) in layout.items():
+        handle = shared_memory.SharedMemory(name=names[name])
+        handles.append(handle)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=handle.buf)
+    return arrays, handles
+
+
+def initial_population(
+    seed: int, environment: dict
+) -> Dict[str, np.ndarray]:
+    # the whole initial population, every worker builds the same one and
+    # keeps its strip
+    population = agent_rules.random_population(
+        np.random.default_rng([seed]), environment
+    )
+    n = population["x_a"].size
+    return {
+        **population,
+        "id": np.arange(ID_NOT_SET + 1, ID_NOT_SET + 1 + n, dtype=np.int64),
+        "game_memory": np.full((n, SPACES_WITHIN_RADIUS), ID_NOT_SET, np.int64),
+        "game_memory_choices": np.zeros((n, SPACES_WITHIN_RADIUS), np.uint8),
+    }
+
+
+class _StripWorker:
+    # one strip of the torus, runs in its own process
+    def __init__(
+        self,
+        rank: int,
+        workers: int,
+        seed: int,
+        environment: dict,
+        fields: Dict[str, np.ndarray],
+        barrier,
+        initial_state: Optional[Tuple[int, Dict[str, np.ndarray]]] = None,
+    ):
+        self.rank = rank
+        self.workers = workers
+        self.seed = seed
+        self.env = environment
+        self.fields = fields
+        self.barrier = barrier
+        self.env_max: int = int(environment["env_max"])
+        self.trait_count: int = int(environment["agent_trait_count"])
+        self.strategy_count: int = len(environment["agent_strategy_weights"])
+        self.bins: int = self.strategy_count**2
+        self.x0, self.x1 = _strip_bounds(rank, workers, self.env_max)
+        # x lines of the strip plus its one line halo on either side
+        self.halo_lines = np.unique(
+            np.arange(self.x0 - 1, self.x1 + 1) % self.env_max
+        )
+        self.reduce_slot = 0
+        # (step, agents) to resume from, agents of the whole grid
+        self.start_step, everyone = initial_state or (
+            0,
+            initial_population(seed, environment),
+        )
+        self.step_counter = self.start_step
+        self.request_cells: Tuple[np.ndarray, np.ndarray] = (
+            np.zeros(0, np.int32),
+            np.zeros(0, np.int32),
+        )
+        self.winner_cells: Tuple[np.ndarray, np.ndarray] = self.request_cells
+
+        mine = self._in_strip(everyone["x_a"])
+        self.agents: Dict[str, np.ndarray] = {
+            name: values[mine] for name, values in everyone.items()
+        }
+        a = self.agents
+        fields["cell_id"][a["x_a"], a["y_a"]] = a["id"]
+        fields["cell_trait"][a["x_a"], a["y_a"]] = a["agent_trait"]
+        fields["cell_request"][self.x0 : self.x1] = NO_REQUEST
+        fields["cell_winner"][self.x0 : self.x1] = NO_REQUEST
+
+    def _in_strip(self, x: np.ndarray) -> np.ndarray:
+        return (x >= self.x0) & (x < self.x1)
+
+    def _uniform(self, stream: int, ids: np.ndarray) -> np.ndarray:
+        return counter_uniform(self.seed, self.step_counter, stream, ids)
+
+    def _allreduce(self, values) -> np.ndarray:
+        # per worker values (one row per worker) after every worker has
+        # written its own. Two slots, so a fast worker can write the next
+        # reduction while slow ones still read this one.
+        reduce = self.fields["reduce"][self.reduce_slot]
+        values = np.atleast_1d(values)
+        reduce[self.rank, : values.size] = values
+        self.barrier.wait()
+        result = reduce[:, : values.size].copy()
+        self.reduce_slot ^= 1
+        return result
+
+    def _neighbour_positions(
+        self, rows: np.ndarray, sequence: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        a = self.agents
+        new_x = (a["x_a"][rows, None] + MOORE_X_OFFSETS[sequence]) % self.env_max
+        new_y = (a["y_a"][rows, None] + MOORE_Y_OFFSETS[sequence]) % self.env_max
+        return new_x, new_y
+
+    def _kill(self, rows: np.ndarray) -> None:
+        rows = rows[self.alive[rows]]
+        self.alive[rows] = False
+        self.fields["cell_id"][self.agents["x_a"][rows], self.agents["y_a"][rows]] = (
+            ID_NOT_SET
+        )
+
+    def _decide(
+        self,
+        me: np.ndarray,
+        opponent_id: np.ndarray,
+        slot: int,
+        strategy: np.ndarray,
+        stream: int,
+    ) -> np.ndarray:
+        ids = self.agents["id"][me]
+        return agent_rules.decide(
+            self.agents,
+            me,
+            opponent_id,
+            slot,
+            strategy,
+            self._uniform(stream, ids),
+            self._uniform(stream + 1, ids),
+            self.env["env_noise"],
+        )
+
+    def _play_result(
+        self,
+        me: np.ndarray,
+        opponent_id: np.ndarray,
+        slot: int,
+        strategy: np.ndarray,
+        my_coop: np.ndarray,
+        other_coop: np.ndarray,
+    ) -> None:
+        a = self.agents
+        env = self.env
+        payoff = agent_rules.payoff(
+            my_coop,
+            other_coop,
+            env["payoff_cc"],
+            env["payoff_cd"],
+            env["payoff_dc"],
+            env["payoff_dd"],
+        )
+        a["energy"][me] = np.minimum(a["energy"][me] + payoff, env["max_energy"])
+        self.games_played[me] += 1
+        agent_rules.remember(a, me, opponent_id, slot, strategy, other_coop)
+
+    def _play(self) -> None:
+        a = self.agents
+        f = self.fields
+        n = a["id"].size
+        die_roll = self._uniform(STREAM_DIE_ROLL, a["id"]).astype(np.float32)
+        f["cell_roll"][a["x_a"], a["y_a"]] = die_roll
+        self.barrier.wait()
+        rows = np.arange(n)
+        new_x, new_y = self._neighbour_positions(
+            rows, np.arange(SPACES_WITHIN_RADIUS)[None, :]
+        )
+        neighbour_id = f["cell_id"][new_x, new_y]
+        neighbour_roll = f["cell_roll"][new_x, new_y]
+        neighbour_trait = f["cell_trait"][new_x, new_y]
+        has_neighbour = neighbour_id != ID_NOT_SET
+        challenge = has_neighbour & (
+            (die_roll[:, None] > neighbour_roll)
+            | ((die_roll[:, None] == neighbour_roll) & (a["id"][:, None] > neighbour_id))
+        )
+        respond = has_neighbour & ~challenge
+        for sequence in range(SPACES_WITHIN_RADIUS):
+            # in this round agents challenge towards sequence and respond to
+            # challenges coming from the opposite direction
+            opposite = SPACES_WITHIN_RADIUS - 1 - sequence
+            challengers = np.flatnonzero(
+                self.alive
+                & challenge[:, sequence]
+                & (f["cell_id"][new_x[:, sequence], new_y[:, sequence]] != ID_NOT_SET)
+            )
+            responders = np.flatnonzero(
+                self.alive
+                & respond[:, opposite]
+                & (f["cell_id"][new_x[:, opposite], new_y[:, opposite]] != ID_NOT_SET)
+            )
+            challenger_strategy = a["agent_strategies"][
+                challengers, neighbour_trait[challengers, sequence]
+            ]
+            responder_strategy = a["agent_strategies"][
+                responders, neighbour_trait[responders, opposite]
+            ]
+            stream = STREAM_GAME + 4 * sequence
+            challenger_coop = self._decide(
+                challengers,
+                neighbour_id[challengers, sequence],
+                sequence,
+                challenger_strategy,
+                stream,
+            )
+            responder_coop = self._decide(
+                responders,
+                neighbour_id[responders, opposite],
+                opposite,
+                responder_strategy,
+                stream + 2,
+            )
+            f["cell_coop_challenger"][
+                a["x_a"][challengers], a["y_a"][challengers]
+            ] = challenger_coop
+            f["cell_coop_responder"][
+                a["x_a"][responders], a["y_a"][responders]
+            ] = responder_coop
+            self.barrier.wait()
+            opponent_coop = f["cell_coop_responder"][
+                new_x[challengers, sequence], new_y[challengers, sequence]
+            ].astype(bool)
+            challenger_opponent = f["cell_coop_challenger"][
+                new_x[responders, opposite], new_y[responders, opposite]
+            ].astype(bool)
+            self._play_result(
+                challengers,
+                neighbour_id[challengers, sequence],
+                sequence,
+                challenger_strategy,
+                challenger_coop,
+                opponent_coop,
+            )
+            self._play_result(
+                responders,
+                neighbour_id[responders, opposite],
+                opposite,
+                responder_strategy,
+                responder_coop,
+                challenger_opponent,
+            )
+            players = np.concatenate([challengers, responders])
+            self._kill(players[a["energy"][players] <= 0])
+            self.barrier.wait()
+
+    def _request(
+        self, rows: np.ndarray, roll: np.ndarray, start: np.ndarray
+    ) -> Tuple[np.ndarray, ...]:
+        # publish a request for the first free neighbouring cell of each row,
+        # returns the requesting rows with their target and direction
+        f = self.fields
+        f["cell_request"][self.request_cells] = NO_REQUEST
+        sequence = (start[:, None] + np.arange(SPACES_WITHIN_RADIUS)[None, :]) % (
+            SPACES_WITHIN_RADIUS
+        )
+        new_x, new_y = self._neighbour_positions(rows, sequence)
+        free = f["cell_id"][new_x, new_y] == ID_NOT_SET
+        found = free.any(axis=1)
+        first = free.argmax(axis=1)
+        pick = np.arange(rows.size)
+        direction = sequence[pick, first][found]
+        target_x = new_x[pick, first][found]
+        target_y = new_y[pick, first][found]
+        rows, roll = rows[found], roll[found]
+        x, y = self.agents["x_a"][rows], self.agents["y_a"][rows]
+        f["cell_request"][x, y] = direction
+        f["cell_request_roll"][x, y] = roll
+        self.request_cells = (x, y)
+        return rows, target_x, target_y, direction
+
+    def _resolve(self) -> None:
+        # decide every contested cell in this strip: highest roll, then id
+        f = self.fields
+        f["cell_winner"][self.winner_cells] = NO_REQUEST
+        requests = f["cell_request"][self.halo_lines]
+        line, request_y = np.nonzero(requests != NO_REQUEST)
+        request_x = self.halo_lines[line]
+        direction = requests[line, request_y].astype(np.int64)
+        target_x = (request_x + MOORE_X_OFFSETS[direction]) % self.env_max
+        target_y = (request_y + MOORE_Y_OFFSETS[direction]) % self.env_max
+        mine = self._in_strip(target_x)
+        request_x, request_y = request_x[mine], request_y[mine]
+        target_x, target_y, direction = target_x[mine], target_y[mine], direction[mine]
+        key = target_x.astype(np.int64) * self.env_max + target_y
+        order = np.lexsort(
+            (
+                f["cell_id"][request_x, request_y],
+                f["cell_request_roll"][request_x, request_y],
+                key,
+            )
+        )
+        sorted_key = key[order]
+        last = np.ones(order.size, dtype=bool)
+        last[:-1] = sorted_key[1:] != sorted_key[:-1]
+        winners = order[last]
+        self.winner_cells = (target_x[winners], target_y[winners])
+        # direction from the target back to the winning requester
+        f["cell_winner"][self.winner_cells] = (
+            SPACES_WITHIN_RADIUS - 1 - direction[winners]
+        )
+
+    def _claim_round(
+        self, rows: np.ndarray, roll: np.ndarray, start: np.ndarray
+    ) -> Optional[Tuple[np.ndarray, ...]]:
+        # one request / resolve round, None once no worker has any requests.
+        # returns (requesting rows, won, target x, target y)
+        rows, target_x, target_y, direction = self._request(rows, roll, start)
+        if self._allreduce(rows.size).sum() == 0:
+            return None
+        self._resolve()
+        self.barrier.wait()
+        won = self.fields["cell_winner"][target_x, target_y] == (
+            SPACES_WITHIN_RADIUS - 1 - direction
+        )
+        return rows, won, target_x, target_y
+
+    def _end_claims(self) -> None:
+        f = self.fields
+        f["cell_request"][self.request_cells] = NO_REQUEST
+        f["cell_winner"][self.winner_cells] = NO_REQUEST
+        self.barrier.wait()
+
+    def _place(self, rows: np.ndarray, x: np.ndarray, y: np.ndarray) -> None:
+        a = self.agents
+        self.fields["cell_id"][x, y] = a["id"][rows]
+        self.fields["cell_trait"][x, y] = a["agent_trait"][rows]
+
+    def _move(self) -> None:
+        a = self.agents
+        f = self.fields
+        rows = np.flatnonzero(self.alive & (self.games_played == 0))
+        a["energy"][rows] -= self.env["travel_cost"]
+        self._kill(rows[a["energy"][rows] <= 0])
+        rows = rows[self.alive[rows]]
+        roll = self._uniform(STREAM_MOVE_ROLL, a["id"][rows])
+        start = (
+            self._uniform(STREAM_MOVE_START, a["id"][rows]) * SPACES_WITHIN_RADIUS
+        ).astype(np.int64)
+        self.barrier.wait()
+        for _ in range(SPACES_WITHIN_RADIUS):
+            claimed = self._claim_round(rows, roll, start)
+            if claimed is None:
+                break
+            requested, won, target_x, target_y = claimed
+            moving = requested[won]
+            f["cell_id"][a["x_a"][moving], a["y_a"][moving]] = ID_NOT_SET
+            a["x_a"][moving] = target_x[won]
+            a["y_a"][moving] = target_y[won]
+            self._place(moving, a["x_a"][moving], a["y_a"][moving])
+            # losers try again, rows without a free neighbour have given up
+            retry = np.isin(rows, requested[~won])
+            rows, roll, start = rows[retry], roll[retry], start[retry]
+            self.barrier.wait()
+        self._end_claims()
+
+    def _mutate(self, strategies: np.ndarray, ids: np.ndarray, stream: int) -> np.ndarray:
+        if self.strategy_count < 2:
+            return strategies
+        # two streams per column, so a column draws the same whatever the mode
+        columns = range(strategies.shape[1])
+        roll = np.stack(
+            [self._uniform(stream + 2 * column, ids) for column in columns], axis=1
+        )
+        shift = 1 + np.stack(
+            [
+                self._uniform(stream + 2 * column + 1, ids) * (self.strategy_count - 1)
+                for column in columns
+            ],
+            axis=1,
+        ).astype(np.int64)
+        return agent_rules.mutate(
+            strategies, roll, shift, self.env["mutation_rate"], self.strategy_count
+        )
+
+    def _children(
+        self, parents: np.ndarray, x: np.ndarray, y: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        a = self.agents
+        env = self.env
+        cells = self.env_max * self.env_max
+        # unique and increasing: one birth per cell per step, after every
+        # id of earlier steps
+        ids = (self.step_counter + 1) * cells + x.astype(np.int64) * self.env_max + y + 1
+        energy = agent_rules.child_energy(
+            a["energy"][parents],
+            counter_normal(self.seed, self.step_counter, STREAM_CHILD, ids),
+            env["reproduction_inheritence"],
+            env["init_energy_mu"],
+            env["init_energy_sigma"],
+            env["init_energy_min"],
+            env["max_energy"],
+        )
+        trait = a["agent_trait"][parents]
+        n = parents.size
+        pure = np.full(n, env["strategy_pure"] == 1)
+        strategies = agent_rules.inherit_strategies(
+            a["agent_strategies"][parents],
+            trait,
+            pure,
+            ~pure & (env["strategy_per_trait"] == 1),
+            lambda strategies: self._mutate(strategies, ids, STREAM_CHILD + 2),
+        )
+        return {
+            "x_a": x.astype(np.int32),
+            "y_a": y.astype(np.int32),
+            "id": ids,
+            "energy": energy.astype(np.float32),
+            "agent_trait": trait,
+            "agent_strategies": strategies,
+            "agent_strategy_id": agent_rules.strategy_id(strategies, trait),
+            "game_memory": np.full((n, SPACES_WITHIN_RADIUS), ID_NOT_SET, np.int64),
+            "game_memory_choices": np.zeros((n, SPACES_WITHIN_RADIUS), np.uint8),
+        }
+
+    def _append(self, agents: Dict[str, np.ndarray], new: bool) -> np.ndarray:
+        a = self.agents
+        first = a["id"].size
+        n = agents["id"].size
+        for name in a:
+            a[name] = np.concatenate([a[name], agents[name]])
+        self.alive = np.concatenate([self.alive, np.ones(n, dtype=bool)])
+        self.is_new = np.concatenate([self.is_new, np.full(n, new)])
+        self.games_played = np.concatenate(
+            [self.games_played, np.zeros(n, dtype=np.uint8)]
+        )
+        return np.arange(first, first + n)
+
+    def _reproduce(self) -> None:
+        a = self.agents
+        env = self.env
+        spawned = np.zeros(a["id"].size, dtype=np.int64)
+        for iteration in range(SPACES_WITHIN_RADIUS):
+            n = spawned.size
+            alive = self._allreduce(int(self.alive.sum())).sum()
+            rows = np.flatnonzero(
+                self.alive[:n]
+                & ~self.is_new[:n]
+                & (a["energy"][:n] >= env["reproduce_min_energy"])
+                & (spawned < env["max_children_per_step"])
+            )
+            if alive > env["max_agents"]:
+                rows = rows[:0]
+            ids = a["id"][rows]
+            stream = 2 * iteration
+            roll = self._uniform(STREAM_REPRODUCE_ROLL + 8 * stream, ids)
+            start = (
+                self._uniform(STREAM_REPRODUCE_START + 8 * stream, ids)
+                * SPACES_WITHIN_RADIUS
+            ).astype(np.int64)
+            claimed = self._claim_round(rows, roll, start)
+            if claimed is None:
+                break
+            requested, won, target_x, target_y = claimed
+            parents = requested[won]
+            a["energy"][parents] -= env["reproduce_cost"]
+            spawned[parents] += 1
+            children = self._children(parents, target_x[won], target_y[won])
+            born = self._append(children, new=True)
+            self._place(born, children["x_a"], children["y_a"])
+            # nowhere to put a child, this will not change in this step
+            stuck = ~np.isin(rows, requested)
+            spawned[rows[stuck]] = np.iinfo(np.int64).max
+            self.barrier.wait()
+        self._end_claims()
+
+    def _punish(self) -> None:
+        a = self.agents
+        env = self.env
+        counts = self._allreduce(int(self.alive.sum()))[:, 0]
+        total = int(counts.sum())
+        if total > env["max_agents"]:
+            # keep the max_agents oldest agents (lowest ids) of the whole run
+            offset = int(counts[: self.rank].sum())
+            cull_ids = self.fields["cull_ids"]
+            cull_ids[offset : offset + counts[self.rank]] = a["id"][self.alive]
+            self.barrier.wait()
+            threshold = np.partition(cull_ids[:total], env["max_agents"] - 1)[
+                env["max_agents"] - 1
+            ]
+            self._kill(np.flatnonzero(self.alive & (a["id"] > threshold)))
+            self.barrier.wait()
+        rows = np.flatnonzero(self.alive & ~self.is_new)
+        energy = np.minimum(a["energy"][rows], env["max_energy"])
+        a["energy"][rows] = energy - env["cost_of_living"]
+        self._kill(rows[a["energy"][rows] <= 0])
+
+    def _migrate(self) -> None:
+        # hand agents that left the strip to their new owner
+        a = self.agents
+        f = self.fields
+        leaving = self.alive & ~self._in_strip(a["x_a"])
+        m = int(leaving.sum())
+        capacity = f["migrant_id"].shape[1]
+        if m > capacity:
+            raise RuntimeError(f"{m} agents leaving strip {self.rank}, capacity {capacity}")
+        for name in a:
+            f[f"migrant_{name}"][self.rank, :m] = a[name][leaving]
+        f["migrant_count"][self.rank] = m
+        self.barrier.wait()
+        keep = self.alive & ~leaving
+        for name in a:
+            a[name] = a[name][keep]
+        for sender in range(self.workers):
+            if sender == self.rank:
+                continue
+            count = int(f["migrant_count"][sender])
+            arriving = self._in_strip(f["migrant_x_a"][sender, :count])
+            for name in a:
+                a[name] = np.concatenate(
+                    [a[name], f[f"migrant_{name}"][sender, :count][arriving]]
+                )
+        self.barrier.wait()
+
+    def step(self) -> int:
+        n = self.agents["id"].size
+        self.alive = np.ones(n, dtype=bool)
+        self.is_new = np.zeros(n, dtype=bool)
+        self.games_played = np.zeros(n, dtype=np.uint8)
+        self._play()
+        self._move()
+        self._reproduce()
+        self._punish()
+        self._migrate()
+        a = self.agents
+        strategy_id = a["agent_strategy_id"].astype(np.int64)
+        counts = np.bincount(
+            (strategy_id // 10) * self.strategy_count + strategy_id % 10,
+            minlength=self.bins,
+        )
+        self.fields["population_strat_count"][
+            self.step_counter - self.start_step, self.rank
+        ] = counts
+        self.step_counter += 1
+        return int(self._allreduce(a["id"].size).sum())
+
+
+def _run_worker(
+    rank: int,
+    workers: int,
+    seed: int,
+    environment: dict,
+    steps: int,
+    layout: Dict[str, Tuple[tuple, type]],
+    names: Dict[str, str],
+    barrier,
+    frames: Optional[dict],
+    initial_state: Optional[Tuple[int, Dict[str, np.ndarray]]],
+    checkpoints: Optional[dict],
+    final_state_directory: Optional[str],
+) -> None:
+    fields, handles = _attach(layout, names)
+    # the first worker renders frames of the whole grid. Right after a step
+    # the cell fields are final, the other workers only write die rolls
+    # until it joins them at the first barrier of the next step.
+    writer = FrameWriter(**frames) if frames is not None and rank == 0 else None
+    try:
+        worker = _StripWorker(
+            rank, workers, seed, environment, fields, barrier, initial_state
+        )
+        every = checkpoints["every_n_steps"] if checkpoints is not None else 0
+        if every > 0 and worker.step_counter % every == 0:
+            write_checkpoint(
+                checkpoints["directory"], worker.step_counter, rank, worker.agents
+            )
+        barrier.wait()
+        for _ in range(steps):
+            alive = worker.step()
+            if every > 0 and worker.step_counter % every == 0:
+                write_checkpoint(
+                    checkpoints["directory"], worker.step_counter, rank, worker.agents
+                )
+            if writer is not None and writer.wants(worker.step_counter):
+                writer.submit(
+                    worker.step_counter,
+                    np.where(
+                        fields["cell_id"] != ID_NOT_SET,
+                        fields["cell_trait"].astype(np.int64),
+                        -1,
+                    ),
+                )
+            if alive == 0:
+                break
+        if final_state_directory is not None:
+            write_checkpoint(
+                final_state_directory, worker.step_counter, rank, worker.agents
+            )
+        if rank == 0:
+            fields["steps_completed"][0] = worker.step_counter
+    except Exception:
+        # release the other workers instead of leaving them at a barrier
+        barrier.abort()
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+        del fields
+        for handle in handles:
+            handle.close()
+
+
+class DecomposedSimulation:
+    def __init__(
+        self,
+        seed: int,
+        environment: Optional[dict] = None,
+        workers: Optional[int] = None,
+        frames: Optional[dict] = None,
+        checkpoints: Optional[dict] = None,
+        initial_state: Optional[Tuple[int, Dict[str, np.ndarray]]] = None,
+    ):
+        # frames: FrameWriter arguments to render the grid while running
+        self.frames: Optional[dict] = frames
+        # checkpoints: {"directory", "every_n_steps"} to write the agents to
+        # initial_state: (step, agents) of a checkpoint to resume from
+        self.checkpoints: Optional[dict] = checkpoints
+        self.initial_state = initial_state
+        self.seed: int = int(seed)
+        self.environment: dict = dict(DEFAULT_ENVIRONMENT)
+        self.environment.update(environment or {})
+        env_max = int(self.environment["env_max"])
+        # strips need to be at least two lines wide so an agent can only
+        # ever leave for the neighbouring strip
+        self.workers: int = max(1, min(workers or os.cpu_count() or 1, env_max // 2))
+        self.start_step: int = initial_state[0] if initial_state is not None else 0
+        self.step_counter: int = self.start_step
+        self.population_strat_count: np.ndarray = np.zeros(
+            (0, len(self.environment["agent_strategy_weights"]) ** 2), dtype=np.int64
+        )
+
+    def simulate(
+        self, steps: int, final_state_directory: Optional[str] = None
+    ) -> np.ndarray:
+        # runs the whole simulation, returns the strategy counts of every step.
+        # final_state_directory: write the agents after the last step there
+        env = self.environment
+        if self.checkpoints is not None:
+            write_config(self.checkpoints["directory"], self.seed, env, self.workers)
+        if final_state_directory is not None:
+            write_config(final_state_directory, self.seed, env, self.workers)
+        trait_count = int(env["agent_trait_count"])
+        bins = len(env["agent_strategy_weights"]) ** 2
+        layout = _shared_layout(int(env["env_max"]), self.workers, trait_count, bins, steps)
+        handles: Dict[str, shared_memory.SharedMemory] = {}
+        try:
+            for name, (shape, dtype) in layout.items():
+                size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+                handles[name] = shared_memory.SharedMemory(create=True, size=size)
+                np.ndarray(shape, dtype=dtype, buffer=handles[name].buf).fill(0)
+            names = {name: handle.name for name, handle in handles.items()}
+            context = multiprocessing.get_context()
+            barrier = context.Barrier(self.workers)
+            processes = [
+                context.Process(
+                    target=_run_worker,
+                    args=(
+                        rank,
+                        self.workers,
+                        self.seed,
+                        env,
+                        steps,
+                        layout,
+                        names,
+                        barrier,
+                        self.frames,
+                        self.initial_state,
+                        self.checkpoints,
+                        final_state_directory,
+                    ),
+                )
+                for rank in range(self.workers)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            if any(process.exitcode != 0 for process in processes):
+                raise RuntimeError("a domain decomposition worker failed")
+            fields = {
+                name: np.ndarray(shape, dtype=dtype, buffer=handles[name].buf)
+                for name, (shape, dtype) in layout.items()
+            }
+            self.step_counter = int(fields["steps_completed"][0])
+            self.population_strat_count = (
+                fields["population_strat_count"][: self.step_counter - self.start_step]
+                .sum(axis=1)
+                .copy()
+            )
+            del fields
+        finally:
+            for handle in handles.values():
+                handle.close()
+                handle.unlink()
+        return self.population_strat_count
+
+    def export_log(self, path: str, log_every_n_steps: int = 1) -> None:
+        # same layout as the FLAMEGPU JSON logger (and batch_engine)
+        steps = [
+            {
+                "step_index": step,
+                "environment": {"population_strat_count": counts.tolist()},
+                "agents": {"prisoner": {"default": {"count": int(counts.sum())}}},
+            }
+            for step, counts in enumerate(self.population_strat_count, self.start_step)
+            if log_every_n_steps > 0 and (step + 1) % log_every_n_steps == 0
+        ]
+        log = {
+            "config": {
+                "random_seed": self.seed,
+                "steps": self.step_counter,
+                "environment": self.environment,
+                "workers": self.workers,
+            },
+            "steps": steps,
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as log_file:
+            json.dump(log, log_file)
+
+
+if __name__ == "__main__":
+    simulation = DecomposedSimulation(seed=0)
+    counts = simulation.simulate(100)
+    print(f"{simulation.workers} workers, agents per step {counts.sum(axis=1)}")
@@ -0,0 +1,145 @@
+###
+# Fork ensembles: variants of one run branching at a common step
+# a base decomposed run (domain_decomposition.py) is simulated once up to the
+# branch step. Each variant (its own seed and / or environment overrides, e.g.
+# a cost_of_living jump) is then a process created with os.fork that sees the
+# agents at the branch through copy-on-write pages, so the shared prefix is
+# neither recomputed nor copied, and continues from there with its own strip
+# workers. `parallel` variants run at a time. The log of a variant holds the
+# counts of the shared prefix followed by its own.
+# Random numbers are keyed by (seed, step, agent id), so variants that keep
+# the base seed see the same draws as the base would have: common random
+# numbers for "what if" comparisons.
+# Where os.fork is not available the variants run one after another.
+###
+import os
+import sys
+import tempfile
+import traceback
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from batch_engine import SHARED_PROPERTIES
+from checkpoints import load_checkpoint
+from domain_decomposition import DecomposedSimulation
+
+
+def simulate_branch(
+    seed: int,
+    environment: dict,
+    branch_step: int,
+    workers: Optional[int] = None,
+    initial_state: Optional[Tuple[int, Dict[str, np.ndarray]]] = None,
+) -> Tuple[DecomposedSimulation, Dict[str, np.ndarray]]:
+    # (base simulation, agents after branch_step)
+    base = DecomposedSimulation(
+        seed, environment, workers=workers, initial_state=initial_state
+    )
+    with tempfile.TemporaryDirectory() as state_directory:
+        base.simulate(branch_step - base.start_step, state_directory)
+        if base.step_counter != branch_step:
+            raise ValueError(
+                f"the base run ended (no agents left) at step {base.step_counter}"
+            )
+        return base, load_checkpoint(state_directory, branch_step)
+
+
+def _run_variant(
+    base: DecomposedSimulation,
+    branch: Dict[str, np.ndarray],
+    seed: int,
+    environment: dict,
+    steps: int,
+    workers: Optional[int],
+    log_path: str,
+    log_every_n_steps: int,
+) -> None:
+    variant = DecomposedSimulation(
+        seed,
+        dict(base.environment, **environment),
+        workers=workers,
+        initial_state=(base.step_counter, branch),
+    )
+    variant.simulate(steps - base.step_counter)
+    # log the whole run, shared prefix included
+    variant.population_strat_count = np.concatenate(
+        [base.population_strat_count, variant.population_strat_count]
+    )
+    variant.start_step = base.start_step
+    variant.export_log(log_path, log_every_n_steps)
+
+
+def run_fork_ensemble(
+    base: DecomposedSimulation,
+    branch: Dict[str, np.ndarray],
+    seeds: Sequence[int],
+    environments: Sequence[dict],
+    steps: int,
+    log_paths: Sequence[str],
+    workers: Optional[int] = None,
+    parallel: Optional[int] = None,
+    log_every_n_steps: int = 1,
+) -> List[int]:
+    # runs every variant from the branch to steps, returns their exit codes
+    if not len(seeds) == len(environments) == len(log_paths):
+        raise ValueError("need a seed, environment and log path per variant")
+    for name in SHARED_PROPERTIES:
+        if any(name in e and e[name] != base.environment[name] for e in environments):
+            raise ValueError(f"{name} must be the same for the base and all variants")
+    variants = list(zip(seeds, environments, log_paths))
+    if not hasattr(os, "fork"):
+        for seed, environment, log_path in variants:
+            _run_variant(
+                base,
+                branch,
+                seed,
+                environment,
+                steps,
+                workers,
+                log_path,
+                log_every_n_steps,
+            )
+        return [0] * len(variants)
+
+    variant_workers = workers or os.cpu_count() or 1
+    parallel = max(1, parallel or (os.cpu_count() or 1) // variant_workers)
+    exit_codes: List[int] = [0] * len(variants)
+    # pid -> variant
+    running: Dict[int, int] = {}
+
+    def reap() -> None:
+        pid, status = os.wait()
+        exit_codes[running.pop(pid)] = os.waitstatus_to_exitcode(status)
+
+    for k, (seed, environment, log_path) in enumerate(variants):
+        while len(running) >= parallel:
+            reap()
+        # buffered output would be written again by the child
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_variant(
+                    base,
+                    branch,
+                    seed,
+                    environment,
+                    steps,
+                    workers,
+                    log_path,
+                    log_every_n_steps,
+                )
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        running[pid] = k
+    while running:
+        reap()
+    return exit_codes
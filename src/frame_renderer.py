@@ -0,0 +1,189 @@
+###
+# Headless frame rendering and video export
+# turns a grid snapshot (cell -> agent_color, negative = empty) into an RGB
+# frame with a single palette lookup, using the SET1 palette of the OpenGL
+# visualisation. FrameWriter writes frames as PNG files, or pipes them to
+# ffmpeg for an encoded video, on a background thread.
+###
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# pyflamegpu.SET1 as 8 bit RGB, uDiscreteColor falls back to white
+SET1_RGB: List[Tuple[int, int, int]] = [
+    (228, 26, 28),
+    (55, 126, 184),
+    (77, 175, 74),
+    (152, 78, 163),
+    (255, 127, 0),
+    (255, 255, 51),
+    (166, 86, 40),
+    (247, 129, 191),
+    (153, 153, 153),
+]
+FALLBACK_RGB: Tuple[int, int, int] = (255, 255, 255)
+
+
+def color_lookup(
+    palette: Sequence[Tuple[int, int, int]],
+    background: Tuple[int, int, int],
+    fallback: Tuple[int, int, int] = FALLBACK_RGB,
+) -> np.ndarray:
+    # row 0 is the background, then the palette, then the fallback colour
+    return np.array([background] + list(palette) + [fallback], dtype=np.uint8)
+
+
+def grid_to_rgb(grid: np.ndarray, lookup: np.ndarray) -> np.ndarray:
+    # (h, w) palette indices -> (h, w, 3) uint8 in one indexing operation
+    return lookup[np.clip(grid.astype(np.int64) + 1, 0, len(lookup) - 1)]
+
+
+def downsample(grid: np.ndarray, size: int) -> np.ndarray:
+    # every n-th cell, so the image is at most size x size pixels
+    stride = max(1, -(-max(grid.shape) // size))
+    return grid[::stride, ::stride]
+
+
+def fit(grid: np.ndarray, size: int) -> np.ndarray:
+    # downsample large grids, repeat cells of small ones, to about size
+    if max(grid.shape) >= size:
+        return downsample(grid, size)
+    scale = size // max(grid.shape)
+    return np.repeat(np.repeat(grid, scale, axis=0), scale, axis=1)
+
+
+def encode_png(rgb: np.ndarray) -> bytes:
+    # 8 bit RGB PNG from a (height, width, 3) uint8 array
+    height, width, _ = rgb.shape
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+class FrameWriter:
+    # frames are rendered and written on a background thread. The queue is
+    # bounded and submit() blocks when it is full: frames of a video must not
+    # be dropped, and a full queue means the disk / encoder can not keep up.
+    # A failed write stops rendering, the thread keeps draining the queue and
+    # the error is raised again by the next submit() or close().
+    def __init__(
+        self,
+        directory: str,
+        every_n_steps: int = 1,
+        video: bool = False,
+        size: int = 512,
+        fps: int = 30,
+        palette: Sequence[Tuple[int, int, int]] = SET1_RGB,
+        background: Tuple[int, int, int] = (0, 0, 0),
+        queue_size: int = 8,
+    ):
+        self.directory = directory
+        self.every_n_steps = max(1, every_n_steps)
+        self.size = size
+        self.fps = fps
+        self.lookup = color_lookup(palette, background)
+        self.video = video and shutil.which("ffmpeg") is not None
+        if video and not self.video:
+            print("ffmpeg not found, writing PNG frames instead of a video")
+        self.frames_written: int = 0
+        self._encoder: Optional[subprocess.Popen] = None
+        self._error: Optional[BaseException] = None
+        self._queue: "queue.Queue[Optional[Tuple[int, np.ndarray]]]" = queue.Queue(
+            maxsize=queue_size
+        )
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def wants(self, step: int) -> bool:
+        return step % self.every_n_steps == 0
+
+    def submit(self, step: int, grid: np.ndarray) -> None:
+        self._raise_error()
+        self._queue.put((step, grid))
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        if self._encoder is not None:
+            try:
+                self._encoder.stdin.close()  # type: ignore
+            except OSError as error:
+                self._error = self._error or error
+            self._encoder.wait()
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        error, self._error = self._error, None
+        if error is not None:
+            raise RuntimeError("the frame writer failed") from error
+
+    def _start_encoder(self, height: int, width: int) -> subprocess.Popen:
+        return subprocess.Popen(
+            [
+                "ffmpeg",
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                "rgb24",
+                "-s",
+                f"{width}x{height}",
+                "-r",
+                str(self.fps),
+                "-i",
+                "-",
+                "-c:v",
+                "libx264",
+                "-pix_fmt",
+                "yuv420p",
+                os.path.join(self.directory, "frames.mp4"),
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def _write(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._write_frame(*item)
+            except BaseException as error:
+                self._error = error
+
+    def _write_frame(self, step: int, grid: np.ndarray) -> None:
+        rgb = grid_to_rgb(fit(grid, self.size), self.lookup)
+        if self.video:
+            # yuv420p needs even dimensions
+            rgb = rgb[: rgb.shape[0] // 2 * 2, : rgb.shape[1] // 2 * 2]
+            if self._encoder is None:
+                self._encoder = self._start_encoder(rgb.shape[0], rgb.shape[1])
+            self._encoder.stdin.write(np.ascontiguousarray(rgb).tobytes())  # type: ignore
+        else:
+            path = os.path.join(self.directory, f"frame_{step:06d}.png")
+            with open(path, "wb") as frame:
+                frame.write(encode_png(rgb))
+        self.frames_written += 1
@@ -0,0 +1,144 @@
+###
+# Sampled game event stream
+# one record per sampled game: step, both agent ids, their strategies and
+# actions, whether env_noise flipped each action, and both payoffs. Events
+# are collected into columnar blocks of block_size rows, each block is
+# compressed (np.savez_compressed) and appended to a single stream file by a
+# background thread:
+#   [uint64 little endian byte length][compressed block] ...
+# read_game_events() yields the blocks back one at a time.
+###
+import io
+import queue
+import struct
+import threading
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+GAME_EVENT_COLUMNS: Dict[str, type] = {
+    "step": np.uint32,
+    "challenger_id": np.uint32,
+    "responder_id": np.uint32,
+    "challenger_strategy": np.uint8,
+    "responder_strategy": np.uint8,
+    # 1 = cooperate, 0 = defect, after noise
+    "challenger_action": np.uint8,
+    "responder_action": np.uint8,
+    "challenger_flipped": np.bool_,
+    "responder_flipped": np.bool_,
+    "challenger_payoff": np.float32,
+    "responder_payoff": np.float32,
+}
+BLOCK_HEADER = struct.Struct("<Q")
+
+
+def unpack_game_flags(flags: np.ndarray) -> Dict[str, np.ndarray]:
+    # device layout: bits 0-3 challenger strategy, 4-7 responder strategy,
+    # 8 / 9 challenger / responder cooperated, 10 / 11 flipped by noise
+    flags = flags.astype(np.uint32)
+    return {
+        "challenger_strategy": flags & 0xF,
+        "responder_strategy": (flags >> 4) & 0xF,
+        "challenger_action": (flags >> 8) & 1,
+        "responder_action": (flags >> 9) & 1,
+        "challenger_flipped": (flags >> 10) & 1,
+        "responder_flipped": (flags >> 11) & 1,
+    }
+
+
+class GameEventWriter:
+    # blocks are compressed and written on a background thread. The queue is
+    # bounded, flush() only blocks when the writer is a full queue behind.
+    # After a failed write the thread drops further blocks and the error is
+    # raised again by the next flush() or close().
+    def __init__(
+        self,
+        path: str,
+        block_size: int = 1 << 16,
+        queue_size: int = 4,
+    ):
+        self.path = path
+        self.block_size = max(1, block_size)
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.zeros(self.block_size, dtype=dtype)
+            for name, dtype in GAME_EVENT_COLUMNS.items()
+        }
+        self.size: int = 0
+        self.events_written: int = 0
+        self.bytes_written: int = 0
+        self._error: Optional[BaseException] = None
+        self._queue: "queue.Queue[Optional[Dict[str, np.ndarray]]]" = queue.Queue(
+            maxsize=queue_size
+        )
+        self._file = open(path, "wb")
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def append(self, events: Dict[str, np.ndarray]) -> None:
+        # events: GAME_EVENT_COLUMNS -> equal length arrays (step may be a scalar)
+        n = len(events["challenger_id"])
+        start = 0
+        while start < n:
+            take = min(n - start, self.block_size - self.size)
+            rows = slice(self.size, self.size + take)
+            for name, column in self.columns.items():
+                value = events[name]
+                column[rows] = value if np.ndim(value) == 0 else value[start : start + take]
+            self.size += take
+            start += take
+            if self.size == self.block_size:
+                self.flush()
+
+    def flush(self) -> None:
+        self._raise_error()
+        if self.size == 0:
+            return
+        self._queue.put({k: v[: self.size].copy() for k, v in self.columns.items()})
+        self.size = 0
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+            self._file.close()
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        error, self._error = self._error, None
+        if error is not None:
+            raise RuntimeError("the game event writer failed") from error
+
+    def _write(self) -> None:
+        while True:
+            block = self._queue.get()
+            if block is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._write_block(block)
+            except BaseException as error:
+                self._error = error
+
+    def _write_block(self, block: Dict[str, np.ndarray]) -> None:
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **block)
+        payload = buffer.getvalue()
+        self._file.write(BLOCK_HEADER.pack(len(payload)))
+        self._file.write(payload)
+        self.events_written += len(block["challenger_id"])
+        self.bytes_written += BLOCK_HEADER.size + len(payload)
+
+
+def read_game_events(path: str) -> Iterator[Dict[str, np.ndarray]]:
+    with open(path, "rb") as stream:
+        while True:
+            header = stream.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                return
+            (length,) = BLOCK_HEADER.unpack(header)
+            with np.load(io.BytesIO(stream.read(length))) as block:
+                yield {name: block[name] for name in block.files}
@@ -0,0 +1,220 @@
+###
+# Lineage recording and queries
+# every birth is a (child id, parent id, step, strategy id) record. The
+# recorder keeps a fixed capacity columnar ring buffer and flushes it to disk
+# as one numbered .npz chunk whenever it fills, so memory stays bounded for
+# any run length. Given an output pipeline the buffer is doubled and chunks
+# are written in the background. Queries stream the chunks in order and only
+# load the columns they need:
+#   python src/lineage.py DIR --clades [--top N]
+#   python src/lineage.py DIR --ancestry ID
+#   python src/lineage.py DIR --descendants ID
+# initial agents have no birth record, they are the roots (founders).
+###
+import argparse
+import glob
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from output_pipeline import DoubleBuffer, OutputPipeline
+
+LINEAGE_COLUMNS: Dict[str, type] = {
+    "child_id": np.uint32,
+    "parent_id": np.uint32,
+    "step": np.uint32,
+    "strategy_id": np.uint8,
+}
+CHUNK_PATTERN: str = "lineage_%06d.npz"
+
+
+class LineageRecorder:
+    def __init__(
+        self,
+        directory: str,
+        capacity: int = 1 << 20,
+        pipeline: Optional[OutputPipeline] = None,
+    ):
+        self.directory = directory
+        self.capacity = max(1, capacity)
+        self.pipeline = pipeline
+        self._buffers = DoubleBuffer(
+            lambda: {
+                name: np.zeros(self.capacity, dtype=dtype)
+                for name, dtype in LINEAGE_COLUMNS.items()
+            }
+        )
+        self.columns: Dict[str, np.ndarray] = self._buffers.front
+        self.size: int = 0
+        self.chunks_written: int = 0
+        self.births_recorded: int = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def record(
+        self,
+        step: int,
+        child_id: np.ndarray,
+        parent_id: np.ndarray,
+        strategy_id: np.ndarray,
+    ) -> None:
+        n = len(child_id)
+        start = 0
+        while start < n:
+            take = min(n - start, self.capacity - self.size)
+            rows = slice(self.size, self.size + take)
+            self.columns["child_id"][rows] = child_id[start : start + take]
+            self.columns["parent_id"][rows] = parent_id[start : start + take]
+            self.columns["step"][rows] = step
+            self.columns["strategy_id"][rows] = strategy_id[start : start + take]
+            self.size += take
+            start += take
+            if self.size == self.capacity:
+                self.flush()
+        self.births_recorded += n
+
+    def flush(self) -> None:
+        if self.size == 0:
+            return
+        path = os.path.join(self.directory, CHUNK_PATTERN % self.chunks_written)
+        columns, release = self._buffers.swap()
+        self.columns = self._buffers.front
+        chunk = {k: v[: self.size] for k, v in columns.items()}
+        if self.pipeline is None:
+            _write_chunk(path, chunk, release)
+        else:
+            self.pipeline.submit(self.directory, _write_chunk, path, chunk, release)
+        self.chunks_written += 1
+        self.size = 0
+
+    def close(self) -> None:
+        self.flush()
+
+
+def _write_chunk(path: str, chunk: Dict[str, np.ndarray], release) -> None:
+    try:
+        np.savez(path, **chunk)
+    finally:
+        release()
+
+
+def chunk_paths(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, "lineage_*.npz")))
+
+
+def iter_chunks(
+    directory: str, columns: Sequence[str] = tuple(LINEAGE_COLUMNS)
+) -> Iterator[Dict[str, np.ndarray]]:
+    # one chunk at a time, npz members are only read when accessed
+    for path in chunk_paths(directory):
+        with np.load(path) as chunk:
+            yield {name: chunk[name] for name in columns}
+
+
+def load_parents(directory: str) -> Tuple[np.ndarray, np.ndarray]:
+    # (child ids sorted, parent of each), 8 bytes per birth
+    children: List[np.ndarray] = []
+    parents: List[np.ndarray] = []
+    for chunk in iter_chunks(directory, ("child_id", "parent_id")):
+        children.append(chunk["child_id"])
+        parents.append(chunk["parent_id"])
+    if not children:
+        empty = np.zeros(0, dtype=np.uint32)
+        return empty, empty
+    child = np.concatenate(children)
+    parent = np.concatenate(parents)
+    order = np.argsort(child, kind="stable")
+    return child[order], parent[order]
+
+
+def _parent_of(child: np.ndarray, parent: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    # parent of each id, or the id itself for founders
+    if len(child) == 0:
+        return ids
+    slot = np.minimum(np.searchsorted(child, ids), len(child) - 1)
+    return np.where(child[slot] == ids, parent[slot], ids)
+
+
+def founders(child: np.ndarray, parent: np.ndarray) -> np.ndarray:
+    # founder of every recorded child, by pointer doubling over the earliest
+    # recorded ancestor (log2(depth) rounds of vectorised lookups)
+    if len(child) == 0:
+        return parent
+    slot = np.minimum(np.searchsorted(child, parent), len(child) - 1)
+    earliest = np.where(child[slot] == parent, slot, np.arange(len(child)))
+    while True:
+        jumped = earliest[earliest]
+        if np.array_equal(jumped, earliest):
+            return parent[earliest]
+        earliest = jumped
+
+
+def clade_sizes(directory: str) -> Dict[int, int]:
+    # founder id -> number of descendants
+    child, parent = load_parents(directory)
+    if len(child) == 0:
+        return {}
+    roots, counts = np.unique(founders(child, parent), return_counts=True)
+    return dict(zip(roots.tolist(), counts.tolist()))
+
+
+def ancestry(directory: str, agent_id: int) -> List[int]:
+    # agent_id, its parent, grandparent, ... up to the founder
+    child, parent = load_parents(directory)
+    chain = [agent_id]
+    while True:
+        up = int(_parent_of(child, parent, np.array([chain[-1]], dtype=np.uint32))[0])
+        if up == chain[-1]:
+            return chain
+        chain.append(up)
+
+
+def descendants(
+    directory: str, agent_id: int, max_depth: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    # (parent, child) edges of the lineage tree below agent_id, breadth first
+    child, parent = load_parents(directory)
+    by_parent = np.argsort(parent, kind="stable")
+    parent_sorted = parent[by_parent]
+    edges: List[Tuple[int, int]] = []
+    frontier = np.array([agent_id], dtype=np.uint32)
+    depth = 0
+    while len(frontier) and (max_depth is None or depth < max_depth):
+        lo = np.searchsorted(parent_sorted, frontier, side="left")
+        hi = np.searchsorted(parent_sorted, frontier, side="right")
+        rows = np.concatenate(
+            [by_parent[a:b] for a, b in zip(lo, hi)] or [np.zeros(0, dtype=np.int64)]
+        )
+        edges.extend(zip(parent[rows].tolist(), child[rows].tolist()))
+        frontier = child[rows]
+        depth += 1
+    return edges
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Query recorded lineages")
+    parser.add_argument("directory", help="directory of lineage_*.npz chunks")
+    parser.add_argument("--clades", action="store_true", help="clade size per founder")
+    parser.add_argument("--top", type=int, default=10, help="largest N clades")
+    parser.add_argument("--ancestry", type=int, help="ancestors of an agent id")
+    parser.add_argument("--descendants", type=int, help="lineage tree of an agent id")
+    parser.add_argument("--max-depth", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.ancestry is not None:
+        print(" <- ".join(str(i) for i in ancestry(args.directory, args.ancestry)))
+    if args.descendants is not None:
+        for parent_id, child_id in descendants(
+            args.directory, args.descendants, args.max_depth
+        ):
+            print(f"{parent_id} -> {child_id}")
+    if args.clades:
+        sizes = clade_sizes(args.directory)
+        largest = sorted(sizes.items(), key=lambda kv: kv[1], reverse=True)
+        print(f"{len(sizes)} founders with descendants")
+        for founder, size in largest[: args.top]:
+            print(f"founder {founder}: {size} descendants")
+
+
+if __name__ == "__main__":
+    main()
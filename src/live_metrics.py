@@ -0,0 +1,195 @@
+###
+# Headless live metrics for long runs
+# a small HTTP server (standard library only) that serves the latest per-step
+# metrics of a running simulation, so runs on cluster nodes can be watched
+# without the OpenGL visualisation:
+#   /metrics   latest metrics as JSON
+#   /history   recent metrics as a JSON list
+#   /events    server-sent events, one JSON message per published step
+#   /grid.png  latest downsampled grid image
+# the simulation only ever calls publish(), which puts the step on a bounded
+# queue without blocking (and drops it if the queue is full). Downsampling,
+# PNG encoding and serving happen on background threads.
+###
+import json
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from frame_renderer import SET1_RGB, color_lookup, downsample, encode_png, grid_to_rgb
+
+
+class MetricsServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        palette: Sequence[Tuple[int, int, int]] = SET1_RGB,
+        background: Tuple[int, int, int] = (0, 0, 0),
+        image_size: int = 256,
+        history: int = 1000,
+        queue_size: int = 64,
+    ):
+        self.host = host
+        self.port = port
+        self.lookup = color_lookup(palette, background)
+        self.image_size = image_size
+        self.dropped: int = 0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+        self._history: Deque[dict] = deque(maxlen=history)
+        self._latest: dict = {}
+        self._latest_png: bytes = b""
+        self._subscribers: List["queue.Queue[str]"] = []
+        self._lock = threading.Lock()
+        self._last_publish: Optional[Tuple[int, float]] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "MetricsServer":
+        server = ThreadingHTTPServer((self.host, self.port), _handler_for(self))
+        server.daemon_threads = True
+        self._server = server
+        self.port = server.server_address[1]
+        self._threads = [
+            threading.Thread(target=server.serve_forever, daemon=True),
+            threading.Thread(target=self._process, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        print(f"Serving live metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self) -> None:
+        self._queue.put(None)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def publish(
+        self, step: int, metrics: dict, grid: Optional[np.ndarray] = None
+    ) -> None:
+        # never blocks the simulation, a full queue drops the step
+        now = time.perf_counter()
+        metrics = dict(metrics, step=step)
+        if self._last_publish is not None and step > self._last_publish[0]:
+            metrics["steps_per_second"] = (step - self._last_publish[0]) / max(
+                now - self._last_publish[1], 1e-9
+            )
+        self._last_publish = (step, now)
+        try:
+            self._queue.put_nowait((metrics, grid))
+        except queue.Full:
+            self.dropped += 1
+
+    def _process(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            metrics, grid = item
+            metrics = _jsonable(metrics)
+            metrics["dropped"] = self.dropped
+            png = None
+            if grid is not None:
+                png = encode_png(
+                    grid_to_rgb(downsample(grid, self.image_size), self.lookup)
+                )
+            message = json.dumps(metrics)
+            with self._lock:
+                self._latest = metrics
+                self._history.append(metrics)
+                if png is not None:
+                    self._latest_png = png
+                subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    # slow client, it misses this step
+                    pass
+
+    def _subscribe(self) -> "queue.Queue[str]":
+        subscriber: "queue.Queue[str]" = queue.Queue(maxsize=16)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def _unsubscribe(self, subscriber: "queue.Queue[str]") -> None:
+        with self._lock:
+            self._subscribers.remove(subscriber)
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _handler_for(metrics_server: MetricsServer) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, body: bytes, content_type: str, status: int = 200) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            with metrics_server._lock:
+                latest = metrics_server._latest
+                history = list(metrics_server._history)
+                png = metrics_server._latest_png
+            if path == "/metrics":
+                self._send(json.dumps(latest).encode(), "application/json")
+            elif path == "/history":
+                self._send(json.dumps(history).encode(), "application/json")
+            elif path == "/grid.png":
+                if png:
+                    self._send(png, "image/png")
+                else:
+                    self._send(b"no grid snapshot yet", "text/plain", 404)
+            elif path == "/events":
+                self._stream()
+            else:
+                self._send(b"not found", "text/plain", 404)
+
+        def _stream(self) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            subscriber = metrics_server._subscribe()
+            try:
+                while True:
+                    try:
+                        message = subscriber.get(timeout=15)
+                        self.wfile.write(f"data: {message}\n\n".encode())
+                    except queue.Empty:
+                        # keep the connection alive through proxies
+                        self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                metrics_server._unsubscribe(subscriber)
+
+        def log_message(self, format, *args):
+            # keep the simulation output readable
+            pass
+
+    return Handler
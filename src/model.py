@@ -21,14 +21,53 @@ __VERSION_STR__ = f"{__name__} v{__VERSION__}"
 # but another neighbour has no games to play (they should move).
 
 from distutils.command.config import config
-from time import strftime
-from typing import List
+from time import perf_counter, strftime
+from typing import Dict, Iterator, List, Optional, Tuple
 import pyflamegpu
+import numpy as np
+
+from cluster_analysis import EMPTY_CELL, cluster_summary
+from batch_engine import BatchSimulation
+from domain_decomposition import DecomposedSimulation
+from fork_ensemble import run_fork_ensemble, simulate_branch
+from live_metrics import MetricsServer
+from frame_renderer import SET1_RGB, FrameWriter
+from strategy_tables import build_strategy_tables, genome_weights
+from lineage import LineageRecorder
+from game_events import GameEventWriter, unpack_game_flags
+from run_index import RunIndex
+from count_series import CountSeriesWriter
+from output_pipeline import OutputPipeline
+from checkpoints import load_checkpoint
+from warm_start import check_snapshot, cpu_population, read_snapshot, write_snapshot
+from schema import (
+    AGENT_MODEL_GROUPS,
+    agent_schema,
+    check_kernel,
+    declare_agent,
+    declare_message,
+    message_schema,
+    model_variables,
+    schema_report,
+)
+from sweep_spec import SweepSpec, chunked
+from sensitivity import (
+    SaltelliDesign,
+    final_state,
+    format_indices,
+    run_outputs,
+    sobol_indices,
+)
 
 # Import standard python libs that are used
 import sys
 import random
 import math
+import os
+import json
+import hashlib
+import tempfile
+import threading
 
 
 ##########################################
@@ -56,12 +95,99 @@ LOG_FILE: str = f"data/{strftime('%Y-%m-%d %H-%M-%S')}_{RANDOM_SEED}.json"
 VERBOSE_OUTPUT: bool = False
 DEBUG_OUTPUT: bool = False
 OUTPUT_EVERY_N_STEPS: int = 1
+# energy / games played / movement statistics are gathered in one device pass
+# and read back once, this is how often (in steps) the full set is computed.
+# strategy counts, births and deaths are still updated every step.
+STATS_EVERY_N_STEPS: int = OUTPUT_EVERY_N_STEPS
+# resolution of the per strategy energy histogram (used as a quantile sketch)
+STATS_ENERGY_BINS: int = 16
+STATS_ENERGY_QUANTILES: List[float] = [0.25, 0.5, 0.75]
+# stop a run early once all but one strategy (bin of population_strat_count)
+# is extinct. Only applies to runs without mutation (mutation_rate 0), where
+# this can not change any more.
+EARLY_STOP_EXTINCTION: bool = False
+# stop a run early once every strategy share changed by less than epsilon
+# over the last N steps (0 = off)
+EARLY_STOP_STEADY_STATE_WINDOW: int = 0
+EARLY_STOP_STEADY_STATE_EPSILON: float = 0.001
+# label same-strategy clusters on the grid every N steps (0 = off)
+# see cluster_analysis.py, the grid is filled on the device (snapshot_grid).
+CLUSTER_ANALYSIS_EVERY_N_STEPS: int = 0
+# log2 cluster size classes (1, 2-3, 4-7, ...)
+CLUSTER_SIZE_CLASSES: int = 16
+
+# write population_strat_count every OUTPUT_EVERY_N_STEPS as a delta / zig-zag
+# varint compressed series (count_series.py) instead of in the JSON step log,
+# roughly 10x smaller. Single runs write COUNT_SERIES_FILE, sweep runs
+# population_strat_count.counts in their output subdirectory.
+COUNT_SERIES: bool = False
+COUNT_SERIES_FILE: str = LOG_FILE[: -len(".json")] + ".counts"
+# rows per block, the unit of random access
+COUNT_SERIES_BLOCK_STEPS: int = 1024
+# writer threads of the output pipeline (output_pipeline.py): count series
+# blocks, lineage chunks, sweep run records and population snapshots are
+# written in the background, overlapping with the next steps. Each thread
+# queues up to OUTPUT_PIPELINE_QUEUE_SIZE writes, beyond that the simulation
+# waits for it. The threads are only started when one of these writers is
+# enabled (and never for decomposed / forked runs). 0 = write inline
+OUTPUT_PIPELINE_WORKERS: int = 0
+OUTPUT_PIPELINE_QUEUE_SIZE: int = 8
+
+# record (child id, parent id, step, strategy id) of every birth of a single
+# run to numbered chunks in LINEAGE_DIRECTORY (see lineage.py for queries).
+# The step function reads 3 values per birth back from the device, one Python
+# call each, roughly 3us of host time per birth.
+LINEAGE_RECORDING: bool = False
+LINEAGE_DIRECTORY: str = LOG_FILE[: -len(".json")] + "_lineage"
+# births held in memory before a chunk is written
+LINEAGE_CHUNK_SIZE: int = 1 << 20
+
+# record a sample of the games of a single run (ids, strategies, actions,
+# noise flips and payoffs) to GAME_EVENTS_FILE, see game_events.py. Games are
+# sampled by hashing them, the agent RNG is untouched. The step function
+# reads 3 values per sampled game back from the device one Python call each
+# (roughly 1us), budget about 3us of host time per sampled game and step.
+# 0.0 = disabled
+GAME_EVENTS_SAMPLE_RATE: float = 0.0
+GAME_EVENTS_FILE: str = LOG_FILE[: -len(".json")] + "_games.bin"
+# events per compressed block
+GAME_EVENTS_BLOCK_SIZE: int = 1 << 16
+
+# count engine events of every step into the perf_counters env property
+# (step log, live metrics, VERBOSE_OUTPUT): games played, move requests that
+# lost their requester_roll contest, failed god_multiply reproduction claims,
+# agents that ran out of challenges without playing a game, and how many
+# iterations the pdgame, movement and god submodels ran.
+PERF_COUNTERS: bool = False
+
+# adaptive iteration caps of the pdgame, movement and god submodels: their exit
+# conditions learn from the last ADAPTIVE_ITERATION_WINDOW steps how many
+# iterations each submodel needs and only count agent states from that
+# estimate on. The pdgame schedule is fixed (every playing agent takes one
+# challenge slot per iteration), so it only checks after the first iteration.
+# The estimates and iterations run are logged as iteration_estimates and
+# iteration_counts (pdgame, movement, god). False = check every iteration.
+ADAPTIVE_ITERATIONS: bool = False
+ADAPTIVE_ITERATION_WINDOW: int = 16
 
 # rate limit simulation?
 SIMULATION_SPS_LIMIT: int = 0  # 0 = unlimited
 
+# headless rendering (see frame_renderer.py): write a frame of the grid,
+# coloured by agent_color with the SET1 palette, every N steps of a single
+# run. Replaces the OpenGL visualisation, so the visualisation-only agent
+# variables (x, y, pitch) are not created. 0 = disabled
+RENDER_FRAMES_EVERY_N_STEPS: int = 0
+# encode the frames as one video with ffmpeg instead of PNG files
+RENDER_VIDEO: bool = False
+# frame width / height in pixels
+RENDER_FRAME_SIZE: int = 512
+RENDER_DIRECTORY: str = LOG_FILE[: -len(".json")] + "_frames"
+
 # Show agent visualisation
-USE_VISUALISATION: bool = True and pyflamegpu.VISUALISATION
+USE_VISUALISATION: bool = (
+    True and pyflamegpu.VISUALISATION and RENDER_FRAMES_EVERY_N_STEPS == 0
+)
 
 # visualisation camera speed
 VISUALISATION_CAMERA_SPEED: float = 0.1
@@ -69,6 +195,16 @@ VISUALISATION_CAMERA_SPEED: float = 0.1
 PAUSE_AT_START: bool = False
 VISUALISATION_BG_RGB: List[float] = [0.1, 0.1, 0.1]
 
+# serve live metrics over HTTP for headless runs (see live_metrics.py), on
+# http://LIVE_METRICS_HOST:LIVE_METRICS_PORT/metrics, /history, /events and
+# /grid.png. Single GPU runs and batched sweeps only. 0 = disabled
+LIVE_METRICS_PORT: int = 0
+LIVE_METRICS_HOST: str = "127.0.0.1"
+# grid images need a grid read back from the device, so only every N steps
+LIVE_METRICS_GRID_EVERY_N_STEPS: int = 50
+# width / height of the downsampled grid image in pixels
+LIVE_METRICS_IMAGE_SIZE: int = 256
+
 # should agents rotate to face the direction of their last action?
 VISUALISATION_ORIENT_AGENTS: bool = False
 # radius of message search grid (broken now from hardcoded x,y offset map)
@@ -167,6 +303,96 @@ AGENT_TRAIT_MUTATION_RATE: float = 0.0
 MULTI_RUN = False
 MULTI_RUN_STEPS = 10000
 MULTI_RUN_COUNT = 1
+# skip runs that already completed in an earlier (interrupted) sweep, runs are
+# identified by a fingerprint of (config, seed, steps) and recorded in the
+# manifest as they finish. Delete the manifest to start a fresh sweep.
+SWEEP_RESUME = True
+SWEEP_OUTPUT_DIRECTORY: str = "data"
+SWEEP_MANIFEST_FILE: str = f"{SWEEP_OUTPUT_DIRECTORY}/sweep_manifest.jsonl"
+# what a MULTI_RUN sweep varies (see sweep_spec.py): env property -> levels
+# [v0, v1, ...] or, for the sampled methods, a (low, high) range. Every point
+# is run MULTI_RUN_COUNT times. travel_cost follows cost_of_living / 2 unless
+# it is swept itself.
+SWEEP_METHOD: str = "factorial"  # factorial, lhs or sobol
+SWEEP_PARAMETERS: Dict[str, object] = {
+    "strategy_pure": [0, 1],
+    "cost_of_living": [0.1, 0.3, 1, 2 / 3, 1.5, 1.666],
+}
+# number of points of lhs / sobol sweeps
+SWEEP_SAMPLES: int = 64
+# run plans are generated lazily and handed to the ensemble this many at a time
+SWEEP_CHUNK_SIZE: int = 256
+# global sensitivity analysis (sensitivity.py): instead of SWEEP_PARAMETERS run
+# a Saltelli design of SENSITIVITY_BASE_SAMPLES * (parameters + 2) points over
+# these (low, high) ranges, then write first order and total Sobol indices of
+# the final population size and strategy shares to SENSITIVITY_OUTPUT_FILE.
+# Runs already in the sweep manifest are not run again.
+SENSITIVITY_ANALYSIS: bool = False
+SENSITIVITY_PARAMETERS: Dict[str, Tuple[float, float]] = {
+    "cost_of_living": (0.1, 2.0),
+    "travel_cost": (0.05, 1.0),
+    "reproduce_cost": (25.0, 75.0),
+    "reproduce_min_energy": (75.0, 125.0),
+    "env_noise": (0.0, 0.1),
+    "payoff_cc": (2.0, 4.0),
+    "payoff_dc": (4.0, 6.0),
+}
+SENSITIVITY_BASE_SAMPLES: int = 64
+SENSITIVITY_BOOTSTRAP: int = 200
+SENSITIVITY_OUTPUT_FILE: str = f"{SWEEP_OUTPUT_DIRECTORY}/sensitivity.json"
+# SQLite index of finished sweep runs (run_index.py): config, seed, runtime,
+# stop reason and final strategy counts, queryable without the raw logs.
+# "" = no index
+RUN_INDEX_FILE: str = f"{SWEEP_OUTPUT_DIRECTORY}/run_index.sqlite"
+# run MULTI_RUN sweeps on the batched CPU engine (batch_engine.py) instead of
+# the CUDAEnsemble, with this many replicates stacked into each batch. Small
+# grids are dominated by per-step overhead which batching amortises.
+# 0 = use the CUDAEnsemble
+BATCH_REPLICATES: int = 0
+# the batched engine switches from a dense grid to a sparse (sorted cell key)
+# index when fewer than this share of cells are occupied, e.g. when a
+# population is crashing toward extinction.
+BATCH_SPARSE_DENSITY_THRESHOLD: float = 0.02
+# tiled mode for very large grids: agents are kept in spatial tile order and
+# the neighbourhood scans run in chunks that fit this many bytes (roughly the
+# size of the last level cache, e.g. 4 * 2**20). 0 = untiled
+BATCH_TILE_MEMORY_BUDGET: int = 0
+# run a single (non MULTI_RUN) simulation on the CPU instead, with the grid
+# split into strips across this many worker processes (domain_decomposition.py)
+# results do not depend on the number of workers. 0 = run on the GPU
+DECOMPOSED_WORKERS: int = 0
+# checkpoint the agents of decomposed runs every N steps, any step can then be
+# replayed from the nearest earlier checkpoint (checkpoints.py):
+#   python src/checkpoints.py <CHECKPOINT_DIRECTORY> --step 7342 --out state.npz
+# 0 = no checkpoints
+CHECKPOINT_EVERY_N_STEPS: int = 0
+CHECKPOINT_DIRECTORY: str = LOG_FILE[: -len(".json")] + "_checkpoints"
+# warm start: begin every run (single runs, each run of a sweep and the CPU
+# engines) from the population snapshot in this file (warm_start.py) instead of
+# a random layout. The environment still comes from the config / sweep, so one
+# burn-in can be shared by every cost_of_living etc. of a sweep. Cut one from
+# checkpoints with: python src/warm_start.py <CHECKPOINT_DIRECTORY> --step 2000
+#   --out data/burn_in.npz
+# "" = random initial population
+WARM_START_FILE: str = ""
+# save the final population of single runs as a warm start snapshot here
+# "" = do not save
+WARM_START_SAVE_FILE: str = ""
+# fork ensembles: with DECOMPOSED_WORKERS set, simulate once to
+# FORK_BRANCH_STEP, then fork one variant per FORK_VARIANTS entry (environment
+# overrides, plus "random_seed" to change the seed) that continues from the
+# shared branch state to STEP_COUNT (fork_ensemble.py). FORK_PARALLEL variants
+# run at a time, each with DECOMPOSED_WORKERS workers (0 = as many as fit the
+# cpus). Each variant logs to FORK_OUTPUT_DIRECTORY/variant_NNN.json
+# 0 = no fork ensemble
+FORK_BRANCH_STEP: int = 0
+FORK_VARIANTS: List[dict] = [
+    {},
+    {"cost_of_living": 1.0},
+    {"cost_of_living": 2.0},
+]
+FORK_PARALLEL: int = 0
+FORK_OUTPUT_DIRECTORY: str = LOG_FILE[: -len(".json")] + "_forks"
 
 ##########################################
 # Main script                            #
@@ -183,11 +409,52 @@ def configure_logging(
     step_log_cfg = pyflamegpu.StepLoggingConfig(model)
     step_log_cfg.setFrequency(OUTPUT_EVERY_N_STEPS)
     step_log_cfg.agent("prisoner").logCount()
-    step_log_cfg.logEnvironment("population_strat_count")
+    if not COUNT_SERIES:
+        step_log_cfg.logEnvironment("population_strat_count")
+    if WRITE_LOG:
+        step_log_cfg.logEnvironment("stats_step")
+        step_log_cfg.logEnvironment("stats_energy_mean")
+        step_log_cfg.logEnvironment("stats_energy_var")
+        step_log_cfg.logEnvironment("stats_energy_quantiles")
+        step_log_cfg.logEnvironment("stats_games_played")
+        step_log_cfg.logEnvironment("stats_moved")
+        step_log_cfg.logEnvironment("stats_move_failed")
+        step_log_cfg.logEnvironment("stats_births")
+        step_log_cfg.logEnvironment("stats_deaths")
+        step_log_cfg.logEnvironment("iteration_estimates")
+        step_log_cfg.logEnvironment("iteration_counts")
+    if PERF_COUNTERS:
+        step_log_cfg.logEnvironment("perf_counters")
+    if CLUSTER_ANALYSIS_EVERY_N_STEPS > 0:
+        step_log_cfg.logEnvironment("cluster_count")
+        step_log_cfg.logEnvironment("cluster_largest")
+        step_log_cfg.logEnvironment("cluster_size_classes")
     return step_log_cfg
     # step_log_cfg
 
 
+def configure_exit_logging(
+    model: pyflamegpu.ModelDescription,
+) -> pyflamegpu.LoggingConfig:
+    exit_log_cfg = pyflamegpu.LoggingConfig(model)
+    exit_log_cfg.agent("prisoner").logCount()
+    exit_log_cfg.logEnvironment("population_strat_count")
+    exit_log_cfg.logEnvironment("stop_reason")
+    exit_log_cfg.logEnvironment("stop_step")
+    return exit_log_cfg
+
+
+# early stopping needs the strategy counts from the statistics pass
+POPULATION_STATS_ENABLED: bool = (
+    WRITE_LOG or EARLY_STOP_EXTINCTION or EARLY_STOP_STEADY_STATE_WINDOW > 0
+)
+
+# why a run stopped (logged at exit), 0 = ran for all steps
+STOP_REASON_NONE: int = 0
+STOP_REASON_EXTINCT: int = 1
+STOP_REASON_FIXATION: int = 2
+STOP_REASON_STEADY_STATE: int = 3
+
 AGENT_RESULT_COOP: int = 0
 AGENT_RESULT_DEFECT: int = 1
 
@@ -207,6 +474,11 @@ AGENT_STATUS_REPRODUCTION_IMPOSSIBLE: int = 1024
 AGENT_STATUS_REPRODUCTION_COMPLETE: int = 2048
 AGENT_STATUS_NEW_AGENT: int = 4096
 
+# Movement outcome for the current step (for statistics)
+AGENT_MOVE_RESULT_NONE: int = 0
+AGENT_MOVE_RESULT_MOVED: int = 1
+AGENT_MOVE_RESULT_FAILED: int = 2
+
 # grid dimensions x = y
 ENV_MAX: int = math.ceil(math.sqrt(MAX_AGENT_SPACES))
 # this is intentially one more than the max (when zero indexing)
@@ -226,6 +498,12 @@ AGENT_STRATEGY_IDS: List[int] = [
 AGENT_STRATEGY_COUNT: int = len(AGENT_STRATEGY_IDS)
 
 POPULATION_COUNT_BINS: int = AGENT_STRATEGY_COUNT**2
+# every valid strategy vector, pure genomes first then the configured mixed mode
+STRATEGY_TABLES: Dict[str, np.ndarray] = build_strategy_tables(
+    AGENT_STRATEGY_COUNT, AGENT_TRAIT_COUNT, AGENT_STRATEGY_PER_TRAIT
+)
+STRATEGY_GENOME_COUNT: int = len(STRATEGY_TABLES["digits"])
+STRATEGY_GENOME_COMPONENTS: int = STRATEGY_TABLES["digits"].shape[1]
 # definie color pallete for each agent strategy, with fallback to white
 AGENT_COLOR_SCHEME: pyflamegpu.uDiscreteColor = pyflamegpu.uDiscreteColor(
     "agent_color", pyflamegpu.SET1, pyflamegpu.WHITE
@@ -254,6 +532,15 @@ SEARCH_GRID_OFFSET: int = SEARCH_GRID_SIZE // 2
 SPACES_WITHIN_RADIUS_INCL: int = SEARCH_GRID_SIZE**2
 SPACES_WITHIN_RADIUS: int = SPACES_WITHIN_RADIUS_INCL - 1
 SPACES_WITHIN_RADIUS_ZERO_INDEXED: int = SPACES_WITHIN_RADIUS - 1
+
+# every agent / message variable, see schema.py
+AGENT_SCHEMA: Dict[str, list] = agent_schema(
+    AGENT_TRAIT_COUNT,
+    SPACES_WITHIN_RADIUS,
+    USE_VISUALISATION,
+    VISUALISATION_ORIENT_AGENTS,
+)
+MESSAGE_SCHEMA: Dict[str, list] = message_schema(AGENT_TRAIT_COUNT)
 CENTER_SPACE: int = SPACES_WITHIN_RADIUS // 2
 
 # if we use visualisation, update agent position and direction.
@@ -262,6 +549,73 @@ CUDA_ORIENT_AGENTS: str = (
     "true" if USE_VISUALISATION and VISUALISATION_ORIENT_AGENTS else "false"
 )
 
+# layout of the statistics side buffer, everything lives in one macro property
+# so the host only needs a single readback per step.
+STATS_GAMES_PLAYED_BINS: int = SPACES_WITHIN_RADIUS + 1
+STATS_OFFSET_COUNT: int = 0
+STATS_OFFSET_BIRTHS: int = STATS_OFFSET_COUNT + POPULATION_COUNT_BINS
+STATS_OFFSET_ENERGY_SUM: int = STATS_OFFSET_BIRTHS + POPULATION_COUNT_BINS
+STATS_OFFSET_ENERGY_SUMSQ: int = STATS_OFFSET_ENERGY_SUM + POPULATION_COUNT_BINS
+STATS_OFFSET_ENERGY_HIST: int = STATS_OFFSET_ENERGY_SUMSQ + POPULATION_COUNT_BINS
+STATS_OFFSET_GAMES_PLAYED: int = (
+    STATS_OFFSET_ENERGY_HIST + POPULATION_COUNT_BINS * STATS_ENERGY_BINS
+)
+STATS_OFFSET_MOVED: int = STATS_OFFSET_GAMES_PLAYED + STATS_GAMES_PLAYED_BINS
+STATS_OFFSET_MOVE_FAILED: int = STATS_OFFSET_MOVED + 1
+STATS_BUFFER_SIZE: int = STATS_OFFSET_MOVE_FAILED + 1
+# layout of perf_counters, the first PERF_DEVICE_COUNTERS are counted by the
+# agent functions into the perf_counter_buffer macro property, the submodel
+# iterations by their exit conditions.
+PERF_COUNTER_GAMES: int = 0
+PERF_COUNTER_MOVE_CONTESTS_LOST: int = 1
+PERF_COUNTER_REPRODUCTION_CLAIMS_FAILED: int = 2
+PERF_COUNTER_NO_GAMES: int = 3
+PERF_DEVICE_COUNTERS: int = 4
+PERF_COUNTER_PLAY_ITERATIONS: int = 4
+PERF_COUNTER_MOVE_ITERATIONS: int = 5
+PERF_COUNTER_GOD_ITERATIONS: int = 6
+PERF_COUNTER_NAMES: List[str] = [
+    "games",
+    "move_contests_lost",
+    "reproduction_claims_failed",
+    "no_games",
+    "play_iterations",
+    "move_iterations",
+    "god_iterations",
+]
+# index of each submodel in iteration_estimates / iteration_counts
+ITERATION_SUBMODELS: List[str] = ["pdgame_model", "movement_model", "god_model"]
+# births per step the device lineage buffer holds (at most one per cell)
+LINEAGE_BUFFER_CAPACITY: int = MAX_AGENT_SPACES
+LINEAGE_BUFFER_SIZE: int = LINEAGE_BUFFER_CAPACITY * 3
+GAME_EVENTS_ENABLED: bool = GAME_EVENTS_SAMPLE_RATE > 0.0 and not MULTI_RUN
+CUDA_GAME_EVENTS_ENABLED: str = "true" if GAME_EVENTS_ENABLED else "false"
+# sampled games per step the device buffer holds, with headroom over the
+# expected count (every agent challenges at most SPACES_WITHIN_RADIUS others)
+GAME_EVENT_BUFFER_CAPACITY: int = min(
+    AGENT_HARD_LIMIT * SPACES_WITHIN_RADIUS,
+    math.ceil(AGENT_HARD_LIMIT * SPACES_WITHIN_RADIUS * GAME_EVENTS_SAMPLE_RATE * 2)
+    + 1024,
+)
+# steps on which the host needs a grid of the population (cluster analysis,
+# frames, live metrics). On those steps the snapshot_grid agent function lists
+# every agent as one word (cell, agent_color, strategy id), so the host reads
+# one value per agent instead of the three of a getPopulationData() copy.
+SNAPSHOT_GRID_EVERY_N_STEPS: List[int] = [
+    n
+    for n in (
+        CLUSTER_ANALYSIS_EVERY_N_STEPS,
+        0 if MULTI_RUN else RENDER_FRAMES_EVERY_N_STEPS,
+        0 if MULTI_RUN or LIVE_METRICS_PORT == 0 else LIVE_METRICS_GRID_EVERY_N_STEPS,
+    )
+    if n > 0
+]
+# one agent per cell at most
+SNAPSHOT_GRID_CAPACITY: int = ENV_MAX * ENV_MAX
+SNAPSHOT_CELL_BITS: int = max(1, (SNAPSHOT_GRID_CAPACITY - 1).bit_length())
+SNAPSHOT_COLOR_BITS: int = max(1, (AGENT_TRAIT_COUNT - 1).bit_length())
+SNAPSHOT_STRATEGY_BITS: int = (11 * (AGENT_STRATEGY_COUNT - 1)).bit_length()
+
 
 CUDA_GET_POP_INDEX_FUNCTION_NAME: str = "get_pop_index"
 CUDA_GET_POP_INDEX_FUNCTION: str = rf"""
@@ -348,6 +702,16 @@ def debug_set_color(index: int = -1) -> str:
     return f'FLAMEGPU->setVariable<unsigned int>("agent_color", {index});'
 
 
+def perf_count(counter: int) -> str:
+    # one atomic increment of a device perf counter, nothing without PERF_COUNTERS
+    if not PERF_COUNTERS:
+        return ""
+    return (
+        f"FLAMEGPU->environment.getMacroProperty<unsigned int, {PERF_DEVICE_COUNTERS}>"
+        f'("perf_counter_buffer")[{counter}] += 1;'
+    )
+
+
 # agent functions
 CUDA_SEARCH_FUNC_NAME: str = "search_for_neighbours"
 CUDA_SEARCH_FUNC: str = rf"""
@@ -381,6 +745,9 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_GAME_LIST_FUNC_NAME}, flamegpu::MessageBucket, fla
     const unsigned int my_id = FLAMEGPU->getID();
     const float my_roll = FLAMEGPU->getVariable<float>("die_roll");
     const unsigned int env_max = FLAMEGPU->environment.getProperty<unsigned int>("env_max");
+    // per step statistics start fresh
+    FLAMEGPU->setVariable<uint8_t>("games_played", 0);
+    FLAMEGPU->setVariable<uint8_t>("move_result", {AGENT_MOVE_RESULT_NONE});
     // iterate over all cells in the neighbourhood
     // this also wraps across env boundaries.
     unsigned int num_neighbours = 0;
@@ -467,6 +834,7 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_PLAY_CHALLENGE_FUNC_NAME}, flamegpu::Message
             // we've run out of spaces, and no games have been played.
             // that means that the agent(s) we were to play against have
             // died and we can instead do a movement action this turn.
+            {perf_count(PERF_COUNTER_NO_GAMES)}
             FLAMEGPU->setVariable<unsigned int>("agent_status", {AGENT_STATUS_MOVEMENT_UNRESOLVED});
         }} else {{
             FLAMEGPU->setVariable<unsigned int>("agent_status", {AGENT_STATUS_READY});
@@ -528,11 +896,11 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_PLAY_CHALLENGE_FUNC_NAME}, flamegpu::Message
         FLAMEGPU->message_out.setVariable<uint8_t>("challenger_trait", FLAMEGPU->getVariable<uint8_t>("agent_trait"));
         FLAMEGPU->message_out.setVariable<flamegpu::id_t>("challenger_game_memory_id", FLAMEGPU->getVariable<flamegpu::id_t, {SPACES_WITHIN_RADIUS}>("game_memory", challenge_sequence));
         FLAMEGPU->message_out.setVariable<uint8_t>("challenger_game_memory_choice", FLAMEGPU->getVariable<uint8_t, {SPACES_WITHIN_RADIUS}>("game_memory_choices", challenge_sequence));
-        FLAMEGPU->message_out.setVariable<unsigned int>("challenger_energy", FLAMEGPU->getVariable<float>("energy"));
+        FLAMEGPU->message_out.setVariable<float>("challenger_energy", FLAMEGPU->getVariable<float>("energy"));
         FLAMEGPU->message_out.setVariable<unsigned int>("challenger_x", my_x);
         FLAMEGPU->message_out.setVariable<unsigned int>("challenger_y", my_y);
         FLAMEGPU->message_out.setVariable<float>("challenger_roll", FLAMEGPU->getVariable<float>("die_roll"));
-        FLAMEGPU->message_out.setVariable<float>("challenger_bucket", FLAMEGPU->getVariable<float>("my_bucket"));
+        FLAMEGPU->message_out.setVariable<unsigned int>("challenger_bucket", FLAMEGPU->getVariable<unsigned int>("my_bucket"));
 
     }}
 
@@ -549,6 +917,7 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_PLAY_CHALLENGE_FUNC_NAME}, flamegpu::Message
                 // we've run out of spaces, and no games have been played.
                 // that means that the agent(s) we were to play against have
                 // died and we can instead do a movement action this turn.
+                {perf_count(PERF_COUNTER_NO_GAMES)}
                 FLAMEGPU->setVariable<unsigned int>("agent_status", {AGENT_STATUS_MOVEMENT_UNRESOLVED});
                 //FLAMEGPU->setVariable<unsigned int>("agent_status", {AGENT_STATUS_READY});
             }} else {{
@@ -674,18 +1043,51 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_PLAY_RESPONSE_FUNC_NAME}, flamegpu::MessageB
             }}
             
             // 4 possible outcomes
+            float challenger_payoff = 0.0;
+            float my_payoff = 0.0;
             if (i_coop && challenger_coop) {{
-                challenger_energy += payoff_cc;
-                my_energy += payoff_cc;
+                challenger_payoff = payoff_cc;
+                my_payoff = payoff_cc;
             }} else if (!i_coop && !challenger_coop) {{
-                challenger_energy += payoff_dd;
-                my_energy += payoff_dd;
+                challenger_payoff = payoff_dd;
+                my_payoff = payoff_dd;
             }} else if (i_coop && !challenger_coop) {{
-                challenger_energy += payoff_dc;
-                my_energy += payoff_cd;
+                challenger_payoff = payoff_dc;
+                my_payoff = payoff_cd;
             }} else if (!i_coop && challenger_coop) {{
-                challenger_energy += payoff_cd;
-                my_energy += payoff_dc;
+                challenger_payoff = payoff_cd;
+                my_payoff = payoff_dc;
+            }}
+            challenger_energy += challenger_payoff;
+            my_energy += my_payoff;
+
+            if ({CUDA_GAME_EVENTS_ENABLED}) {{
+                // sample by hashing the game, so recording never changes the run
+                const unsigned int event_step = FLAMEGPU->environment.getProperty<unsigned int>("game_event_step");
+                unsigned int h = (challenger_id * 0x9E3779B1u) ^ (my_id * 0x85EBCA77u) ^ (event_step * 0xC2B2AE3Du);
+                h ^= h >> 16;
+                h *= 0x7FEB352Du;
+                h ^= h >> 15;
+                h *= 0x846CA68Bu;
+                h ^= h >> 16;
+                const float sample_rate = FLAMEGPU->environment.getProperty<float>("game_event_sample_rate");
+                if ((h >> 8) < (unsigned int)(sample_rate * 16777216.0f)) {{
+                    auto events = FLAMEGPU->environment.getMacroProperty<unsigned int, {GAME_EVENT_BUFFER_CAPACITY * 3}>("game_event_buffer");
+                    auto event_count = FLAMEGPU->environment.getMacroProperty<unsigned int>("game_event_count");
+                    const unsigned int slot = event_count++;
+                    if (slot < {GAME_EVENT_BUFFER_CAPACITY}) {{
+                        // strategies, actions and noise flips packed as in game_events.unpack_game_flags
+                        const unsigned int flags = (unsigned int)challenger_strategy
+                            | ((unsigned int)my_strategy << 4)
+                            | ((unsigned int)challenger_coop << 8)
+                            | ((unsigned int)i_coop << 9)
+                            | ((unsigned int)(challenger_roll < env_noise) << 10)
+                            | ((unsigned int)(my_roll < env_noise) << 11);
+                        events[slot * 3 + 0].exchange(challenger_id);
+                        events[slot * 3 + 1].exchange(my_id);
+                        events[slot * 3 + 2].exchange(flags);
+                    }}
+                }}
             }}
 
             FLAMEGPU->message_out.setKey(message.getVariable<unsigned int>("challenger_bucket"));
@@ -708,6 +1110,7 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_PLAY_RESPONSE_FUNC_NAME}, flamegpu::MessageB
             }}
             
             FLAMEGPU->setVariable<uint8_t>("games_played", ++games_played);
+            {perf_count(PERF_COUNTER_GAMES)}
             break;
         }}
     }}
@@ -720,6 +1123,7 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_PLAY_RESPONSE_FUNC_NAME}, flamegpu::MessageB
             // we've run out of spaces, and no games have been played.
             // that means that the agent(s) we were to play against have
             // died and we can instead do a movement action this turn.
+            {perf_count(PERF_COUNTER_NO_GAMES)}
             FLAMEGPU->setVariable<unsigned int>("agent_status", {AGENT_STATUS_MOVEMENT_UNRESOLVED});
             // FLAMEGPU->setVariable<unsigned int>("agent_status", {AGENT_STATUS_READY});
 
@@ -787,6 +1191,8 @@ CUDA_AGENT_MOVE_REQUEST_FUNCTION: str = rf"""
 {CUDA_POS_TO_BUCKET_ID_FUNCTION}
 {CUDA_SEQ_TO_ANGLE_FUNCTION}
 FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_MOVE_REQUEST_FUNCTION_NAME}, flamegpu::MessageNone, flamegpu::MessageBucket) {{
+    // failed until a move request is actually granted
+    FLAMEGPU->setVariable<uint8_t>("move_result", {AGENT_MOVE_RESULT_FAILED});
     unsigned int last_move_attempt = FLAMEGPU->getVariable<unsigned int>("last_move_attempt");
 
     // try to limit the need for calling random.
@@ -938,6 +1344,7 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_MOVE_RESPONSE_FUNCTION_NAME}, flamegpu::Mess
     }}
     // if the space isn't ours, we have to try again
     if (highest_roller_id != my_id) {{
+        {perf_count(PERF_COUNTER_MOVE_CONTESTS_LOST)}
         FLAMEGPU->setVariable<unsigned int>("agent_status", {AGENT_STATUS_MOVEMENT_UNRESOLVED});
         return flamegpu::ALIVE;
     }}
@@ -954,6 +1361,7 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_MOVE_RESPONSE_FUNCTION_NAME}, flamegpu::Mess
     // update message bucket to new grid space
     FLAMEGPU->setVariable<unsigned int>("my_bucket", request_bucket);
     FLAMEGPU->setVariable<unsigned int>("agent_status", {AGENT_STATUS_READY});
+    FLAMEGPU->setVariable<uint8_t>("move_result", {AGENT_MOVE_RESULT_MOVED});
 
     return flamegpu::ALIVE;
 }}
@@ -1201,6 +1609,7 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_GOD_MULTIPLY_FUNCTION_NAME}, flamegpu::Messa
     }}
     // if it's not me, then we can't reproduce
     if (highest_roller_id != my_id) {{
+        {perf_count(PERF_COUNTER_REPRODUCTION_CLAIMS_FAILED)}
         return flamegpu::ALIVE;
     }}
 
@@ -1224,6 +1633,7 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_GOD_MULTIPLY_FUNCTION_NAME}, flamegpu::Messa
     const uint8_t my_trait = FLAMEGPU->getVariable<uint8_t>("agent_trait");
     FLAMEGPU->agent_out.setVariable<uint8_t>("agent_trait", my_trait);
     FLAMEGPU->agent_out.setVariable<unsigned int>("agent_color", my_trait);
+    FLAMEGPU->agent_out.setVariable<flamegpu::id_t>("parent_id", my_id);
     
     const float init_energy_min = FLAMEGPU->environment.getProperty<float>("init_energy_min");
     const float max_energy = FLAMEGPU->environment.getProperty<float>("max_energy");
@@ -1252,78 +1662,38 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_AGENT_GOD_MULTIPLY_FUNCTION_NAME}, flamegpu::Messa
     FLAMEGPU->agent_out.setVariable<unsigned int>("my_bucket", request_bucket);
 
     const float mutation_rate = FLAMEGPU->environment.getProperty<float>("mutation_rate");
-    uint8_t my_strat;
-    uint8_t child_strat;
-    float mutation_roll;
-    // @TODO: refactor, this is GROSSSSSSS HACK
-    if (FLAMEGPU->environment.getProperty<uint8_t>("strategy_pure") == 1) {{
-        my_strat = FLAMEGPU->getVariable<uint8_t, {AGENT_TRAIT_COUNT}>("agent_strategies", 0);
-        child_strat = my_strat;
-        if (mutation_rate > 0.0) {{
-            mutation_roll = FLAMEGPU->random.uniform<float>();
-            while (child_strat == my_strat) {{
-                child_strat = FLAMEGPU->random.uniform<int>(0, {AGENT_STRATEGY_COUNT} - 1);
-            }}
-        }}
-        for (int i = 0; i < {AGENT_TRAIT_COUNT}; ++i) {{
-            FLAMEGPU->agent_out.setVariable<uint8_t, {AGENT_TRAIT_COUNT}>("agent_strategies", i, child_strat);
-        }}
-        FLAMEGPU->agent_out.setVariable<uint8_t>("agent_strategy_id", (child_strat * 10) + child_strat);
-
-    }} else if (FLAMEGPU->environment.getProperty<uint8_t>("strategy_per_trait") == 1) {{
-        for (int i = 0; i < {AGENT_TRAIT_COUNT}; ++i) {{
-            my_strat = FLAMEGPU->getVariable<uint8_t, {AGENT_TRAIT_COUNT}>("agent_strategies", i);
-            child_strat = my_strat;
-            if (mutation_rate > 0.0) {{
-                mutation_roll = FLAMEGPU->random.uniform<float>();
-                if(mutation_roll < mutation_rate) {{
-                    while (child_strat == my_strat) {{
-                        child_strat = FLAMEGPU->random.uniform<int>(0, {AGENT_STRATEGY_COUNT} - 1);
-                    }}
-                }}
-            }}
-            FLAMEGPU->agent_out.setVariable<uint8_t, {AGENT_TRAIT_COUNT}>("agent_strategies", i, child_strat);
-        }}
-    }} else {{
-        float mutation_roll_other = 1.0;
-        mutation_roll = 1.0;
-        if (mutation_rate > 0.0) {{
-            mutation_roll = FLAMEGPU->random.uniform<float>();
-            mutation_roll_other = FLAMEGPU->random.uniform<float>();
-        }}
-        uint8_t child_strat_other = {AGENT_STRATEGY_COUNT} + 1;
-        uint8_t child_strat_my = {AGENT_STRATEGY_COUNT} + 1;
-        for (int i = 0; i < {AGENT_TRAIT_COUNT}; ++i) {{
-            my_strat = FLAMEGPU->getVariable<uint8_t, {AGENT_TRAIT_COUNT}>("agent_strategies", i);
-            child_strat = my_strat;
-            if (i == my_trait) {{
-                if (child_strat_my > {AGENT_STRATEGY_COUNT}) {{
-                    if (mutation_roll < mutation_rate) {{
-                        while (child_strat == my_strat) {{
-                            child_strat = FLAMEGPU->random.uniform<int>(0, {AGENT_STRATEGY_COUNT} - 1);
-                        }}
-                    }}
-                    child_strat_my = child_strat;
-                }} else {{
-                    child_strat = child_strat_my;
-                }}
-            }} else if (i != my_trait) {{
-                if (child_strat_other > {AGENT_STRATEGY_COUNT}) {{
-                    if (mutation_roll_other < mutation_rate) {{
-                        while (child_strat == my_strat) {{
-                            child_strat = FLAMEGPU->random.uniform<int>(0, {AGENT_STRATEGY_COUNT} - 1);
-                        }}
-                    }}
-                    child_strat_other = child_strat;
-                }} else {{
-                    child_strat = child_strat_other;
-                }}
+    // genomes below {AGENT_STRATEGY_COUNT} are pure strategies with a single component
+    unsigned int child_genome = FLAMEGPU->getVariable<unsigned int>("agent_strategy_genome");
+    if (mutation_rate > 0.0 && {AGENT_STRATEGY_COUNT} > 1) {{
+        const bool pure = child_genome < {AGENT_STRATEGY_COUNT};
+        const unsigned int base = pure ? 0 : {AGENT_STRATEGY_COUNT};
+        const unsigned int components = pure ? 1 : {STRATEGY_GENOME_COMPONENTS};
+        unsigned int mixed = child_genome - base;
+        unsigned int place = 1;
+        for (unsigned int c = 0; c < components; ++c) {{
+            if (FLAMEGPU->random.uniform<float>() < mutation_rate) {{
+                // resample the component from the other candidate strategies
+                const unsigned int strat = (mixed / place) % {AGENT_STRATEGY_COUNT};
+                const unsigned int candidate = FLAMEGPU->random.uniform<int>(0, {AGENT_STRATEGY_COUNT} - 2);
+                const uint8_t child_strat = FLAMEGPU->environment.getProperty<uint8_t, {AGENT_STRATEGY_COUNT * max(AGENT_STRATEGY_COUNT - 1, 1)}>("strategy_mutations", strat * ({AGENT_STRATEGY_COUNT} - 1) + candidate);
+                mixed = mixed - (strat * place) + (child_strat * place);
             }}
-            
-            FLAMEGPU->agent_out.setVariable<uint8_t, {AGENT_TRAIT_COUNT}>("agent_strategies", i, child_strat);
+            place *= {AGENT_STRATEGY_COUNT};
         }}
-        FLAMEGPU->agent_out.setVariable<uint8_t>("agent_strategy_id", (child_strat_my * 10) + child_strat_other);
+        child_genome = base + mixed;
+    }}
+    const unsigned int child_row = (child_genome * {AGENT_TRAIT_COUNT}) + my_trait;
+    FLAMEGPU->agent_out.setVariable<unsigned int>("agent_strategy_genome", child_genome);
+    for (int i = 0; i < {AGENT_TRAIT_COUNT}; ++i) {{
+        FLAMEGPU->agent_out.setVariable<uint8_t, {AGENT_TRAIT_COUNT}>(
+            "agent_strategies", i,
+            FLAMEGPU->environment.getProperty<uint8_t, {STRATEGY_GENOME_COUNT * AGENT_TRAIT_COUNT * AGENT_TRAIT_COUNT}>("strategy_vectors", (child_row * {AGENT_TRAIT_COUNT}) + i)
+        );
     }}
+    FLAMEGPU->agent_out.setVariable<uint8_t>(
+        "agent_strategy_id",
+        FLAMEGPU->environment.getProperty<uint8_t, {STRATEGY_GENOME_COUNT * AGENT_TRAIT_COUNT}>("strategy_vector_ids", child_row)
+    );
 
     FLAMEGPU->agent_out.setVariable<unsigned int>("agent_status", {AGENT_STATUS_NEW_AGENT});
     uint8_t agents_spawned = FLAMEGPU->getVariable<uint8_t>("agents_spawned");
@@ -1370,6 +1740,106 @@ FLAMEGPU_AGENT_FUNCTION({CUDA_ENVIRONMENTAL_PUNISHMENT_NAME}, flamegpu::MessageN
 }}
 """
 
+# single pass over the population that accumulates all per-step statistics
+# into the stats_buffer macro property (read back once by the step function).
+CUDA_POPULATION_STATS_FUNCTION_NAME: str = "population_stats"
+CUDA_POPULATION_STATS_FUNCTION: str = rf"""
+{CUDA_GET_POP_INDEX_FUNCTION}
+FLAMEGPU_AGENT_FUNCTION({CUDA_POPULATION_STATS_FUNCTION_NAME}, flamegpu::MessageNone, flamegpu::MessageNone) {{
+    auto stats = FLAMEGPU->environment.getMacroProperty<double, {STATS_BUFFER_SIZE}>("stats_buffer");
+    const uint8_t strategy_id = FLAMEGPU->getVariable<uint8_t>("agent_strategy_id");
+    const unsigned int pop_index = {CUDA_GET_POP_INDEX_FUNCTION_NAME}(strategy_id / 10, strategy_id % 10);
+
+    // counts and births are needed every step
+    stats[{STATS_OFFSET_COUNT} + pop_index] += 1.0;
+    if (FLAMEGPU->getVariable<unsigned int>("agent_status") == {AGENT_STATUS_NEW_AGENT}) {{
+        stats[{STATS_OFFSET_BIRTHS} + pop_index] += 1.0;
+    }}
+
+    const unsigned int stats_every_n_steps = FLAMEGPU->environment.getProperty<unsigned int>("stats_every_n_steps");
+    if (FLAMEGPU->getStepCounter() % stats_every_n_steps != 0) {{
+        return flamegpu::ALIVE;
+    }}
+
+    const float energy = FLAMEGPU->getVariable<float>("energy");
+    const float max_energy = FLAMEGPU->environment.getProperty<float>("max_energy");
+    stats[{STATS_OFFSET_ENERGY_SUM} + pop_index] += (double)energy;
+    stats[{STATS_OFFSET_ENERGY_SUMSQ} + pop_index] += (double)energy * (double)energy;
+    int energy_bin = (int)(energy / max_energy * {STATS_ENERGY_BINS});
+    if (energy_bin < 0) {{
+        energy_bin = 0;
+    }} else if (energy_bin > {STATS_ENERGY_BINS} - 1) {{
+        energy_bin = {STATS_ENERGY_BINS} - 1;
+    }}
+    stats[{STATS_OFFSET_ENERGY_HIST} + pop_index * {STATS_ENERGY_BINS} + energy_bin] += 1.0;
+
+    uint8_t games_played = FLAMEGPU->getVariable<uint8_t>("games_played");
+    if (games_played > {SPACES_WITHIN_RADIUS}) {{
+        games_played = {SPACES_WITHIN_RADIUS};
+    }}
+    stats[{STATS_OFFSET_GAMES_PLAYED} + games_played] += 1.0;
+
+    const uint8_t move_result = FLAMEGPU->getVariable<uint8_t>("move_result");
+    if (move_result == {AGENT_MOVE_RESULT_MOVED}) {{
+        stats[{STATS_OFFSET_MOVED}] += 1.0;
+    }} else if (move_result == {AGENT_MOVE_RESULT_FAILED}) {{
+        stats[{STATS_OFFSET_MOVE_FAILED}] += 1.0;
+    }}
+    return flamegpu::ALIVE;
+}}
+"""
+
+
+# newborns of this step append themselves to the lineage_buffer macro property,
+# which the step function drains into the host LineageRecorder.
+CUDA_LINEAGE_RECORD_CONDITION_NAME: str = "lineage_record_condition"
+CUDA_LINEAGE_RECORD_CONDITION: str = rf"""
+FLAMEGPU_AGENT_FUNCTION_CONDITION({CUDA_LINEAGE_RECORD_CONDITION_NAME}) {{
+    return FLAMEGPU->getVariable<unsigned int>("agent_status") == {AGENT_STATUS_NEW_AGENT};
+}}
+"""
+CUDA_LINEAGE_RECORD_FUNCTION_NAME: str = "lineage_record"
+CUDA_LINEAGE_RECORD_FUNCTION: str = rf"""
+FLAMEGPU_AGENT_FUNCTION({CUDA_LINEAGE_RECORD_FUNCTION_NAME}, flamegpu::MessageNone, flamegpu::MessageNone) {{
+    auto lineage = FLAMEGPU->environment.getMacroProperty<unsigned int, {LINEAGE_BUFFER_SIZE}>("lineage_buffer");
+    auto lineage_count = FLAMEGPU->environment.getMacroProperty<unsigned int>("lineage_count");
+    const unsigned int slot = lineage_count++;
+    if (slot < {LINEAGE_BUFFER_CAPACITY}) {{
+        lineage[slot * 3 + 0].exchange(FLAMEGPU->getID());
+        lineage[slot * 3 + 1].exchange(FLAMEGPU->getVariable<flamegpu::id_t>("parent_id"));
+        lineage[slot * 3 + 2].exchange((unsigned int)FLAMEGPU->getVariable<uint8_t>("agent_strategy_id"));
+    }}
+    return flamegpu::ALIVE;
+}}
+"""
+
+
+# agents of the steps in SNAPSHOT_GRID_EVERY_N_STEPS append their cell,
+# agent_color and strategy id to the snapshot_cells macro property, which the
+# step function drains.
+CUDA_SNAPSHOT_GRID_CONDITION_NAME: str = "snapshot_grid_condition"
+CUDA_SNAPSHOT_GRID_CONDITION: str = rf"""
+FLAMEGPU_AGENT_FUNCTION_CONDITION({CUDA_SNAPSHOT_GRID_CONDITION_NAME}) {{
+    const unsigned int step = FLAMEGPU->getStepCounter();
+    return {" || ".join(f"step % {n} == 0" for n in SNAPSHOT_GRID_EVERY_N_STEPS) or "false"};
+}}
+"""
+CUDA_SNAPSHOT_GRID_FUNCTION_NAME: str = "snapshot_grid"
+CUDA_SNAPSHOT_GRID_FUNCTION: str = rf"""
+FLAMEGPU_AGENT_FUNCTION({CUDA_SNAPSHOT_GRID_FUNCTION_NAME}, flamegpu::MessageNone, flamegpu::MessageNone) {{
+    auto cells = FLAMEGPU->environment.getMacroProperty<unsigned int, {SNAPSHOT_GRID_CAPACITY}>("snapshot_cells");
+    auto cell_count = FLAMEGPU->environment.getMacroProperty<unsigned int>("snapshot_count");
+    const unsigned int slot = cell_count++;
+    if (slot < {SNAPSHOT_GRID_CAPACITY}) {{
+        const unsigned int cell = FLAMEGPU->getVariable<unsigned int>("x_a") * {ENV_MAX} + FLAMEGPU->getVariable<unsigned int>("y_a");
+        const unsigned int color = FLAMEGPU->getVariable<unsigned int>("agent_color") & {(1 << SNAPSHOT_COLOR_BITS) - 1}u;
+        const unsigned int strategy_id = FLAMEGPU->getVariable<uint8_t>("agent_strategy_id");
+        cells[slot].exchange(cell | (color << {SNAPSHOT_CELL_BITS}) | (strategy_id << {SNAPSHOT_CELL_BITS + SNAPSHOT_COLOR_BITS}));
+    }}
+    return flamegpu::ALIVE;
+}}
+"""
+
 
 def _print_prisoner_states(prisoner: pyflamegpu.HostAgentAPI) -> None:
     n_ready: int = prisoner.countUInt("agent_status", AGENT_STATUS_READY)
@@ -1402,38 +1872,485 @@ def _update_agent_count(FLAMEGPU, prisoner: pyflamegpu.HostAgentAPI) -> int:
     return overpopulated
 
 
+def _histogram_quantile(hist: List[float], q: float, upper: float) -> float:
+    # linear interpolation inside the bin that contains the q-th observation
+    total = sum(hist)
+    if total <= 0:
+        return 0.0
+    bin_width = upper / len(hist)
+    target = q * total
+    cumulative = 0.0
+    for i, n in enumerate(hist):
+        if n > 0 and cumulative + n >= target:
+            return (i + (target - cumulative) / n) * bin_width
+        cumulative += n
+    return upper
+
+
+def _update_population_stats(FLAMEGPU: pyflamegpu.HostAPI) -> None:
+    # one readback of the statistics buffer filled by population_stats
+    stats: pyflamegpu.HostMacroProperty_Double = (
+        FLAMEGPU.environment.getMacroPropertyDouble("stats_buffer")
+    )
+    buffer: List[float] = [stats[i].get() for i in range(STATS_BUFFER_SIZE)]
+    stats.zero()
+
+    step: int = FLAMEGPU.getStepCounter()
+    # births and deaths accumulate between samples
+    fresh: bool = (step - 1) % STATS_EVERY_N_STEPS == 0
+    for k in range(POPULATION_COUNT_BINS):
+        count = int(buffer[STATS_OFFSET_COUNT + k])
+        births = int(buffer[STATS_OFFSET_BIRTHS + k])
+        previous = FLAMEGPU.environment.getPropertyUInt("population_strat_count", k)
+        # strategies never change after birth, so the difference is deaths
+        deaths = max(previous + births - count, 0)
+        if not fresh:
+            births += FLAMEGPU.environment.getPropertyUInt("stats_births", k)
+            deaths += FLAMEGPU.environment.getPropertyUInt("stats_deaths", k)
+        FLAMEGPU.environment.setPropertyUInt("population_strat_count", k, count)
+        FLAMEGPU.environment.setPropertyUInt("stats_births", k, births)
+        FLAMEGPU.environment.setPropertyUInt("stats_deaths", k, deaths)
+
+    if step % STATS_EVERY_N_STEPS != 0:
+        return
+
+    FLAMEGPU.environment.setPropertyUInt("stats_step", step)
+    n_quantiles = len(STATS_ENERGY_QUANTILES)
+    for k in range(POPULATION_COUNT_BINS):
+        count = buffer[STATS_OFFSET_COUNT + k]
+        mean = buffer[STATS_OFFSET_ENERGY_SUM + k] / count if count else 0.0
+        var = (
+            max(buffer[STATS_OFFSET_ENERGY_SUMSQ + k] / count - mean * mean, 0.0)
+            if count
+            else 0.0
+        )
+        FLAMEGPU.environment.setPropertyFloat("stats_energy_mean", k, mean)
+        FLAMEGPU.environment.setPropertyFloat("stats_energy_var", k, var)
+        hist_start = STATS_OFFSET_ENERGY_HIST + k * STATS_ENERGY_BINS
+        hist = buffer[hist_start : hist_start + STATS_ENERGY_BINS]
+        for j, q in enumerate(STATS_ENERGY_QUANTILES):
+            FLAMEGPU.environment.setPropertyFloat(
+                "stats_energy_quantiles",
+                k * n_quantiles + j,
+                _histogram_quantile(hist, q, MAX_ENERGY),
+            )
+    for g in range(STATS_GAMES_PLAYED_BINS):
+        FLAMEGPU.environment.setPropertyUInt(
+            "stats_games_played", g, int(buffer[STATS_OFFSET_GAMES_PLAYED + g])
+        )
+    FLAMEGPU.environment.setPropertyUInt(
+        "stats_moved", int(buffer[STATS_OFFSET_MOVED])
+    )
+    FLAMEGPU.environment.setPropertyUInt(
+        "stats_move_failed", int(buffer[STATS_OFFSET_MOVE_FAILED])
+    )
+
+
+def _strategy_id_to_pop_index(strategy_id: int) -> int:
+    return (strategy_id // 10) * AGENT_STRATEGY_COUNT + strategy_id % 10
+
+
+# numpy dtypes for the host side copies of agent variables
+SNAPSHOT_DTYPES: dict = {
+    "UInt": np.uint32,
+    "UInt8": np.uint8,
+    "Float": np.float32,
+    "ID": np.uint32,
+    "ArrayUInt8": np.uint8,
+}
+
+
+def _population_snapshot(
+    prisoner: pyflamegpu.HostAgentAPI, variables: Dict[str, str]
+) -> Dict[str, np.ndarray]:
+    # host copy of the given agent variables, e.g. {"x_a": "UInt"}. One Python
+    # call per agent and variable, per step grids come from _drain_snapshot_grid
+    population: pyflamegpu.DeviceAgentVector = prisoner.getPopulationData()
+    columns: Dict[str, list] = {name: [] for name in variables}
+    for instance in population:
+        for name, var_type in variables.items():
+            columns[name].append(getattr(instance, f"getVariable{var_type}")(name))
+    return {
+        name: np.asarray(columns[name], dtype=SNAPSHOT_DTYPES[var_type])
+        for name, var_type in variables.items()
+    }
+
+
+def _drain_snapshot_grid(FLAMEGPU: pyflamegpu.HostAPI) -> np.ndarray:
+    # cells listed by snapshot_grid this step, (ENV_MAX, ENV_MAX) of
+    # agent_color | strategy id << SNAPSHOT_COLOR_BITS, -1 if unoccupied
+    cell_count: pyflamegpu.HostMacroProperty_UInt = (
+        FLAMEGPU.environment.getMacroPropertyUInt("snapshot_count")
+    )
+    count = min(int(cell_count.get()), SNAPSHOT_GRID_CAPACITY)
+    cell_count.set(0)
+    entries = _read_macro_property(
+        FLAMEGPU.environment.getMacroPropertyUInt("snapshot_cells"), count, np.uint32
+    )
+    grid = np.full(SNAPSHOT_GRID_CAPACITY, -1, dtype=np.int32)
+    grid[entries & ((1 << SNAPSHOT_CELL_BITS) - 1)] = entries >> SNAPSHOT_CELL_BITS
+    return grid.reshape(ENV_MAX, ENV_MAX)
+
+
+def _color_grid(cells: np.ndarray) -> np.ndarray:
+    # cell -> agent_color (EMPTY_CELL if unoccupied)
+    color = cells & ((1 << SNAPSHOT_COLOR_BITS) - 1)
+    return np.where(cells >= 0, color, EMPTY_CELL).astype(np.int16)
+
+
+def _strategy_grid(cells: np.ndarray) -> np.ndarray:
+    # cell -> agent_strategy_id (EMPTY_CELL if unoccupied)
+    return np.where(cells >= 0, cells >> SNAPSHOT_COLOR_BITS, EMPTY_CELL).astype(
+        np.int16
+    )
+
+
+# background writers, when OUTPUT_PIPELINE_WORKERS is set
+OUTPUT_PIPELINE: Optional[OutputPipeline] = None
+# live metrics server, when LIVE_METRICS_PORT is set
+LIVE_METRICS: Optional[MetricsServer] = None
+# headless frame writer, when RENDER_FRAMES_EVERY_N_STEPS is set
+FRAME_WRITER: Optional[FrameWriter] = None
+# birth records of a single run, when LINEAGE_RECORDING is set
+LINEAGE: Optional[LineageRecorder] = None
+# sampled game stream of a single run, when GAME_EVENTS_SAMPLE_RATE is set
+GAME_EVENTS: Optional[GameEventWriter] = None
+# finished sweep runs, when RUN_INDEX_FILE is set
+RUN_INDEX: Optional[RunIndex] = None
+# start time of every running sweep run, by fingerprint
+RUN_STARTED: Dict[int, float] = {}
+# compressed strategy count series, when COUNT_SERIES is set. Sweep runs each
+# have their own, by fingerprint
+COUNT_SERIES_WRITER: Optional[CountSeriesWriter] = None
+COUNT_SERIES_RUNS: Dict[int, CountSeriesWriter] = {}
+# population snapshot to start runs from, when WARM_START_FILE is set
+WARM_START: Optional[Dict[str, np.ndarray]] = None
+# agent variables of a warm start snapshot
+WARM_START_VARIABLES: Dict[str, str] = {
+    "x_a": "UInt",
+    "y_a": "UInt",
+    "energy": "Float",
+    "agent_trait": "UInt8",
+    "agent_strategies": "ArrayUInt8",
+    "agent_strategy_id": "UInt8",
+    "agent_strategy_genome": "UInt",
+}
+
+
+def load_warm_start(path: str) -> Dict[str, np.ndarray]:
+    agents, meta = read_snapshot(path)
+    check_snapshot(agents, ENV_MAX, AGENT_TRAIT_COUNT)
+    print(
+        f"Warm start from {path}: {agents['x_a'].size} agents "
+        f"after step {meta['step']}"
+    )
+    return agents
+
+
+def _snapshot_genomes(agents: Dict[str, np.ndarray]) -> np.ndarray:
+    # strategy genome of every snapshot agent, looked up by (trait, strategy
+    # vector) when the snapshot comes from a CPU engine
+    if "agent_strategy_genome" in agents:
+        return agents["agent_strategy_genome"].astype(np.int64)
+    place = AGENT_STRATEGY_COUNT ** np.arange(AGENT_TRAIT_COUNT, dtype=np.int64)
+    traits = np.arange(AGENT_TRAIT_COUNT)
+    # codes[genome * traits + trait]
+    vector_codes = (STRATEGY_TABLES["vectors"] * place).sum(axis=-1)
+    codes = (vector_codes * AGENT_TRAIT_COUNT + traits).ravel()
+    wanted = (agents["agent_strategies"] * place).sum(axis=-1)
+    wanted = wanted * AGENT_TRAIT_COUNT + agents["agent_trait"]
+    order = np.argsort(codes, kind="stable")
+    slot = order[np.minimum(np.searchsorted(codes, wanted, sorter=order), codes.size - 1)]
+    if np.any(codes[slot] != wanted):
+        raise ValueError("snapshot strategies do not match the strategy genomes")
+    return slot // AGENT_TRAIT_COUNT
+
+
+def _create_warm_start_agents(
+    agent: pyflamegpu.HostAgentAPI, pop_counts: np.ndarray
+) -> None:
+    # game memory is not restored, FLAMEGPU assigns new agent ids
+    snapshot = WARM_START
+    genomes = _snapshot_genomes(snapshot)
+    np.add.at(
+        pop_counts,
+        STRATEGY_TABLES["pop_index"][genomes, snapshot["agent_trait"]],
+        1,
+    )
+    for i in range(snapshot["x_a"].size):
+        instance: pyflamegpu.AgentInstance = agent.newAgent()
+        x = int(snapshot["x_a"][i])
+        y = int(snapshot["y_a"][i])
+        instance.setVariableUInt("x_a", x)
+        instance.setVariableUInt("y_a", y)
+        if USE_VISUALISATION:
+            instance.setVariableFloat("x", float(x))
+            instance.setVariableFloat("y", float(y))
+            if VISUALISATION_ORIENT_AGENTS:
+                instance.setVariableFloat("pitch", 0.0)
+        instance.setVariableFloat("energy", float(snapshot["energy"][i]))
+        agent_trait = int(snapshot["agent_trait"][i])
+        instance.setVariableUInt8("agent_trait", agent_trait)
+        instance.setVariableUInt("agent_color", agent_trait)
+        instance.setVariableUInt("agent_strategy_genome", int(genomes[i]))
+        instance.setVariableArrayUInt8(
+            "agent_strategies", snapshot["agent_strategies"][i].tolist()
+        )
+        instance.setVariableUInt8(
+            "agent_strategy_id", int(snapshot["agent_strategy_id"][i])
+        )
+
+
+def _count_series_writer(FLAMEGPU: pyflamegpu.HostAPI) -> Optional[CountSeriesWriter]:
+    if not MULTI_RUN:
+        return COUNT_SERIES_WRITER
+    fingerprint = FLAMEGPU.environment.getPropertyUInt64("run_fingerprint")
+    if fingerprint not in COUNT_SERIES_RUNS:
+        planned = SWEEP_PLANNED_RUNS.get(fingerprint)
+        if planned is None:
+            return None
+        COUNT_SERIES_RUNS[fingerprint] = CountSeriesWriter(
+            os.path.join(
+                SWEEP_OUTPUT_DIRECTORY,
+                planned["output_subdirectory"],
+                "population_strat_count.counts",
+            ),
+            POPULATION_COUNT_BINS,
+            COUNT_SERIES_BLOCK_STEPS,
+            OUTPUT_PIPELINE,
+        )
+    return COUNT_SERIES_RUNS[fingerprint]
+
+
+def _record_count_series(FLAMEGPU: pyflamegpu.HostAPI) -> None:
+    writer = _count_series_writer(FLAMEGPU)
+    if writer is not None:
+        writer.append(
+            FLAMEGPU.getStepCounter(),
+            FLAMEGPU.environment.getPropertyArrayUInt("population_strat_count"),
+        )
+
+
+def _perf_counters(FLAMEGPU: pyflamegpu.HostAPI) -> Dict[str, int]:
+    return dict(
+        zip(
+            PERF_COUNTER_NAMES,
+            FLAMEGPU.environment.getPropertyArrayUInt("perf_counters"),
+        )
+    )
+
+
+def _update_perf_counters(FLAMEGPU: pyflamegpu.HostAPI) -> None:
+    # one readback of the device counters of this step, the submodel
+    # iterations were already set by their exit conditions
+    buffer: pyflamegpu.HostMacroProperty_UInt = (
+        FLAMEGPU.environment.getMacroPropertyUInt("perf_counter_buffer")
+    )
+    for i in range(PERF_DEVICE_COUNTERS):
+        FLAMEGPU.environment.setPropertyUInt("perf_counters", i, buffer[i].get())
+    buffer.zero()
+    if VERBOSE_OUTPUT and FLAMEGPU.getStepCounter() % OUTPUT_EVERY_N_STEPS == 0:
+        print(
+            f"step {FLAMEGPU.getStepCounter()} perf: "
+            + ", ".join(f"{k} {v}" for k, v in _perf_counters(FLAMEGPU).items())
+        )
+
+
+def _publish_live_metrics(
+    FLAMEGPU: pyflamegpu.HostAPI, cells: Optional[np.ndarray]
+) -> None:
+    step = FLAMEGPU.getStepCounter()
+    prisoner = FLAMEGPU.agent("prisoner")
+    metrics = {"agent_count": prisoner.count()}
+    if POPULATION_STATS_ENABLED:
+        metrics["population_strat_count"] = list(
+            FLAMEGPU.environment.getPropertyArrayUInt("population_strat_count")
+        )
+    if PERF_COUNTERS:
+        metrics["perf_counters"] = _perf_counters(FLAMEGPU)
+    grid = None
+    if step % LIVE_METRICS_GRID_EVERY_N_STEPS == 0:
+        grid = _color_grid(cells)  # type: ignore
+    LIVE_METRICS.publish(step, metrics, grid)  # type: ignore
+
+
+def _read_macro_property(
+    macro_property, count: int, dtype: type
+) -> np.ndarray:
+    # the first count values of a macro property as one host array. pyflamegpu
+    # only reads macro properties element by element, one Python call a value
+    return np.fromiter(
+        (macro_property[i].get() for i in range(count)), dtype=dtype, count=count
+    )
+
+
+def _record_lineage(FLAMEGPU: pyflamegpu.HostAPI) -> None:
+    # drain this step's births from the device buffer into the recorder
+    lineage_count: pyflamegpu.HostMacroProperty_UInt = (
+        FLAMEGPU.environment.getMacroPropertyUInt("lineage_count")
+    )
+    births: int = lineage_count.get()
+    lineage_count.set(0)
+    if births > LINEAGE_BUFFER_CAPACITY:
+        print(
+            f"lineage: {births - LINEAGE_BUFFER_CAPACITY} births of step "
+            f"{FLAMEGPU.getStepCounter()} did not fit the device buffer"
+        )
+        births = LINEAGE_BUFFER_CAPACITY
+    if births == 0:
+        return
+    rows = _read_macro_property(
+        FLAMEGPU.environment.getMacroPropertyUInt("lineage_buffer"),
+        births * 3,
+        np.uint32,
+    ).reshape(births, 3)
+    LINEAGE.record(  # type: ignore
+        FLAMEGPU.getStepCounter(), rows[:, 0], rows[:, 1], rows[:, 2]
+    )
+
+
+def _record_game_events(FLAMEGPU: pyflamegpu.HostAPI) -> None:
+    # drain this step's sampled games from the device buffer
+    step: int = FLAMEGPU.getStepCounter()
+    FLAMEGPU.environment.setPropertyUInt("game_event_step", step + 1)
+    event_count: pyflamegpu.HostMacroProperty_UInt = (
+        FLAMEGPU.environment.getMacroPropertyUInt("game_event_count")
+    )
+    games: int = event_count.get()
+    event_count.set(0)
+    if games > GAME_EVENT_BUFFER_CAPACITY:
+        print(
+            f"game events: {games - GAME_EVENT_BUFFER_CAPACITY} sampled games of "
+            f"step {step} did not fit the device buffer"
+        )
+        games = GAME_EVENT_BUFFER_CAPACITY
+    if games == 0:
+        return
+    rows = _read_macro_property(
+        FLAMEGPU.environment.getMacroPropertyUInt("game_event_buffer"),
+        games * 3,
+        np.uint32,
+    ).reshape(games, 3)
+    flags = unpack_game_flags(rows[:, 2])
+    # payoffs follow from the actions (game events are single run only, so the
+    # payoffs are the configured ones)
+    payoffs = np.array(
+        [[PAYOFF_DD, PAYOFF_DC], [PAYOFF_CD, PAYOFF_CC]], dtype=np.float32
+    )
+    GAME_EVENTS.append(  # type: ignore
+        {
+            "step": step,
+            "challenger_id": rows[:, 0],
+            "responder_id": rows[:, 1],
+            **flags,
+            "challenger_payoff": payoffs[
+                flags["challenger_action"], flags["responder_action"]
+            ],
+            "responder_payoff": payoffs[
+                flags["responder_action"], flags["challenger_action"]
+            ],
+        }
+    )
+
+
+def _update_cluster_stats(FLAMEGPU: pyflamegpu.HostAPI, cells: np.ndarray) -> None:
+    summary = cluster_summary(_strategy_grid(cells), size_classes=CLUSTER_SIZE_CLASSES)
+    for k in range(POPULATION_COUNT_BINS):
+        FLAMEGPU.environment.setPropertyUInt("cluster_count", k, 0)
+        FLAMEGPU.environment.setPropertyUInt("cluster_largest", k, 0)
+        for j in range(CLUSTER_SIZE_CLASSES):
+            FLAMEGPU.environment.setPropertyUInt(
+                "cluster_size_classes", k * CLUSTER_SIZE_CLASSES + j, 0
+            )
+    for strategy_id, clusters in summary.items():
+        k = _strategy_id_to_pop_index(strategy_id)
+        FLAMEGPU.environment.setPropertyUInt(
+            "cluster_count", k, clusters["cluster_count"]
+        )
+        FLAMEGPU.environment.setPropertyUInt("cluster_largest", k, clusters["largest"])
+        for j, n in enumerate(clusters["size_classes"]):
+            FLAMEGPU.environment.setPropertyUInt(
+                "cluster_size_classes", k * CLUSTER_SIZE_CLASSES + j, int(n)
+            )
+
+
 class step_fn(pyflamegpu.HostFunction):
     def __init__(self):
         super().__init__()
 
     def run(self, FLAMEGPU: pyflamegpu.HostAPI):
-        if WRITE_LOG:
-            prisoner: pyflamegpu.HostAgentAPI = FLAMEGPU.agent("prisoner")
-            k = 0
-            for i in range(0, 40, 10):
-                for j in range(0, 4):
-                    strat_count = prisoner.countUInt8("agent_strategy_id", i + j)
-                    FLAMEGPU.environment.setPropertyUInt(
-                        "population_strat_count", k, strat_count
-                    )
-                    k += 1
+        step: int = FLAMEGPU.getStepCounter()
+        # the grid of the cluster analysis, frames and live metrics of this step
+        cells: Optional[np.ndarray] = None
+        if any(step % n == 0 for n in SNAPSHOT_GRID_EVERY_N_STEPS):
+            cells = _drain_snapshot_grid(FLAMEGPU)
+        if POPULATION_STATS_ENABLED:
+            _update_population_stats(FLAMEGPU)
+        if PERF_COUNTERS:
+            _update_perf_counters(FLAMEGPU)
+        if (
+            CLUSTER_ANALYSIS_EVERY_N_STEPS > 0
+            and step % CLUSTER_ANALYSIS_EVERY_N_STEPS == 0
+        ):
+            _update_cluster_stats(FLAMEGPU, cells)  # type: ignore
+        if LINEAGE is not None:
+            _record_lineage(FLAMEGPU)
+        if GAME_EVENTS is not None:
+            _record_game_events(FLAMEGPU)
+        if COUNT_SERIES and FLAMEGPU.getStepCounter() % OUTPUT_EVERY_N_STEPS == 0:
+            _record_count_series(FLAMEGPU)
+        if LIVE_METRICS is not None and not MULTI_RUN:
+            _publish_live_metrics(FLAMEGPU, cells)
+        if FRAME_WRITER is not None and FRAME_WRITER.wants(step):
+            FRAME_WRITER.submit(step, _color_grid(cells))  # type: ignore
 
 
 # set up population
 class init_fn(pyflamegpu.HostFunction):
     def run(self, FLAMEGPU: pyflamegpu.HostAPI):
-        agent_strat_per_trait = FLAMEGPU.environment.getPropertyUInt8(
-            "strategy_per_trait"
-        )
+        if MULTI_RUN:
+            fingerprint = FLAMEGPU.environment.getPropertyUInt64("run_fingerprint")
+            RUN_STARTED[fingerprint] = perf_counter()
         agent_strat_pure = FLAMEGPU.environment.getPropertyUInt8("strategy_pure")
+        genomes = range(STRATEGY_GENOME_COUNT)
+        weights = genome_weights(
+            STRATEGY_TABLES, AGENT_WEIGHTS, agent_strat_pure == 1
+        ).tolist()
+        vectors = STRATEGY_TABLES["vectors"]
+        strategy_ids = STRATEGY_TABLES["strategy_ids"]
+        pop_index = STRATEGY_TABLES["pop_index"]
 
         # FLAMEGPU.environment.setPropertyUInt("agent_count", INIT_AGENT_COUNT)
         agent: pyflamegpu.HostAgentAPI = FLAMEGPU.agent("prisoner")
         # randomly create starting position for agents
         import numpy as np
 
+        pop_counts = np.array(
+            FLAMEGPU.environment.getPropertyArrayUInt("population_strat_count"),
+            dtype=np.uint32,
+        )
+        if WARM_START is not None:
+            _create_warm_start_agents(agent, pop_counts)
+            FLAMEGPU.environment.setPropertyArrayUInt(
+                "population_strat_count", pop_counts.tolist()
+            )
+            return
         if RANDOM_SEED is not None:
             np.random.RandomState(RANDOM_SEED)
+        # sweep runs read their (possibly swept) initial energy from the
+        # environment (add_sweep_env_vars), single runs from the configuration
+        env = FLAMEGPU.environment
+        if MULTI_RUN:
+            energy_mu = env.getPropertyFloat("init_energy_mu")
+            energy_sigma = env.getPropertyFloat("init_energy_sigma")
+            energy_min = env.getPropertyFloat("init_energy_min")
+        else:
+            energy_mu, energy_sigma, energy_min = (
+                INIT_ENERGY_MU,
+                INIT_ENERGY_SIGMA,
+                INIT_ENERGY_MIN,
+            )
+        max_energy = env.getPropertyFloat("max_energy")
         # initialise grid with id for all possible agents
         grid = np.arange(MAX_AGENT_SPACES, dtype=np.uint32)
         # shuffle grid
@@ -1457,11 +2374,9 @@ class init_fn(pyflamegpu.HostFunction):
                 if VISUALISATION_ORIENT_AGENTS:
                     instance.setVariableFloat("pitch", 0.0)
 
-            energy = max(
-                random.normalvariate(INIT_ENERGY_MU, INIT_ENERGY_SIGMA), INIT_ENERGY_MIN
-            )
-            if MAX_ENERGY > 0.0:
-                energy = min(energy, MAX_ENERGY)
+            energy = max(random.normalvariate(energy_mu, energy_sigma), energy_min)
+            if max_energy > 0.0:
+                energy = min(energy, max_energy)
             instance.setVariableFloat("energy", energy)
             # select agent strategy
             agent_trait: int = random.choice(AGENT_TRAITS)
@@ -1469,73 +2384,99 @@ class init_fn(pyflamegpu.HostFunction):
             # this could be based on strategy, or change during runtime!
             instance.setVariableUInt("agent_color", agent_trait)
 
-            # select agent strategy
-            if agent_strat_pure == 1:
-                agent_strategies = (
-                    random.choices(AGENT_STRATEGY_IDS, weights=AGENT_WEIGHTS, k=1)
-                    * AGENT_TRAIT_COUNT
-                )
-            elif agent_strat_per_trait == 1:
-                # if we are using a per-trait strategy, then pick random weighted strategies
-                agent_strategies = random.choices(
-                    AGENT_STRATEGY_IDS, weights=AGENT_WEIGHTS, k=AGENT_TRAIT_COUNT
-                )
-            else:
-                # otherwise, we need a strategy for agents with matching traits
-                # and a second for agents with different traits
-                strategy_my: int
-                strategy_other: int
-                strategy_my, strategy_other = random.choices(
-                    AGENT_STRATEGY_IDS, weights=AGENT_WEIGHTS, k=2
-                )
-                agent_strategies: List[int] = []
-                trait: int
-                for i, trait in enumerate(AGENT_TRAITS):
-                    if trait == agent_trait:
-                        agent_strategies.append(strategy_my)
-                    else:
-                        agent_strategies.append(strategy_other)
-            instance.setVariableArrayUInt8("agent_strategies", agent_strategies)
-            strat_my: int = -1
-            strat_other: int = -1
-            for i, strat in enumerate(agent_strategies):
-                # update population counts of strategies
-                if strat_other < 0 and agent_trait != i:
-                    strat_other = strat
-                if strat_my < 0 and agent_trait == i:
-                    strat_my = strat
-                if strat_my >= 0 and strat_other >= 0:
-                    break
-            # convert "base 4" to base 10 for indexing
-            strategy_id = (strat_my * 10) + strat_other
-            idx = (strat_my * 4) + strat_other
-            # print(strat_my, strat_other, idx)
-            # print(type(idx))
-            # agent_pop_counts[idx] = int(agent_pop_counts[idx]) + 1
-            instance.setVariableUInt8("agent_strategy_id", strategy_id)
-
-            strat_count = FLAMEGPU.environment.getPropertyUInt(
-                "population_strat_count", idx
+            # select agent strategy vector, then gather everything else
+            genome: int = random.choices(genomes, weights=weights, k=1)[0]
+            instance.setVariableUInt("agent_strategy_genome", genome)
+            instance.setVariableArrayUInt8(
+                "agent_strategies", vectors[genome, agent_trait].tolist()
             )
-            FLAMEGPU.environment.setPropertyUInt(
-                "population_strat_count", idx, strat_count + 1
+            instance.setVariableUInt8(
+                "agent_strategy_id", int(strategy_ids[genome, agent_trait])
             )
+            pop_counts[pop_index[genome, agent_trait]] += 1
 
+        FLAMEGPU.environment.setPropertyArrayUInt(
+            "population_strat_count", pop_counts.tolist()
+        )
         del grid, np
 
 
+class AdaptiveIterationCap:
+    # how many iterations a submodel needs per step, learnt from the last
+    # ADAPTIVE_ITERATION_WINDOW steps. Exit conditions only count agent states
+    # from the estimate on and continue blindly before it: an iteration after
+    # convergence matches no agent function condition and changes nothing.
+    # With a fixed schedule every agent that is still busy after the first
+    # iteration needs all max_iterations, so only the first one is checked.
+    # The history is kept in the environment (iteration_history), so
+    # concurrent ensemble runs sharing the condition do not share it.
+    def __init__(self, submodel: str, max_iterations: int, fixed_schedule: bool = False):
+        self.index = ITERATION_SUBMODELS.index(submodel)
+        self.max_iterations = max_iterations
+        self.fixed_schedule = fixed_schedule
+
+    def estimate(self, FLAMEGPU: pyflamegpu.HostAPI) -> int:
+        if not ADAPTIVE_ITERATIONS or self.fixed_schedule:
+            return 1
+        env = FLAMEGPU.environment
+        fill = env.getPropertyUInt("iteration_history_fill", self.index)
+        if fill == 0:
+            return 1
+        window = env.getPropertyArrayUInt("iteration_history")
+        first = self.index * ADAPTIVE_ITERATION_WINDOW
+        return max(window[first : first + min(fill, ADAPTIVE_ITERATION_WINDOW)])
+
+    def should_check(self, FLAMEGPU: pyflamegpu.HostAPI, iteration: int) -> bool:
+        if not ADAPTIVE_ITERATIONS:
+            return True
+        if self.fixed_schedule:
+            return iteration == 1
+        return iteration >= self.estimate(FLAMEGPU)
+
+    def busy(self, FLAMEGPU: pyflamegpu.HostAPI) -> None:
+        # a check of this step found agents still busy
+        if ADAPTIVE_ITERATIONS:
+            FLAMEGPU.environment.setPropertyUInt("iteration_busy", self.index, 1)
+
+    def finished(self, FLAMEGPU: pyflamegpu.HostAPI, iterations: int) -> None:
+        estimate = self.estimate(FLAMEGPU)
+        if ADAPTIVE_ITERATIONS:
+            env = FLAMEGPU.environment
+            busy_seen = env.getPropertyUInt("iteration_busy", self.index)
+            if iterations > 1 and not busy_seen and iterations < self.max_iterations:
+                # done at the first check, it might have been done sooner, so
+                # try one less (a check that finds busy agents records the
+                # real count)
+                iterations_needed = iterations - 1
+            else:
+                iterations_needed = iterations
+            fill = env.getPropertyUInt("iteration_history_fill", self.index)
+            slot = fill % ADAPTIVE_ITERATION_WINDOW
+            slot += self.index * ADAPTIVE_ITERATION_WINDOW
+            env.setPropertyUInt("iteration_history", slot, iterations_needed)
+            env.setPropertyUInt("iteration_history_fill", self.index, fill + 1)
+            env.setPropertyUInt("iteration_busy", self.index, 0)
+        FLAMEGPU.environment.setPropertyUInt("iteration_estimates", self.index, estimate)
+        FLAMEGPU.environment.setPropertyUInt("iteration_counts", self.index, iterations)
+
+
 class exit_play_fn(pyflamegpu.HostCondition):
     iterations: int = 0
     max_iterations: int = SPACES_WITHIN_RADIUS
 
     def __init__(self):
         super().__init__()
+        self.cap = AdaptiveIterationCap(
+            "pdgame_model", self.max_iterations, fixed_schedule=True
+        )
 
     def run(self, FLAMEGPU: pyflamegpu.HostAPI):
         # print("play")
         self.iterations += 1
         prisoner: pyflamegpu.HostAgentAPI = FLAMEGPU.agent("prisoner")
         if self.iterations < self.max_iterations:
+            if not self.cap.should_check(FLAMEGPU, self.iterations):
+                return pyflamegpu.CONTINUE
             if VERBOSE_OUTPUT:
                 if FLAMEGPU.getStepCounter() % OUTPUT_EVERY_N_STEPS == 0:
                     print(
@@ -1550,7 +2491,13 @@ class exit_play_fn(pyflamegpu.HostCondition):
             if prisoner.countUInt(
                 "agent_status", AGENT_STATUS_READY_TO_CHALLENGE
             ) or prisoner.countUInt("agent_status", AGENT_STATUS_READY_TO_RESPOND):
+                self.cap.busy(FLAMEGPU)
                 return pyflamegpu.CONTINUE
+        self.cap.finished(FLAMEGPU, self.iterations)
+        if PERF_COUNTERS:
+            FLAMEGPU.environment.setPropertyUInt(
+                "perf_counters", PERF_COUNTER_PLAY_ITERATIONS, self.iterations
+            )
         self.iterations = 0
         _update_agent_count(FLAMEGPU, prisoner)
         return pyflamegpu.EXIT
@@ -1562,28 +2509,90 @@ class exit_move_fn(pyflamegpu.HostCondition):
 
     def __init__(self):
         super().__init__()
+        self.cap = AdaptiveIterationCap("movement_model", self.max_iterations)
 
     def run(self, FLAMEGPU: pyflamegpu.HostAPI):
         # print("move")
         self.iterations += 1
         prisoner: pyflamegpu.HostAgentAPI = FLAMEGPU.agent("prisoner")
         if self.iterations < self.max_iterations:
+            if not self.cap.should_check(FLAMEGPU, self.iterations):
+                return pyflamegpu.CONTINUE
             # Agent movements still unresolved
             if prisoner.countUInt("agent_status", AGENT_STATUS_MOVEMENT_UNRESOLVED):
+                self.cap.busy(FLAMEGPU)
                 return pyflamegpu.CONTINUE
         _update_agent_count(FLAMEGPU, prisoner)
+        self.cap.finished(FLAMEGPU, self.iterations)
+        if PERF_COUNTERS:
+            FLAMEGPU.environment.setPropertyUInt(
+                "perf_counters", PERF_COUNTER_MOVE_ITERATIONS, self.iterations
+            )
         self.iterations = 0
         return pyflamegpu.EXIT
 
 
+def _steady_state_reached(FLAMEGPU: pyflamegpu.HostAPI, counts: List[int]) -> bool:
+    # ring buffer of the last N strategy shares, kept in the environment so
+    # concurrent ensemble runs do not share it.
+    window_size = EARLY_STOP_STEADY_STATE_WINDOW
+    total = sum(counts)
+    shares = [c / total if total else 0.0 for c in counts]
+    window = list(FLAMEGPU.environment.getPropertyArrayFloat("strat_share_window"))
+    fill = FLAMEGPU.environment.getPropertyUInt("strat_share_window_fill")
+    slot = fill % window_size
+    window[slot * POPULATION_COUNT_BINS : (slot + 1) * POPULATION_COUNT_BINS] = shares
+    FLAMEGPU.environment.setPropertyArrayFloat("strat_share_window", window)
+    FLAMEGPU.environment.setPropertyUInt("strat_share_window_fill", fill + 1)
+    if fill + 1 < window_size:
+        return False
+    for k in range(POPULATION_COUNT_BINS):
+        history = window[k::POPULATION_COUNT_BINS]
+        if max(history) - min(history) >= EARLY_STOP_STEADY_STATE_EPSILON:
+            return False
+    return True
+
+
+def _mutation_rate(FLAMEGPU: pyflamegpu.HostAPI) -> float:
+    # sweeps declare mutation_rate on the parent environment
+    if MULTI_RUN:
+        return FLAMEGPU.environment.getPropertyFloat("mutation_rate")
+    return AGENT_TRAIT_MUTATION_RATE
+
+
+def _stop_reason(FLAMEGPU: pyflamegpu.HostAPI) -> int:
+    if not POPULATION_STATS_ENABLED:
+        prisoner: pyflamegpu.HostAgentAPI = FLAMEGPU.agent("prisoner")
+        return STOP_REASON_EXTINCT if prisoner.count() <= 0 else STOP_REASON_NONE
+    # counts were just updated by the step function
+    counts: List[int] = list(
+        FLAMEGPU.environment.getPropertyArrayUInt("population_strat_count")
+    )
+    strategies_alive = sum(1 for c in counts if c > 0)
+    if strategies_alive == 0:
+        return STOP_REASON_EXTINCT
+    if (
+        EARLY_STOP_EXTINCTION
+        and strategies_alive == 1
+        and _mutation_rate(FLAMEGPU) <= 0.0
+    ):
+        return STOP_REASON_FIXATION
+    if EARLY_STOP_STEADY_STATE_WINDOW > 0 and _steady_state_reached(
+        FLAMEGPU, counts
+    ):
+        return STOP_REASON_STEADY_STATE
+    return STOP_REASON_NONE
+
+
 class exit_condition_fn(pyflamegpu.HostCondition):
     def __init__(self):
         super().__init__()
 
     def run(self, FLAMEGPU: pyflamegpu.HostAPI):
-        prisoner: pyflamegpu.HostAgentAPI = FLAMEGPU.agent("prisoner")
-        n_agents = prisoner.count()
-        if n_agents <= 0:
+        stop_reason = _stop_reason(FLAMEGPU)
+        if stop_reason != STOP_REASON_NONE:
+            FLAMEGPU.environment.setPropertyUInt8("stop_reason", stop_reason)
+            FLAMEGPU.environment.setPropertyUInt("stop_step", FLAMEGPU.getStepCounter())
             return pyflamegpu.EXIT
         return pyflamegpu.CONTINUE
 
@@ -1610,69 +2619,50 @@ class exit_god_fn(pyflamegpu.HostCondition):
 
     def __init__(self):
         super().__init__()
+        self.cap = AdaptiveIterationCap("god_model", self.max_iterations)
 
     def run(self, FLAMEGPU: pyflamegpu.HostAPI):
         prisoner: pyflamegpu.HostAgentAPI = FLAMEGPU.agent("prisoner")
+        # the agent count is known on the host, overpopulation is always checked
         overpopulated = _update_agent_count(FLAMEGPU, prisoner)
         self.iterations += 1
-        if self.iterations < self.max_iterations:
+        if self.iterations < self.max_iterations and overpopulated < 1:
+            if not self.cap.should_check(FLAMEGPU, self.iterations):
+                return pyflamegpu.CONTINUE
             prisoner: pyflamegpu.HostAgentAPI = FLAMEGPU.agent("prisoner")
             # print(prisoner.count())
-            if (
-                prisoner.countUInt("agent_status", AGENT_STATUS_ATTEMPTING_REPRODUCTION)
-                and overpopulated < 1
+            if prisoner.countUInt(
+                "agent_status", AGENT_STATUS_ATTEMPTING_REPRODUCTION
             ):
+                self.cap.busy(FLAMEGPU)
                 return pyflamegpu.CONTINUE
+        self.cap.finished(FLAMEGPU, self.iterations)
+        if PERF_COUNTERS:
+            FLAMEGPU.environment.setPropertyUInt(
+                "perf_counters", PERF_COUNTER_GOD_ITERATIONS, self.iterations
+            )
         self.iterations = 0
         return pyflamegpu.EXIT
 
 
-def make_core_agent(model: pyflamegpu.ModelDescription) -> pyflamegpu.AgentDescription:
+def make_core_agent(
+    model: pyflamegpu.ModelDescription, model_name: str
+) -> pyflamegpu.AgentDescription:
+    # the prisoner agent with the variable groups of this (sub)model
     agent: pyflamegpu.AgentDescription = model.newAgent("prisoner")
-    agent.newVariableID("id")
-    # this is to hold a strategy per opponent trait
-    agent.newVariableUInt("x_a")
-    agent.newVariableUInt("y_a")
-    agent.newVariableFloat("energy")
-    agent.newVariableUInt("agent_status", AGENT_STATUS_READY)
-    agent.newVariableUInt8("agent_trait")
-    # this allows flexible setting of agent colors
-    agent.newVariableUInt("agent_color")
-    agent.newVariableArrayUInt8("agent_strategies", AGENT_TRAIT_COUNT)
-    agent.newVariableUInt8("agent_strategy_id", 0)
-    agent.newVariableArrayID(
-        "neighbour_list",
-        SPACES_WITHIN_RADIUS,
-        [pyflamegpu.ID_NOT_SET] * SPACES_WITHIN_RADIUS,
-    )
-    agent.newVariableArrayFloat(
-        "neighbour_rolls", SPACES_WITHIN_RADIUS, [0.0] * SPACES_WITHIN_RADIUS
-    )
-    # @TODO: flesh out? for now -1 = no neighbour, 0 = I respond, 1 = I challenge
-    agent.newVariableArrayInt8(
-        "my_actions", SPACES_WITHIN_RADIUS, [-1] * SPACES_WITHIN_RADIUS
-    )
-    agent.newVariableFloat("die_roll", 0.0)  # type: ignore
-    agent.newVariableUInt("my_bucket", 0)
-
-    if USE_VISUALISATION:
-        agent.newVariableFloat("x")
-        agent.newVariableFloat("y")
-        if VISUALISATION_ORIENT_AGENTS:
-            agent.newVariableFloat("pitch")
-
+    declare_agent(
+        agent, model_variables(AGENT_SCHEMA, AGENT_MODEL_GROUPS[model_name])
+    )
     return agent
 
 
-def add_agent_memory(agent: pyflamegpu.AgentDescription):
-    agent.newVariableArrayID(
-        "game_memory",
-        SPACES_WITHIN_RADIUS,
-        [pyflamegpu.ID_NOT_SET] * SPACES_WITHIN_RADIUS,
-    )
-    agent.newVariableArrayUInt8(
-        "game_memory_choices", SPACES_WITHIN_RADIUS, [0] * SPACES_WITHIN_RADIUS
-    )
+def make_message(
+    model: pyflamegpu.ModelDescription, name: str
+) -> pyflamegpu.MessageBucket_Description:
+    message: pyflamegpu.MessageBucket_Description = model.newMessageBucket(name)
+    declare_message(message, MESSAGE_SCHEMA[name])
+    message.setBounds(0, BUCKET_SIZE)
+    return message
 
 
 def add_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
@@ -1687,15 +2677,6 @@ def add_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
     env.newPropertyUInt8("strategy_pure", 1 if AGENT_STRATEGY_PURE else 0, isConst=True)
 
 
-def add_pdgame_vars(agent: pyflamegpu.AgentDescription) -> None:
-    # add variable for tracking which neighbour is the target
-    agent.newVariableUInt8("challenge_sequence", 0)
-    agent.newVariableUInt8("response_sequence", SPACES_WITHIN_RADIUS)
-    agent.newVariableUInt8("round_resolved", 0)
-    agent.newVariableUInt8("games_played", 0)
-    add_agent_memory(agent)
-
-
 def add_pdgame_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
     env.newPropertyFloat("payoff_cc", PAYOFF_CC, isConst=True)
     env.newPropertyFloat("payoff_cd", PAYOFF_CD, isConst=True)
@@ -1705,10 +2686,45 @@ def add_pdgame_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
     env.newPropertyFloat("max_energy", MAX_ENERGY, isConst=True)
 
 
-def add_movement_vars(agent: pyflamegpu.AgentDescription) -> None:
-    agent.newVariableUInt("last_move_attempt", SPACES_WITHIN_RADIUS_INCL)
-    agent.newVariableUInt("request_bucket", 0)
-    agent.newVariableUInt("move_sequence", 0)
+def add_game_event_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
+    env.newPropertyFloat("game_event_sample_rate", GAME_EVENTS_SAMPLE_RATE, isConst=True)
+    env.newPropertyUInt("game_event_step", 0)
+    env.newMacroPropertyUInt("game_event_buffer", GAME_EVENT_BUFFER_CAPACITY * 3)
+    env.newMacroPropertyUInt("game_event_count")
+
+
+def add_iteration_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
+    env.newPropertyArrayUInt("iteration_estimates", [0] * len(ITERATION_SUBMODELS))
+    env.newPropertyArrayUInt("iteration_counts", [0] * len(ITERATION_SUBMODELS))
+    if ADAPTIVE_ITERATIONS:
+        # AdaptiveIterationCap: ring buffer of iterations needed per submodel
+        env.newPropertyArrayUInt(
+            "iteration_history",
+            [0] * (len(ITERATION_SUBMODELS) * ADAPTIVE_ITERATION_WINDOW),
+        )
+        for name in ("iteration_history_fill", "iteration_busy"):
+            env.newPropertyArrayUInt(name, [0] * len(ITERATION_SUBMODELS))
+
+
+def map_iteration_properties(submodel: pyflamegpu.SubModelDescription) -> None:
+    subenv: pyflamegpu.SubEnvironmentDescription = submodel.SubEnvironment()
+    subenv.mapProperty("iteration_estimates", "iteration_estimates")
+    subenv.mapProperty("iteration_counts", "iteration_counts")
+    if ADAPTIVE_ITERATIONS:
+        for name in ("iteration_history", "iteration_history_fill", "iteration_busy"):
+            subenv.mapProperty(name, name)
+
+
+def add_perf_counter_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
+    env.newPropertyArrayUInt("perf_counters", [0] * len(PERF_COUNTER_NAMES))
+    env.newMacroPropertyUInt("perf_counter_buffer", PERF_DEVICE_COUNTERS)
+
+
+def map_perf_counters(submodel: pyflamegpu.SubModelDescription) -> None:
+    # submodels count into the buffer of the parent, drained by the step function
+    subenv: pyflamegpu.SubEnvironmentDescription = submodel.SubEnvironment()
+    subenv.mapProperty("perf_counters", "perf_counters")
+    subenv.mapMacroProperty("perf_counter_buffer", "perf_counter_buffer")
 
 
 def add_movement_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
@@ -1716,13 +2732,6 @@ def add_movement_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
     env.newPropertyFloat("travel_cost", AGENT_TRAVEL_COST, isConst=True)
 
 
-def add_god_vars(agent: pyflamegpu.AgentDescription) -> None:
-    agent.newVariableUInt("request_bucket", 0)
-    agent.newVariableUInt("last_reproduction_attempt", SPACES_WITHIN_RADIUS_INCL)
-    agent.newVariableUInt("reproduce_sequence", 0)
-    agent.newVariableUInt8("agents_spawned", 0)
-
-
 def add_neighbourhood_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
     env.newPropertyFloat("reproduce_min_energy", REPRODUCE_MIN_ENERGY, isConst=True)
 
@@ -1741,6 +2750,44 @@ def add_god_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
     )
     env.newPropertyUInt8("max_children_per_step", MAX_CHILDREN_PER_STEP, isConst=True)
     env.newPropertyUInt("max_agents", AGENT_HARD_LIMIT, isConst=True)
+    # strategy vector lookup tables, flattened row major
+    env.newPropertyArrayUInt8(
+        "strategy_vectors",
+        STRATEGY_TABLES["vectors"].ravel().tolist(),
+        isConst=True,
+    )
+    env.newPropertyArrayUInt8(
+        "strategy_vector_ids",
+        STRATEGY_TABLES["strategy_ids"].ravel().tolist(),
+        isConst=True,
+    )
+    env.newPropertyArrayUInt8(
+        "strategy_mutations",
+        (STRATEGY_TABLES["mutations"].ravel().tolist() or [0]),
+        isConst=True,
+    )
+
+
+def add_stats_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
+    env.newPropertyUInt("stats_every_n_steps", STATS_EVERY_N_STEPS, isConst=True)
+    env.newMacroPropertyDouble("stats_buffer", STATS_BUFFER_SIZE)
+    env.newPropertyUInt("stats_step", 0)
+    env.newPropertyArrayFloat("stats_energy_mean", [0.0] * POPULATION_COUNT_BINS)
+    env.newPropertyArrayFloat("stats_energy_var", [0.0] * POPULATION_COUNT_BINS)
+    env.newPropertyArrayFloat(
+        "stats_energy_quantiles",
+        [0.0] * (POPULATION_COUNT_BINS * len(STATS_ENERGY_QUANTILES)),
+    )
+    env.newPropertyArrayUInt("stats_games_played", [0] * STATS_GAMES_PLAYED_BINS)
+    env.newPropertyUInt("stats_moved", 0)
+    env.newPropertyUInt("stats_move_failed", 0)
+    env.newPropertyArrayUInt("stats_births", [0] * POPULATION_COUNT_BINS)
+    env.newPropertyArrayUInt("stats_deaths", [0] * POPULATION_COUNT_BINS)
+    env.newPropertyArrayUInt("cluster_count", [0] * POPULATION_COUNT_BINS)
+    env.newPropertyArrayUInt("cluster_largest", [0] * POPULATION_COUNT_BINS)
+    env.newPropertyArrayUInt(
+        "cluster_size_classes", [0] * (POPULATION_COUNT_BINS * CLUSTER_SIZE_CLASSES)
+    )
 
 
 def _print_environment_properties() -> None:
@@ -1802,7 +2849,7 @@ def configure_ensemble(
     model: pyflamegpu.ModelDescription, argv: list[str]
 ) -> pyflamegpu.CUDAEnsemble:
     ensemble: pyflamegpu.CUDAEnsemble = pyflamegpu.CUDAEnsemble(model)
-    ensemble.Config().out_directory = "data"
+    ensemble.Config().out_directory = SWEEP_OUTPUT_DIRECTORY
     ensemble.Config().out_format = "json"
 
     ensemble.initialise(argv)
@@ -1810,36 +2857,728 @@ def configure_ensemble(
     return ensemble
 
 
-def configure_runplan(model: pyflamegpu.ModelDescription) -> pyflamegpu.RunPlanVector:
-    # How man initial runs for each
-    runs_control: pyflamegpu.RunPlanVector = pyflamegpu.RunPlanVector(
-        model, MULTI_RUN_COUNT
-    )
-    if RANDOM_SEED:
-        # increment random seed by one each time
-        runs_control.setRandomSimulationSeed(RANDOM_SEED, 1)
-        # so all props for this run get the same seed if dists etc.
-        runs_control.setRandomPropertySeed(RANDOM_SEED)
-    runs_control.setSteps(MULTI_RUN_STEPS)
-    runs: pyflamegpu.RunPlanVector = pyflamegpu.RunPlanVector(model, 0)
-    # Initialise environment property 'lerp_float' with values uniformly distributed between 1 and 128
-    # runs_control.setPropertyUniformDistributionFloat("lerp_float", 1.0, 128.0)
-    for pure_stategy in [0, 1]:
-        # [0, 0.1, 1, 2, 5]
-        for cost_of_living in [0.1, 0.3, 1, 2 / 3, 1.5, 1.666]:
-            runs_control.setOutputSubdirectory(
-                "pure%g_env_cost%g_%g_steps"
-                % (pure_stategy, cost_of_living, MULTI_RUN_STEPS)
+# model settings that are not swept but change the outcome of a run
+def _sweep_base_config() -> dict:
+    return {
+        "max_agent_spaces": MAX_AGENT_SPACES,
+        "init_agent_count": INIT_AGENT_COUNT,
+        "agent_hard_limit": AGENT_HARD_LIMIT,
+        "payoff_cc": PAYOFF_CC,
+        "payoff_cd": PAYOFF_CD,
+        "payoff_dc": PAYOFF_DC,
+        "payoff_dd": PAYOFF_DD,
+        "env_noise": ENV_NOISE,
+        "reproduce_min_energy": REPRODUCE_MIN_ENERGY,
+        "reproduce_cost": REPRODUCE_COST,
+        "reproduction_inheritence": REPRODUCTION_INHERITENCE,
+        "max_children_per_step": MAX_CHILDREN_PER_STEP,
+        "max_energy": MAX_ENERGY,
+        "init_energy_mu": INIT_ENERGY_MU,
+        "init_energy_sigma": INIT_ENERGY_SIGMA,
+        "init_energy_min": INIT_ENERGY_MIN,
+        "mutation_rate": AGENT_TRAIT_MUTATION_RATE,
+        "strategy_per_trait": 1 if AGENT_STRATEGY_PER_TRAIT else 0,
+        "agent_weights": AGENT_WEIGHTS,
+        "agent_trait_count": AGENT_TRAIT_COUNT,
+    }
+
+
+def _run_fingerprint(config: dict, seed: int, steps: int) -> int:
+    # stable 64 bit id of a run, independent of its position in the plan
+    payload = json.dumps(
+        {"config": config, "seed": seed, "steps": steps}, sort_keys=True
+    )
+    return int.from_bytes(hashlib.sha1(payload.encode()).digest()[:8], "little")
+
+
+# runs in the current plan, fingerprint -> manifest record
+SWEEP_PLANNED_RUNS: Dict[int, dict] = {}
+SWEEP_MANIFEST_LOCK: threading.Lock = threading.Lock()
+
+
+def load_sweep_manifest(manifest_file: str) -> Dict[int, dict]:
+    completed: Dict[int, dict] = {}
+    if not os.path.exists(manifest_file):
+        return completed
+    with open(manifest_file, "r") as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a partially written last line from a killed sweep
+                continue
+            completed[int(record["fingerprint"])] = record
+    return completed
+
+
+def _run_output_exists(output_subdirectory: str) -> bool:
+    run_dir = os.path.join(SWEEP_OUTPUT_DIRECTORY, output_subdirectory)
+    return os.path.isdir(run_dir) and len(os.listdir(run_dir)) > 0
+
+
+def _record_completed_run(
+    fingerprint: int,
+    steps_completed: int,
+    result: Optional[dict] = None,
+) -> None:
+    # planned runs are dropped once recorded, so a long sweep stays bounded
+    record = dict(SWEEP_PLANNED_RUNS.pop(fingerprint, {}))
+    record["fingerprint"] = fingerprint
+    record["steps_completed"] = steps_completed
+    if OUTPUT_PIPELINE is None:
+        _write_run_record(fingerprint, record, result)
+    else:
+        OUTPUT_PIPELINE.submit(
+            "run_records", _write_run_record, fingerprint, record, result
+        )
+
+
+def _write_run_record(fingerprint: int, record: dict, result: Optional[dict]) -> None:
+    with SWEEP_MANIFEST_LOCK:
+        os.makedirs(os.path.dirname(SWEEP_MANIFEST_FILE) or ".", exist_ok=True)
+        with open(SWEEP_MANIFEST_FILE, "a") as manifest:
+            manifest.write(json.dumps(record) + "\n")
+    if RUN_INDEX is not None:
+        result = dict(result or {})
+        counts = result.pop("population_strat_count", None)
+        RUN_INDEX.insert(fingerprint, dict(record, **result), counts)
+
+
+class exit_fn(pyflamegpu.HostFunction):
+    def __init__(self):
+        super().__init__()
+
+    def run(self, FLAMEGPU: pyflamegpu.HostAPI):
+        if not MULTI_RUN and WARM_START_SAVE_FILE:
+            snapshot = (
+                WARM_START_SAVE_FILE,
+                _population_snapshot(FLAMEGPU.agent("prisoner"), WARM_START_VARIABLES),
+                FLAMEGPU.getStepCounter(),
+                batch_environment(),
+            )
+            if OUTPUT_PIPELINE is None:
+                write_snapshot(*snapshot)
+            else:
+                OUTPUT_PIPELINE.submit(WARM_START_SAVE_FILE, write_snapshot, *snapshot)
+            print(f"Population snapshot of step {snapshot[2]} saved to {snapshot[0]}")
+        if MULTI_RUN:
+            fingerprint = FLAMEGPU.environment.getPropertyUInt64("run_fingerprint")
+            started = RUN_STARTED.pop(fingerprint, None)
+            series = COUNT_SERIES_RUNS.pop(fingerprint, None)
+            if series is not None:
+                series.close()
+            _record_completed_run(
+                fingerprint,
+                FLAMEGPU.getStepCounter(),
+                {
+                    "runtime_seconds": (
+                        perf_counter() - started if started is not None else None
+                    ),
+                    "stop_reason": FLAMEGPU.environment.getPropertyUInt8(
+                        "stop_reason"
+                    ),
+                    "stop_step": FLAMEGPU.environment.getPropertyUInt("stop_step"),
+                    "agent_count": FLAMEGPU.agent("prisoner").count(),
+                    "population_strat_count": FLAMEGPU.environment.getPropertyArrayUInt(
+                        "population_strat_count"
+                    ),
+                },
+            )
+
+
+# env properties a sweep can vary -> (RunPlan property type, submodels that
+# read it). When MULTI_RUN they are declared on the parent model and mapped
+# into those submodels, so a RunPlan value reaches every kernel.
+SWEEP_PROPERTIES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "strategy_pure": (
+        "UInt8",
+        ("pdgame_model", "movement_model", "neighbourhood_model", "god_model"),
+    ),
+    "env_noise": (
+        "Float",
+        ("pdgame_model", "movement_model", "neighbourhood_model", "god_model"),
+    ),
+    "cost_of_living": ("Float", ("god_model",)),
+    "travel_cost": ("Float", ("movement_model",)),
+    "payoff_cc": ("Float", ("pdgame_model",)),
+    "payoff_cd": ("Float", ("pdgame_model",)),
+    "payoff_dc": ("Float", ("pdgame_model",)),
+    "payoff_dd": ("Float", ("pdgame_model",)),
+    "max_energy": ("Float", ("pdgame_model", "god_model")),
+    "reproduce_cost": ("Float", ("god_model",)),
+    "reproduce_min_energy": ("Float", ("neighbourhood_model", "god_model")),
+    "reproduction_inheritence": ("Float", ("god_model",)),
+    "mutation_rate": ("Float", ("god_model",)),
+    "init_energy_mu": ("Float", ("god_model",)),
+    "init_energy_sigma": ("Float", ("god_model",)),
+    "init_energy_min": ("Float", ("god_model",)),
+    "max_children_per_step": ("UInt8", ("god_model",)),
+}
+# sweep properties that add_env_vars and main already declare on the parent
+PARENT_SWEEP_PROPERTIES: Tuple[str, ...] = (
+    "strategy_pure",
+    "env_noise",
+    "cost_of_living",
+    "travel_cost",
+    "max_energy",
+)
+
+
+def _check_sweep_properties(names: List[str]) -> None:
+    unknown = [name for name in names if name not in SWEEP_PROPERTIES]
+    if unknown:
+        raise ValueError(f"cannot sweep {unknown}, see SWEEP_PROPERTIES")
+
+
+def sweep_spec() -> SweepSpec:
+    _check_sweep_properties(list(SWEEP_PARAMETERS))
+    return SweepSpec(SWEEP_PARAMETERS, SWEEP_METHOD, SWEEP_SAMPLES, RANDOM_SEED)
+
+
+def sensitivity_design() -> SaltelliDesign:
+    _check_sweep_properties(list(SENSITIVITY_PARAMETERS))
+    return SaltelliDesign(SENSITIVITY_PARAMETERS, SENSITIVITY_BASE_SAMPLES)
+
+
+def add_sweep_env_vars(env: pyflamegpu.EnvironmentDescription) -> None:
+    base_config = _sweep_base_config()
+    for name, (kind, _) in SWEEP_PROPERTIES.items():
+        if name not in PARENT_SWEEP_PROPERTIES:
+            getattr(env, f"newProperty{kind}")(name, base_config[name], isConst=True)
+
+
+def map_sweep_properties(
+    submodel: pyflamegpu.SubModelDescription, submodel_name: str
+) -> None:
+    subenv: pyflamegpu.SubEnvironmentDescription = submodel.SubEnvironment()
+    for name, (_, submodels) in SWEEP_PROPERTIES.items():
+        if submodel_name in submodels:
+            subenv.mapProperty(name, name)
+
+
+# the full configuration of a sweep point, as recorded in the manifest
+def _sweep_point_config(base_config: dict, point: dict) -> dict:
+    config = dict(
+        base_config,
+        strategy_pure=1 if AGENT_STRATEGY_PURE else 0,
+        cost_of_living=COST_OF_LIVING,
+        travel_cost=AGENT_TRAVEL_COST,
+    )
+    config.update(point)
+    if "travel_cost" not in point:
+        config["travel_cost"] = config["cost_of_living"] / 2
+    return config
+
+
+def _sweep_base_seed(completed: Dict[int, dict]) -> int:
+    if completed:
+        # resuming, so keep the seeds of the original sweep
+        return list(completed.values())[-1].get("base_seed", RANDOM_SEED)
+    return RANDOM_SEED
+
+
+# (fingerprint, output subdirectory) of a run
+def _run_identity(config: dict, seed: int) -> Tuple[int, str]:
+    fingerprint = _run_fingerprint(config, seed, MULTI_RUN_STEPS)
+    # one directory per run, ensemble logs are named by plan index
+    output_subdirectory = "pure%g_env_cost%g_%g_steps/%016x" % (
+        config["strategy_pure"],
+        config["cost_of_living"],
+        MULTI_RUN_STEPS,
+        fingerprint,
+    )
+    return fingerprint, output_subdirectory
+
+
+# every run of the sweep that has not completed yet, as manifest records.
+# Runs are generated lazily, in sweep order, MULTI_RUN_COUNT seeds per point.
+def _plan_sweep_runs() -> Iterator[dict]:
+    spec = sensitivity_design() if SENSITIVITY_ANALYSIS else sweep_spec()
+    completed: Dict[int, dict] = (
+        load_sweep_manifest(SWEEP_MANIFEST_FILE) if SWEEP_RESUME else {}
+    )
+    base_seed = _sweep_base_seed(completed)
+    if completed:
+        # the Saltelli design is deterministic, only sweep specs have a seed
+        if not SENSITIVITY_ANALYSIS:
+            spec.seed = base_seed
+        print(f"Resuming sweep from {SWEEP_MANIFEST_FILE} (base seed {base_seed})")
+    print(
+        f"Sweep of {len(spec)} {spec.method} points x {MULTI_RUN_COUNT} runs"
+        f" over {', '.join(spec.names)}"
+    )
+    base_config = _sweep_base_config()
+    skipped = 0
+    for point in spec:
+        config = _sweep_point_config(base_config, point)
+        for i in range(MULTI_RUN_COUNT):
+            # increment random seed by one each time
+            seed = base_seed + i
+            fingerprint, output_subdirectory = _run_identity(config, seed)
+            if fingerprint in completed and _run_output_exists(output_subdirectory):
+                skipped += 1
+                continue
+            if fingerprint in SWEEP_PLANNED_RUNS:
+                # the same point twice in one sweep, run it once
+                continue
+            SWEEP_PLANNED_RUNS[fingerprint] = {
+                "base_seed": base_seed,
+                "random_seed": seed,
+                "steps": MULTI_RUN_STEPS,
+                "output_subdirectory": output_subdirectory,
+                "config": config,
+            }
+            yield dict(SWEEP_PLANNED_RUNS[fingerprint], fingerprint=fingerprint)
+    if skipped:
+        print(f"Skipped {skipped} runs that already completed")
+
+
+# Sobol indices of the completed sensitivity design, from the run logs
+def report_sensitivity() -> None:
+    design = sensitivity_design()
+    base_seed = _sweep_base_seed(load_sweep_manifest(SWEEP_MANIFEST_FILE))
+    base_config = _sweep_base_config()
+    # mean outputs over the replicates of each design point, None if no results
+    rows: List[Optional[Dict[str, float]]] = []
+    for point in design:
+        config = _sweep_point_config(base_config, point)
+        replicates: List[Dict[str, float]] = []
+        for i in range(MULTI_RUN_COUNT):
+            _, output_subdirectory = _run_identity(config, base_seed + i)
+            state = final_state(
+                os.path.join(SWEEP_OUTPUT_DIRECTORY, output_subdirectory)
+            )
+            if state is not None:
+                replicates.append(run_outputs(*state, list(AGENT_STRATEGIES)))
+        rows.append(
+            {name: float(np.mean([r[name] for r in replicates])) for name in replicates[0]}
+            if replicates
+            else None
+        )
+    missing = sum(row is None for row in rows)
+    if missing:
+        print(f"{missing} of {len(design)} design points have no results")
+    indices = {
+        name: sobol_indices(
+            np.array([row[name] if row else np.nan for row in rows]),
+            len(design.names),
+            SENSITIVITY_BOOTSTRAP,
+            base_seed,
+        )
+        for name in next((row for row in rows if row), {})
+    }
+    print(format_indices(design.names, indices))
+    os.makedirs(os.path.dirname(SENSITIVITY_OUTPUT_FILE) or ".", exist_ok=True)
+    with open(SENSITIVITY_OUTPUT_FILE, "w") as output_file:
+        json.dump(
+            {
+                "parameters": SENSITIVITY_PARAMETERS,
+                "base_samples": SENSITIVITY_BASE_SAMPLES,
+                "runs_per_point": MULTI_RUN_COUNT,
+                "steps": MULTI_RUN_STEPS,
+                "indices": {
+                    output: {key: value.tolist() for key, value in result.items()}
+                    for output, result in indices.items()
+                },
+            },
+            output_file,
+            indent=2,
+        )
+
+
+def _run_plan(model: pyflamegpu.ModelDescription, planned: dict) -> pyflamegpu.RunPlan:
+    config = planned["config"]
+    run: pyflamegpu.RunPlan = pyflamegpu.RunPlan(model)
+    run.setRandomSimulationSeed(planned["random_seed"])
+    run.setSteps(planned["steps"])
+    run.setOutputSubdirectory(planned["output_subdirectory"])
+    for name, (kind, _) in SWEEP_PROPERTIES.items():
+        value = config[name]
+        if kind == "UInt8":
+            value = int(round(value))
+        getattr(run, f"setProperty{kind}")(name, value)
+    run.setPropertyUInt64("run_fingerprint", planned["fingerprint"])
+    return run
+
+
+# RunPlanVectors of at most SWEEP_CHUNK_SIZE runs, built as the ensemble asks
+def configure_runplans(
+    model: pyflamegpu.ModelDescription,
+) -> Iterator[pyflamegpu.RunPlanVector]:
+    for chunk in chunked(_plan_sweep_runs(), SWEEP_CHUNK_SIZE):
+        runs: pyflamegpu.RunPlanVector = pyflamegpu.RunPlanVector(model, 0)
+        for planned in chunk:
+            runs += _run_plan(model, planned)
+        yield runs
+
+
+# environment of the batched CPU engine, from the configuration above
+def batch_environment() -> dict:
+    return {
+        "env_max": ENV_MAX,
+        "init_agent_count": INIT_AGENT_COUNT,
+        "max_agents": AGENT_HARD_LIMIT,
+        "cost_of_living": COST_OF_LIVING,
+        "travel_cost": AGENT_TRAVEL_COST,
+        "reproduce_min_energy": REPRODUCE_MIN_ENERGY,
+        "reproduce_cost": REPRODUCE_COST,
+        "reproduction_inheritence": REPRODUCTION_INHERITENCE,
+        "max_children_per_step": MAX_CHILDREN_PER_STEP,
+        "payoff_cc": PAYOFF_CC,
+        "payoff_dc": PAYOFF_DC,
+        "payoff_cd": PAYOFF_CD,
+        "payoff_dd": PAYOFF_DD,
+        "max_energy": MAX_ENERGY,
+        "init_energy_mu": INIT_ENERGY_MU,
+        "init_energy_sigma": INIT_ENERGY_SIGMA,
+        "init_energy_min": INIT_ENERGY_MIN,
+        "env_noise": ENV_NOISE,
+        "mutation_rate": AGENT_TRAIT_MUTATION_RATE,
+        "strategy_pure": 1 if AGENT_STRATEGY_PURE else 0,
+        "strategy_per_trait": 1 if AGENT_STRATEGY_PER_TRAIT else 0,
+        "agent_trait_count": AGENT_TRAIT_COUNT,
+        "agent_strategy_weights": AGENT_WEIGHTS,
+    }
+
+
+def _publish_batch_metrics(batch: BatchSimulation) -> None:
+    grid = None
+    if batch.step_counter % LIVE_METRICS_GRID_EVERY_N_STEPS == 0:
+        grid = batch.snapshot_grid(0, "agent_trait")
+    LIVE_METRICS.publish(  # type: ignore
+        batch.step_counter,
+        {
+            "agent_count": batch.agent_count,
+            "replicate_agent_count": batch.population_strat_count.sum(axis=1),
+            "population_strat_count": batch.population_strat_count.sum(axis=0),
+            "phase_seconds": {
+                phase: seconds
+                for phase, seconds in batch.telemetry.items()
+                if phase in ("play", "move", "reproduce", "punish")
+            },
+            "perf_counters": {
+                name: batch.telemetry[name] for name in PERF_COUNTER_NAMES
+            },
+        },
+        grid,
+    )
+
+
+# run the sweep on the batched CPU engine, BATCH_REPLICATES runs at a time
+def run_batched_sweep() -> None:
+    environment = batch_environment()
+    done = 0
+    for batch_runs in chunked(_plan_sweep_runs(), BATCH_REPLICATES):
+        print(f"Running batch of {len(batch_runs)} replicates ({done} done)")
+        batch = BatchSimulation(
+            seeds=[planned_run["random_seed"] for planned_run in batch_runs],
+            environment=environment,
+            replicate_environments=[
+                {name: planned_run["config"][name] for name in SWEEP_PROPERTIES}
+                for planned_run in batch_runs
+            ],
+            sparse_density_threshold=BATCH_SPARSE_DENSITY_THRESHOLD,
+            tile_memory_budget=BATCH_TILE_MEMORY_BUDGET,
+            initial_population=WARM_START,
+            stop_on_fixation=EARLY_STOP_EXTINCTION,
+            steady_state_window=EARLY_STOP_STEADY_STATE_WINDOW,
+            steady_state_epsilon=EARLY_STOP_STEADY_STATE_EPSILON,
+        )
+        started = perf_counter()
+        batch.simulate(
+            MULTI_RUN_STEPS,
+            OUTPUT_EVERY_N_STEPS,
+            _publish_batch_metrics if LIVE_METRICS is not None else None,
+        )
+        # replicates share the wall time of their batch
+        runtime = perf_counter() - started
+        for step, cell_index, density in batch.cell_index_switches[1:]:
+            print(f"step {step}: {cell_index} cell index (density {density:.4f})")
+        batch.export_logs(
+            [
+                os.path.join(
+                    SWEEP_OUTPUT_DIRECTORY, planned_run["output_subdirectory"], "0.json"
+                )
+                for planned_run in batch_runs
+            ]
+        )
+        for k, planned_run in enumerate(batch_runs):
+            counts = batch.population_strat_count[k]
+            stop_step = int(batch.stop_step[k])
+            _record_completed_run(
+                planned_run["fingerprint"],
+                batch.step_counter if batch.running[k] else stop_step,
+                {
+                    "runtime_seconds": runtime,
+                    "stop_reason": int(batch.stop_reason[k]),
+                    "stop_step": stop_step,
+                    "agent_count": int(counts.sum()),
+                    "population_strat_count": counts.tolist(),
+                },
+            )
+        done += len(batch_runs)
+
+
+def _frame_writer_settings() -> dict:
+    return {
+        "directory": RENDER_DIRECTORY,
+        "every_n_steps": RENDER_FRAMES_EVERY_N_STEPS,
+        "video": RENDER_VIDEO,
+        "size": RENDER_FRAME_SIZE,
+        "palette": SET1_RGB,
+        "background": tuple(int(c * 255) for c in VISUALISATION_BG_RGB),
+    }
+
+
+# run a single simulation across DECOMPOSED_WORKERS cpu processes
+def run_decomposed() -> None:
+    simulation = DecomposedSimulation(
+        RANDOM_SEED,
+        batch_environment(),
+        workers=DECOMPOSED_WORKERS,
+        frames=_frame_writer_settings() if RENDER_FRAMES_EVERY_N_STEPS > 0 else None,
+        checkpoints=(
+            {"directory": CHECKPOINT_DIRECTORY, "every_n_steps": CHECKPOINT_EVERY_N_STEPS}
+            if CHECKPOINT_EVERY_N_STEPS > 0
+            else None
+        ),
+        initial_state=(
+            (0, cpu_population(WARM_START, SPACES_WITHIN_RADIUS))
+            if WARM_START is not None
+            else None
+        ),
+    )
+    print(f"Running simulation on {simulation.workers} workers...")
+    if not WARM_START_SAVE_FILE:
+        simulation.simulate(STEP_COUNT)
+    else:
+        with tempfile.TemporaryDirectory() as state_directory:
+            simulation.simulate(STEP_COUNT, final_state_directory=state_directory)
+            write_snapshot(
+                WARM_START_SAVE_FILE,
+                load_checkpoint(state_directory, simulation.step_counter),
+                simulation.step_counter,
+                simulation.environment,
+            )
+        print(f"Population snapshot written to {WARM_START_SAVE_FILE}")
+    simulation.export_log(LOG_FILE, OUTPUT_EVERY_N_STEPS)
+
+
+# run one decomposed simulation to FORK_BRANCH_STEP, then every FORK_VARIANTS
+# variant from there on, in forked processes
+def run_forked_variants() -> None:
+    print(f"Running base simulation to step {FORK_BRANCH_STEP}...")
+    base, branch = simulate_branch(
+        RANDOM_SEED,
+        batch_environment(),
+        FORK_BRANCH_STEP,
+        workers=DECOMPOSED_WORKERS,
+        initial_state=(
+            (0, cpu_population(WARM_START, SPACES_WITHIN_RADIUS))
+            if WARM_START is not None
+            else None
+        ),
+    )
+    print(f"Forking {len(FORK_VARIANTS)} variants at step {base.step_counter}...")
+    log_paths = [
+        os.path.join(FORK_OUTPUT_DIRECTORY, "variant_%03d.json" % k)
+        for k in range(len(FORK_VARIANTS))
+    ]
+    exit_codes = run_fork_ensemble(
+        base,
+        branch,
+        seeds=[variant.get("random_seed", RANDOM_SEED) for variant in FORK_VARIANTS],
+        environments=[
+            {name: value for name, value in variant.items() if name != "random_seed"}
+            for variant in FORK_VARIANTS
+        ],
+        steps=STEP_COUNT,
+        log_paths=log_paths,
+        workers=DECOMPOSED_WORKERS,
+        parallel=FORK_PARALLEL or None,
+        log_every_n_steps=OUTPUT_EVERY_N_STEPS,
+    )
+    for variant, log_path, exit_code in zip(FORK_VARIANTS, log_paths, exit_codes):
+        status = log_path if exit_code == 0 else f"failed ({exit_code})"
+        print(f"variant {variant}: {status}")
+
+
+# (model, function source(s), message input, message output) of every RTC
+# agent function, for check_kernel_schemas
+def _kernel_schemas() -> Dict[str, tuple]:
+    return {
+        CUDA_SEARCH_FUNC_NAME: (
+            "prisoners_dilemma", [CUDA_SEARCH_FUNC], None, "player_search_msg"
+        ),
+        CUDA_GAME_LIST_FUNC_NAME: (
+            "prisoners_dilemma", [CUDA_GAME_LIST_FUNC], "player_search_msg", None
+        ),
+        CUDA_ENVIRONMENTAL_PUNISHMENT_NAME: (
+            "prisoners_dilemma",
+            [
+                CUDA_ENVIRONMENTAL_PUNISHMENT_FUNCTION,
+                CUDA_ENVIRONMENTAL_PUNISHMENT_CONDITION,
+            ],
+            None,
+            None,
+        ),
+        CUDA_POPULATION_STATS_FUNCTION_NAME: (
+            "prisoners_dilemma", [CUDA_POPULATION_STATS_FUNCTION], None, None
+        ),
+        CUDA_LINEAGE_RECORD_FUNCTION_NAME: (
+            "prisoners_dilemma",
+            [CUDA_LINEAGE_RECORD_FUNCTION, CUDA_LINEAGE_RECORD_CONDITION],
+            None,
+            None,
+        ),
+        CUDA_AGENT_PLAY_CHALLENGE_FUNC_NAME: (
+            "pdgame_model",
+            [CUDA_AGENT_PLAY_CHALLENGE_FUNC, CUDA_AGENT_PLAY_CHALLENGE_CONDITION],
+            None,
+            "player_challenge_msg",
+        ),
+        CUDA_AGENT_PLAY_RESPONSE_FUNC_NAME: (
+            "pdgame_model",
+            [CUDA_AGENT_PLAY_RESPONSE_FUNC, CUDA_AGENT_PLAY_RESPONSE_CONDITION],
+            "player_challenge_msg",
+            "play_resolve_msg",
+        ),
+        CUDA_AGENT_PLAY_RESOLVE_FUNC_NAME: (
+            "pdgame_model",
+            [CUDA_AGENT_PLAY_RESOLVE_FUNC, CUDA_AGENT_PLAY_RESOLVE_CONDITION],
+            "play_resolve_msg",
+            None,
+        ),
+        CUDA_AGENT_MOVE_REQUEST_FUNCTION_NAME: (
+            "movement_model",
+            [CUDA_AGENT_MOVE_REQUEST_FUNCTION, CUDA_AGENT_MOVE_REQUEST_CONDITION],
+            None,
+            "agent_move_request_msg",
+        ),
+        CUDA_AGENT_MOVE_RESPONSE_FUNCTION_NAME: (
+            "movement_model",
+            [CUDA_AGENT_MOVE_RESPONSE_FUNCTION, CUDA_AGENT_MOVE_RESPONSE_CONDITION],
+            "agent_move_request_msg",
+            None,
+        ),
+        CUDA_AGENT_NEIGHBOURHOOD_BROADCAST_FUNCTION_NAME: (
+            "neighbourhood_model",
+            [CUDA_AGENT_NEIGHBOURHOOD_BROADCAST_FUNCTION],
+            None,
+            "neighbourhood_broadcast_msg",
+        ),
+        CUDA_AGENT_NEIGHBOURHOOD_UPDATE_FUNCTION_NAME: (
+            "neighbourhood_model",
+            [
+                CUDA_AGENT_NEIGHBOURHOOD_UPDATE_FUNCTION,
+                CUDA_AGENT_NEIGHBOURHOOD_UPDATE_CONDITION,
+            ],
+            "neighbourhood_broadcast_msg",
+            None,
+        ),
+        CUDA_AGENT_GOD_GO_FORTH_FUNCTION_NAME: (
+            "god_model",
+            [CUDA_AGENT_GOD_GO_FORTH_FUNCTION, CUDA_AGENT_GOD_GO_FORTH_CONDITION],
+            None,
+            "god_go_forth_msg",
+        ),
+        CUDA_AGENT_GOD_MULTIPLY_FUNCTION_NAME: (
+            "god_model",
+            [CUDA_AGENT_GOD_MULTIPLY_FUNCTION, CUDA_AGENT_GOD_MULTIPLY_CONDITION],
+            "god_go_forth_msg",
+            None,
+        ),
+    }
+
+
+def check_kernel_schemas() -> List[str]:
+    # type check every variable access of the RTC kernels against schema.py,
+    # including the visualisation variables (their accesses are only disabled)
+    full_schema = agent_schema(AGENT_TRAIT_COUNT, SPACES_WITHIN_RADIUS, True, True)
+    errors: List[str] = []
+    for name, (model_name, sources, message_in, message_out) in _kernel_schemas().items():
+        agent = model_variables(full_schema, AGENT_MODEL_GROUPS[model_name])
+        errors += check_kernel(
+            name,
+            "\n".join(sources),
+            agent,
+            MESSAGE_SCHEMA[message_in] if message_in else None,
+            MESSAGE_SCHEMA[message_out] if message_out else None,
+        )
+    return errors
+
+
+def _uses_output_pipeline() -> bool:
+    # sweeps always write run records
+    if MULTI_RUN:
+        return True
+    return COUNT_SERIES or LINEAGE_RECORDING or bool(WARM_START_SAVE_FILE)
+
+
+def _close_output_pipeline() -> None:
+    # everything queued is on disk after this
+    if OUTPUT_PIPELINE is not None:
+        OUTPUT_PIPELINE.close()
+        if OUTPUT_PIPELINE.stall_seconds > 0.0:
+            print(
+                f"Output pipeline: {OUTPUT_PIPELINE.tasks_done} writes, simulation "
+                f"waited {OUTPUT_PIPELINE.stall_seconds:.2f}s for the writers"
             )
-            runs_control.setPropertyUInt8("strategy_pure", pure_stategy)
-            runs_control.setPropertyFloat("cost_of_living", cost_of_living)
-            runs_control.setPropertyFloat("travel_cost", cost_of_living / 2)
-            runs += runs_control
-    return runs
 
 
 def main():
+    global LIVE_METRICS, FRAME_WRITER, LINEAGE, GAME_EVENTS, RUN_INDEX
+    global COUNT_SERIES_WRITER, WARM_START, OUTPUT_PIPELINE
     _print_environment_properties()
+    if LIVE_METRICS_PORT > 0:
+        LIVE_METRICS = MetricsServer(
+            LIVE_METRICS_HOST,
+            LIVE_METRICS_PORT,
+            palette=SET1_RGB,
+            background=tuple(int(c * 255) for c in VISUALISATION_BG_RGB),
+            image_size=LIVE_METRICS_IMAGE_SIZE,
+        ).start()
+    if WARM_START_FILE:
+        WARM_START = load_warm_start(WARM_START_FILE)
+    if not MULTI_RUN and DECOMPOSED_WORKERS > 0 and FORK_BRANCH_STEP > 0:
+        run_forked_variants()
+        return
+    if not MULTI_RUN and DECOMPOSED_WORKERS > 0:
+        run_decomposed()
+        return
+    if OUTPUT_PIPELINE_WORKERS > 0 and _uses_output_pipeline():
+        OUTPUT_PIPELINE = OutputPipeline(
+            OUTPUT_PIPELINE_WORKERS, OUTPUT_PIPELINE_QUEUE_SIZE
+        )
+    if MULTI_RUN and RUN_INDEX_FILE:
+        os.makedirs(os.path.dirname(RUN_INDEX_FILE) or ".", exist_ok=True)
+        RUN_INDEX = RunIndex(RUN_INDEX_FILE)
+    if MULTI_RUN and BATCH_REPLICATES > 0:
+        print("Running sweep on the batched CPU engine...")
+        run_batched_sweep()
+        _close_output_pipeline()
+        if RUN_INDEX is not None:
+            RUN_INDEX.close()
+        if SENSITIVITY_ANALYSIS:
+            report_sensitivity()
+        return
+    if ADAPTIVE_ITERATIONS and ADAPTIVE_ITERATION_WINDOW < 1:
+        raise ValueError("ADAPTIVE_ITERATION_WINDOW must be at least 1")
+    if (
+        SNAPSHOT_GRID_EVERY_N_STEPS
+        and SNAPSHOT_CELL_BITS + SNAPSHOT_COLOR_BITS + SNAPSHOT_STRATEGY_BITS > 32
+    ):
+        raise ValueError("snapshot grid entries of this grid size do not fit 32 bits")
+    schema_errors = check_kernel_schemas()
+    if schema_errors:
+        raise ValueError(
+            "RTC kernels do not match schema.py:\n  " + "\n  ".join(schema_errors)
+        )
+    if VERBOSE_OUTPUT:
+        print(schema_report(AGENT_SCHEMA, MESSAGE_SCHEMA))
     if pyflamegpu.SEATBELTS:
         print("Seatbelts are enabled, this will significantly impact performance.")
         print(
@@ -1852,6 +3591,8 @@ def main():
 
     # Exit sim early if all agents die
     model.addExitCondition(exit_condition_fn().__disown__())
+    # record finished runs so an interrupted sweep can be resumed
+    model.addExitFunction(exit_fn().__disown__())
     env: pyflamegpu.EnvironmentDescription = model.Environment()
     add_env_vars(env)
     env.newPropertyFloat("cost_of_living", COST_OF_LIVING, isConst=True)
@@ -1860,19 +3601,36 @@ def main():
     # env.newPropertyArrayUInt("population_counts_step", [0] * POPULATION_COUNT_BINS)
     env.newPropertyArrayUInt("population_strat_count", [0] * POPULATION_COUNT_BINS)
     env.newPropertyFloat("travel_cost", AGENT_TRAVEL_COST, isConst=True)
+    env.newPropertyUInt64("run_fingerprint", 0, isConst=True)
+    env.newPropertyUInt8("stop_reason", STOP_REASON_NONE)
+    env.newPropertyUInt("stop_step", 0)
+    env.newPropertyArrayFloat(
+        "strat_share_window",
+        [0.0] * (max(EARLY_STOP_STEADY_STATE_WINDOW, 1) * POPULATION_COUNT_BINS),
+    )
+    env.newPropertyUInt("strat_share_window_fill", 0)
+    if MULTI_RUN:
+        add_sweep_env_vars(env)
+    add_stats_env_vars(env)
+    add_iteration_env_vars(env)
+    if GAME_EVENTS_ENABLED:
+        add_game_event_env_vars(env)
+    if PERF_COUNTERS:
+        add_perf_counter_env_vars(env)
+    if LINEAGE_RECORDING and not MULTI_RUN:
+        env.newMacroPropertyUInt("lineage_buffer", LINEAGE_BUFFER_SIZE)
+        env.newMacroPropertyUInt("lineage_count")
+    if SNAPSHOT_GRID_EVERY_N_STEPS:
+        env.newMacroPropertyUInt("snapshot_cells", SNAPSHOT_GRID_CAPACITY)
+        env.newMacroPropertyUInt("snapshot_count")
 
     model.addStepFunction(step_fn().__disown__())
     # create all agents here
     model.addInitFunction(init_fn().__disown__())
 
-    agent = make_core_agent(model)
+    agent = make_core_agent(model, "prisoners_dilemma")
 
-    search_message: pyflamegpu.MessageBucket_Description = model.newMessageBucket(
-        "player_search_msg"
-    )
-    search_message.newVariableID("id")
-    search_message.newVariableFloat("die_roll")
-    search_message.setBounds(0, BUCKET_SIZE)
+    make_message(model, "player_search_msg")
 
     agent_search_fn: pyflamegpu.AgentFunctionDescription = agent.newRTCFunction(
         CUDA_SEARCH_FUNC_NAME, CUDA_SEARCH_FUNC
@@ -1894,6 +3652,26 @@ def main():
         CUDA_ENVIRONMENTAL_PUNISHMENT_CONDITION
     )
 
+    agent_population_stats_fn: pyflamegpu.AgentFunctionDescription = (
+        agent.newRTCFunction(
+            CUDA_POPULATION_STATS_FUNCTION_NAME, CUDA_POPULATION_STATS_FUNCTION
+        )
+    )
+
+    agent_lineage_record_fn: pyflamegpu.AgentFunctionDescription = (
+        agent.newRTCFunction(
+            CUDA_LINEAGE_RECORD_FUNCTION_NAME, CUDA_LINEAGE_RECORD_FUNCTION
+        )
+    )
+    agent_lineage_record_fn.setRTCFunctionCondition(CUDA_LINEAGE_RECORD_CONDITION)
+
+    agent_snapshot_grid_fn: pyflamegpu.AgentFunctionDescription = (
+        agent.newRTCFunction(
+            CUDA_SNAPSHOT_GRID_FUNCTION_NAME, CUDA_SNAPSHOT_GRID_FUNCTION
+        )
+    )
+    agent_snapshot_grid_fn.setRTCFunctionCondition(CUDA_SNAPSHOT_GRID_CONDITION)
+
     # load agent-specific interactions
 
     # play resolution submodel
@@ -1903,43 +3681,38 @@ def main():
     pdgame_model.addExitCondition(exit_play_fn().__disown__())
 
     # add message for game challenges
-    challenge_message: pyflamegpu.MessageBucket_Description = (
-        pdgame_model.newMessageBucket("player_challenge_msg")
-    )
-    challenge_message.newVariableID("challenger_id")
-    challenge_message.newVariableID("responder_id")
-    challenge_message.newVariableArrayUInt8("challenger_strategies", AGENT_TRAIT_COUNT)
-    challenge_message.newVariableUInt8("challenger_trait")
-    challenge_message.newVariableFloat("challenger_energy")
-    challenge_message.newVariableFloat("challenger_roll")
-    challenge_message.newVariableUInt("challenger_x")
-    challenge_message.newVariableUInt("challenger_y")
-    challenge_message.newVariableUInt("challenger_bucket")
-
-    challenge_message.newVariableID("challenger_game_memory_id")
-    challenge_message.newVariableUInt8("challenger_game_memory_choice")
-    challenge_message.setBounds(0, BUCKET_SIZE)
-
-    resolve_message: pyflamegpu.MessageBucket_Description = (
-        pdgame_model.newMessageBucket("play_resolve_msg")
-    )
-    resolve_message.newVariableID("challenger_id")
-    resolve_message.newVariableID("responder_id")
-    resolve_message.newVariableFloat("challenger_energy")
-    resolve_message.newVariableUInt8("challenger_strategy")
-    resolve_message.newVariableUInt8("responder_response")
-    resolve_message.setBounds(0, BUCKET_SIZE)
+    make_message(pdgame_model, "player_challenge_msg")
+    make_message(pdgame_model, "play_resolve_msg")
 
     pdgame_env: pyflamegpu.EnvironmentDescription = pdgame_model.Environment()
     add_env_vars(pdgame_env)
     add_pdgame_env_vars(pdgame_env)
+    add_iteration_env_vars(pdgame_env)
+    if GAME_EVENTS_ENABLED:
+        add_game_event_env_vars(pdgame_env)
+    if PERF_COUNTERS:
+        add_perf_counter_env_vars(pdgame_env)
 
     # create the submodel
     pdgame_submodel: pyflamegpu.SubModelDescription = model.newSubModel(
         "pdgame_model", pdgame_model
     )
-    pdgame_subagent: pyflamegpu.AgentDescription = make_core_agent(pdgame_model)
-    add_pdgame_vars(pdgame_subagent)
+    if MULTI_RUN:
+        map_sweep_properties(pdgame_submodel, "pdgame_model")
+    map_iteration_properties(pdgame_submodel)
+    if GAME_EVENTS_ENABLED:
+        # the step function drains the buffer of the parent once per step
+        pdgame_subenv: pyflamegpu.SubEnvironmentDescription = (
+            pdgame_submodel.SubEnvironment()
+        )
+        pdgame_subenv.mapProperty("game_event_step", "game_event_step")
+        for name in ("game_event_buffer", "game_event_count"):
+            pdgame_subenv.mapMacroProperty(name, name)
+    if PERF_COUNTERS:
+        map_perf_counters(pdgame_submodel)
+    pdgame_subagent: pyflamegpu.AgentDescription = make_core_agent(
+        pdgame_model, "pdgame_model"
+    )
 
     agent_challenge_fn: pyflamegpu.AgentFunctionDescription = (
         pdgame_subagent.newRTCFunction(
@@ -1983,25 +3756,26 @@ def main():
     )
     movement_model.addExitCondition(exit_move_fn().__disown__())
 
-    move_request_msg: pyflamegpu.MessageBucket_Description = (
-        movement_model.newMessageBucket("agent_move_request_msg")
-    )
-    move_request_msg.newVariableID("requester_id")
-    move_request_msg.newVariableFloat("requester_roll")
-    move_request_msg.newVariableUInt("requested_x")
-    move_request_msg.newVariableUInt("requested_y")
-
-    move_request_msg.setBounds(0, BUCKET_SIZE)
+    make_message(movement_model, "agent_move_request_msg")
 
     movement_env: pyflamegpu.EnvironmentDescription = movement_model.Environment()
     add_env_vars(movement_env)
     add_movement_env_vars(movement_env)
+    add_iteration_env_vars(movement_env)
+    if PERF_COUNTERS:
+        add_perf_counter_env_vars(movement_env)
 
     movement_submodel: pyflamegpu.SubModelDescription = model.newSubModel(
         "movement_model", movement_model
     )
-    movement_subagent: pyflamegpu.AgentDescription = make_core_agent(movement_model)
-    add_movement_vars(movement_subagent)
+    if MULTI_RUN:
+        map_sweep_properties(movement_submodel, "movement_model")
+    map_iteration_properties(movement_submodel)
+    if PERF_COUNTERS:
+        map_perf_counters(movement_submodel)
+    movement_subagent: pyflamegpu.AgentDescription = make_core_agent(
+        movement_model, "movement_model"
+    )
 
     agent_move_request_fn: pyflamegpu.AgentFunctionDescription = (
         movement_subagent.newRTCFunction(
@@ -2035,11 +3809,7 @@ def main():
     )
     neighbourhood_model.addExitCondition(exit_neighbourhood_fn().__disown__())
 
-    neighbourhood_broadcast_msg: pyflamegpu.MessageBucket_Description = (
-        neighbourhood_model.newMessageBucket("neighbourhood_broadcast_msg")
-    )
-    neighbourhood_broadcast_msg.newVariableID("id")
-    neighbourhood_broadcast_msg.setBounds(0, BUCKET_SIZE)
+    make_message(neighbourhood_model, "neighbourhood_broadcast_msg")
 
     neighbourhood_env: pyflamegpu.EnvironmentDescription = (
         neighbourhood_model.Environment()
@@ -2049,8 +3819,10 @@ def main():
     neighbourhood_submodel: pyflamegpu.SubModelDescription = model.newSubModel(
         "neighbourhood_model", neighbourhood_model
     )
+    if MULTI_RUN:
+        map_sweep_properties(neighbourhood_submodel, "neighbourhood_model")
     neighbourhood_subagent: pyflamegpu.AgentDescription = make_core_agent(
-        neighbourhood_model
+        neighbourhood_model, "neighbourhood_model"
     )
 
     agent_neighbourhood_broadcast_fn: pyflamegpu.AgentFunctionDescription = (
@@ -2092,23 +3864,23 @@ def main():
     god_model.addInitFunction(init_god_fn().__disown__())
     god_model.addExitCondition(exit_god_fn().__disown__())
 
-    god_go_forth_msg: pyflamegpu.MessageBucket_Description = god_model.newMessageBucket(
-        "god_go_forth_msg"
-    )
-    god_go_forth_msg.newVariableID("id")
-    god_go_forth_msg.newVariableUInt("requested_x")
-    god_go_forth_msg.newVariableUInt("requested_y")
-    god_go_forth_msg.newVariableFloat("die_roll")
-    god_go_forth_msg.setBounds(0, BUCKET_SIZE)
+    make_message(god_model, "god_go_forth_msg")
 
     god_env: pyflamegpu.EnvironmentDescription = god_model.Environment()
     add_env_vars(god_env)
     add_god_env_vars(god_env)
+    add_iteration_env_vars(god_env)
+    if PERF_COUNTERS:
+        add_perf_counter_env_vars(god_env)
     god_submodel: pyflamegpu.SubModelDescription = model.newSubModel(
         "god_model", god_model
     )
-    god_subagent: pyflamegpu.AgentDescription = make_core_agent(god_model)
-    add_god_vars(god_subagent)
+    if MULTI_RUN:
+        map_sweep_properties(god_submodel, "god_model")
+    map_iteration_properties(god_submodel)
+    if PERF_COUNTERS:
+        map_perf_counters(god_submodel)
+    god_subagent: pyflamegpu.AgentDescription = make_core_agent(god_model, "god_model")
 
     agent_god_go_forth_fn: pyflamegpu.AgentFunctionDescription = (
         god_subagent.newRTCFunction(
@@ -2158,22 +3930,70 @@ def main():
     main_layer6: pyflamegpu.LayerDescription = model.newLayer()
     main_layer6.addSubModel("god_model")
 
+    # record births before any newborn can be culled (single runs only)
+    if LINEAGE_RECORDING and not MULTI_RUN:
+        main_layer6_lineage: pyflamegpu.LayerDescription = model.newLayer()
+        main_layer6_lineage.addAgentFunction(agent_lineage_record_fn)
+
     # Layer #6: Delete agents over hard limit, deduct environmental cost
     main_layer7: pyflamegpu.LayerDescription = model.newLayer()
     main_layer7.addAgentFunction(agent_environmental_punishment_fn)
 
+    # Layer #8: gather population statistics in a single pass
+    if POPULATION_STATS_ENABLED:
+        main_layer8: pyflamegpu.LayerDescription = model.newLayer()
+        main_layer8.addAgentFunction(agent_population_stats_fn)
+
+    # Layer #9: fill the grid the step function needs on this step
+    if SNAPSHOT_GRID_EVERY_N_STEPS:
+        main_layer9: pyflamegpu.LayerDescription = model.newLayer()
+        main_layer9.addAgentFunction(agent_snapshot_grid_fn)
+
     if not MULTI_RUN:
         print("Configuring simulation...")
         simulation = configure_simulation_single(model, sys.argv)
         print("Configuring logging...")
         step_log_cfg = configure_logging(model)
         simulation.setStepLog(step_log_cfg)
+        simulation.setExitLog(configure_exit_logging(model))
         if USE_VISUALISATION:
             print("Configuring visualisation...")
             visualisation = configure_visualisation(simulation)
             visualisation.activate()
+        if RENDER_FRAMES_EVERY_N_STEPS > 0:
+            FRAME_WRITER = FrameWriter(**_frame_writer_settings())
+        if LINEAGE_RECORDING:
+            LINEAGE = LineageRecorder(
+                LINEAGE_DIRECTORY, LINEAGE_CHUNK_SIZE, OUTPUT_PIPELINE
+            )
+        if GAME_EVENTS_ENABLED:
+            GAME_EVENTS = GameEventWriter(GAME_EVENTS_FILE, GAME_EVENTS_BLOCK_SIZE)
+        if COUNT_SERIES:
+            COUNT_SERIES_WRITER = CountSeriesWriter(
+                COUNT_SERIES_FILE,
+                POPULATION_COUNT_BINS,
+                COUNT_SERIES_BLOCK_STEPS,
+                OUTPUT_PIPELINE,
+            )
         print("Running simulation...")
         simulation.simulate()
+        if COUNT_SERIES_WRITER is not None:
+            COUNT_SERIES_WRITER.close()
+        if FRAME_WRITER is not None:
+            FRAME_WRITER.close()
+        if LINEAGE is not None:
+            LINEAGE.close()
+        _close_output_pipeline()
+        if LINEAGE is not None:
+            print(
+                f"Recorded {LINEAGE.births_recorded} births to {LINEAGE_DIRECTORY}"
+            )
+        if GAME_EVENTS is not None:
+            GAME_EVENTS.close()
+            print(
+                f"Recorded {GAME_EVENTS.events_written} games to {GAME_EVENTS_FILE}"
+                f" ({GAME_EVENTS.bytes_written} bytes)"
+            )
         if USE_VISUALISATION:
             visualisation.join()  # type: ignore
     else:
@@ -2182,10 +4002,16 @@ def main():
         print("Configuring logging...")
         step_log_cfg = configure_logging(model)
         ensemble.setStepLog(step_log_cfg)
-        print("Configuring run plan...")
-        runs = configure_runplan(model)
+        ensemble.setExitLog(configure_exit_logging(model))
         print("Running simulation...")
-        ensemble.simulate(runs)
+        for chunk, runs in enumerate(configure_runplans(model)):
+            print(f"Running chunk {chunk} of {runs.size()} runs...")
+            ensemble.simulate(runs)
+        _close_output_pipeline()
+        if RUN_INDEX is not None:
+            RUN_INDEX.close()
+        if SENSITIVITY_ANALYSIS:
+            report_sensitivity()
 
 
 if __name__ == "__main__":
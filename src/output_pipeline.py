@@ -0,0 +1,119 @@
+###
+# Asynchronous output pipeline
+# host functions hand serialisation and disk writes (count series blocks,
+# lineage chunks, sweep run records, population snapshots) to a small pool of
+# writer threads, so compression and I/O overlap with the next steps' compute.
+# Every task has a key and tasks of one key run in submission order on the
+# same thread (a file is only ever written by one thread), different keys
+# spread over the pool. Each thread has a bounded queue, submit() blocks while
+# the queue of its key is full (backpressure), the time spent blocked is
+# counted in stall_seconds.
+# Writers that fill columnar blocks double buffer them (DoubleBuffer): the
+# host fills one block while the other is being written, and only waits when
+# it fills a block before the previous one is on disk.
+# close() drains every queue and is also run at exit. An exception raised by
+# a task is raised again by the next submit(), drain() or close().
+###
+import atexit
+import queue
+import threading
+import time
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class OutputPipeline:
+    def __init__(self, workers: int = 2, queue_size: int = 8):
+        self.workers = max(1, workers)
+        self.tasks_done: int = 0
+        self.stall_seconds: float = 0.0
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._queues: List["queue.Queue[Optional[tuple]]"] = [
+            queue.Queue(maxsize=max(1, queue_size)) for _ in range(self.workers)
+        ]
+        self._threads = [
+            threading.Thread(target=self._write, args=(q,), daemon=True)
+            for q in self._queues
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._closed = False
+        atexit.register(self.close)
+
+    def submit(self, key: str, task: Callable[..., None], *args) -> None:
+        # run task(*args) after every task submitted before with this key
+        self._raise_error()
+        if self._closed:
+            raise RuntimeError("the output pipeline is closed")
+        tasks = self._queues[hash(key) % self.workers]
+        try:
+            tasks.put_nowait((task, args))
+        except queue.Full:
+            started = time.perf_counter()
+            tasks.put((task, args))
+            with self._lock:
+                self.stall_seconds += time.perf_counter() - started
+
+    def drain(self) -> None:
+        # wait until every task submitted so far has run
+        for tasks in self._queues:
+            tasks.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            for tasks in self._queues:
+                tasks.put(None)
+            for thread in self._threads:
+                thread.join()
+            atexit.unregister(self.close)
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        with self._lock:
+            error, self._error = self._error, None
+        if error is not None:
+            raise RuntimeError("an output pipeline task failed") from error
+
+    def _write(self, tasks: "queue.Queue[Optional[tuple]]") -> None:
+        while True:
+            item = tasks.get()
+            try:
+                if item is None:
+                    return
+                task, args = item
+                task(*args)
+                with self._lock:
+                    self.tasks_done += 1
+            except BaseException as error:
+                with self._lock:
+                    if self._error is None:
+                        self._error = error
+            finally:
+                tasks.task_done()
+
+
+class DoubleBuffer(Generic[T]):
+    # two buffers, the host fills the front one. swap() hands it over and
+    # returns (filled buffer, release), the writer calls release() once it is
+    # done with the buffer, swap() waits for that before reusing it.
+    def __init__(self, make: Callable[[], T]):
+        self._buffers: List[T] = [make(), make()]
+        self._free = [threading.Event(), threading.Event()]
+        for free in self._free:
+            free.set()
+        self._front = 0
+
+    @property
+    def front(self) -> T:
+        return self._buffers[self._front]
+
+    def swap(self) -> Tuple[T, Callable[[], None]]:
+        filled = self._front
+        self._free[filled].clear()
+        self._front ^= 1
+        self._free[self._front].wait()
+        return self._buffers[filled], self._free[filled].set
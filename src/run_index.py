@@ -0,0 +1,178 @@
+###
+# SQLite index of finished runs
+# one row per run, inserted as the run completes: fingerprint, seed, steps,
+# runtime, stop reason, output subdirectory, every scalar config value as its
+# own (indexed) column, the final agent count and the final count / share of
+# every population_strat_count bin. Columns for config keys the table has not
+# seen yet are added on insert, so sweeps over new parameters share one index.
+#   python src/run_index.py data/run_index.sqlite --where cost_of_living=1.5 \
+#       --where strategy_pure=1 [--columns final_share_0,final_share_5]
+###
+import argparse
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RUN_COLUMNS: Dict[str, str] = {
+    "fingerprint": "TEXT PRIMARY KEY",
+    "random_seed": "INTEGER",
+    "steps": "INTEGER",
+    "steps_completed": "INTEGER",
+    "runtime_seconds": "REAL",
+    "stop_reason": "INTEGER",
+    "stop_step": "INTEGER",
+    "agent_count": "INTEGER",
+    "output_subdirectory": "TEXT",
+    "config": "TEXT",
+    "recorded_at": "REAL DEFAULT (julianday('now'))",
+}
+# config values are matched with this tolerance (e.g. cost_of_living=2/3)
+FLOAT_TOLERANCE: float = 1e-9
+
+
+def _sql_type(value: object) -> Optional[str]:
+    if isinstance(value, bool) or isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "REAL"
+    return None
+
+
+class RunIndex:
+    # inserts may come from several ensemble threads, a lock serialises them
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS runs (%s)"
+            % ", ".join(f"{name} {kind}" for name, kind in RUN_COLUMNS.items())
+        )
+        self.connection.commit()
+        self.columns = self._table_columns()
+
+    def _table_columns(self) -> Dict[str, str]:
+        return {
+            row[1]: row[2] for row in self.connection.execute("PRAGMA table_info(runs)")
+        }
+
+    def _add_column(self, name: str, kind: str, indexed: bool) -> None:
+        self.connection.execute(f'ALTER TABLE runs ADD COLUMN "{name}" {kind}')
+        if indexed:
+            self.connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "runs_{name}" ON runs ("{name}")'
+            )
+        self.columns[name] = kind
+
+    def insert(
+        self,
+        fingerprint: int,
+        record: dict,
+        population_strat_count: Optional[Sequence[int]] = None,
+    ) -> None:
+        # record: a sweep manifest record (config, random_seed, steps, ...)
+        config: dict = record.get("config", {})
+        row = {
+            name: record.get(name)
+            for name in RUN_COLUMNS
+            if name not in ("fingerprint", "config", "recorded_at")
+        }
+        row["fingerprint"] = "%016x" % fingerprint
+        row["config"] = json.dumps(config, sort_keys=True)
+        parameters = {k: v for k, v in config.items() if _sql_type(v) is not None}
+        final: Dict[str, object] = {}
+        if population_strat_count is not None:
+            counts = np.asarray(population_strat_count, dtype=np.int64)
+            total = counts.sum()
+            for i, count in enumerate(counts.tolist()):
+                final[f"final_count_{i}"] = count
+                final[f"final_share_{i}"] = count / total if total > 0 else 0.0
+        with self.lock:
+            for name, value in parameters.items():
+                if name not in self.columns:
+                    self._add_column(name, _sql_type(value), indexed=True)  # type: ignore
+            for name, value in final.items():
+                if name not in self.columns:
+                    self._add_column(name, _sql_type(value), indexed=False)  # type: ignore
+            row.update(parameters)
+            row.update(final)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO runs (%s) VALUES (%s)"
+                % (
+                    ", ".join(f'"{name}"' for name in row),
+                    ", ".join("?" for _ in row),
+                ),
+                list(row.values()),
+            )
+            self.connection.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+def query(
+    path: str,
+    where: Optional[Dict[str, object]] = None,
+    columns: Optional[Sequence[str]] = None,
+) -> Tuple[List[str], List[tuple]]:
+    # (column names, rows) of the runs matching every name = value in where
+    connection = sqlite3.connect(path)
+    try:
+        clauses: List[str] = []
+        values: List[object] = []
+        for name, value in (where or {}).items():
+            if isinstance(value, float):
+                # a range, unlike ABS(column - value), can use the index
+                clauses.append(f'"{name}" BETWEEN ? AND ?')
+                values.extend([value - FLOAT_TOLERANCE, value + FLOAT_TOLERANCE])
+            else:
+                clauses.append(f'"{name}" = ?')
+                values.append(value)
+        selected = ", ".join(f'"{c}"' for c in columns) if columns else "*"
+        cursor = connection.execute(
+            f"SELECT {selected} FROM runs"
+            + (f" WHERE {' AND '.join(clauses)}" if clauses else ""),
+            values,
+        )
+        return [d[0] for d in cursor.description], cursor.fetchall()
+    finally:
+        connection.close()
+
+
+def _parse_condition(condition: str) -> Tuple[str, object]:
+    name, _, text = condition.partition("=")
+    for parse in (int, float):
+        try:
+            return name.strip(), parse(text)
+        except ValueError:
+            pass
+    return name.strip(), text
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Query the run index")
+    parser.add_argument("index", help="run index database")
+    parser.add_argument(
+        "--where", action="append", default=[], help="name=value, may be repeated"
+    )
+    parser.add_argument("--columns", default=None, help="comma separated columns")
+    args = parser.parse_args(argv)
+
+    names, rows = query(
+        args.index,
+        dict(_parse_condition(c) for c in args.where),
+        args.columns.split(",") if args.columns else None,
+    )
+    print("\t".join(names))
+    for row in rows:
+        print("\t".join(str(value) for value in row))
+    print(f"{len(rows)} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+###
+# Summary statistics of ensemble runs (the summary tables of simulation_analysis.R)
+# every run log (FLAMEGPU JSON logger or batch_engine.export_logs, one JSON
+# document per line or per file) is parsed once into columns: the run config
+# and a (steps, strategy bins) array of population_strat_count, from the log or
+# from its compressed count series (count_series.py). Runs are
+# reduced as they stream in by sort-based group-by accumulators that hold
+# (count, sum, sum of squares) per group, so memory depends on the number of
+# groups, not on the number of runs:
+#   final      final step agent counts by pure_strategy, cost_of_living, strategy
+#   trajectory mean agent counts by pure_strategy, cost_of_living, step, strategy
+#   harshness  final counts by pure_strategy, cost_of_living + travel_cost and
+#              strategy type (vs own trait) / other type (vs other traits)
+#   python src/run_summary.py data --out data/summary [--workers N]
+###
+import argparse
+import csv
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from count_series import CountSeries, log_series_path
+
+# AGENT_STRATEGY_COOP, _DEFECT, _TIT_FOR_TAT, _RANDOM
+STRATEGY_NAMES: List[str] = ["Co-op", "Defect", "Tit-for-tat", "Random"]
+
+
+def strategy_labels(names: Sequence[str] = STRATEGY_NAMES) -> List[str]:
+    # population_strat_count bin my * count + other, e.g. "Co-op pure",
+    # "Co-op contingent (defect)"
+    return [
+        f"{my} pure" if i == j else f"{my} contingent ({other.lower()})"
+        for i, my in enumerate(names)
+        for j, other in enumerate(names)
+    ]
+
+
+def harshness(cost_of_living: np.ndarray, travel_cost: np.ndarray) -> np.ndarray:
+    return np.round(np.asarray(cost_of_living) + np.asarray(travel_cost), 3)
+
+
+def _log_documents(path: str) -> List[dict]:
+    with open(path, "r") as log_file:
+        text = log_file.read()
+    try:
+        return [json.loads(text)]
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def read_run_log(path: str) -> List[Dict[str, object]]:
+    # runs in a log file: random_seed, pure_strategy, cost_of_living,
+    # travel_cost, step_index (steps,) and counts (steps, bins)
+    runs: List[Dict[str, object]] = []
+    for log in _log_documents(path):
+        steps = log.get("steps") or []
+        if not steps or "config" not in log:
+            # not a run log (e.g. sensitivity.json) or nothing was logged
+            continue
+        environment = log["config"]["environment"]
+        step_index = np.array([s["step_index"] for s in steps], np.int64)
+        series = log_series_path(path)
+        if "population_strat_count" in steps[0].get("environment", {}):
+            counts = np.array(
+                [s["environment"]["population_strat_count"] for s in steps], np.int64
+            )
+        elif series is not None:
+            # logged with COUNT_SERIES
+            step_index, counts = CountSeries(series).read()
+        else:
+            continue
+        runs.append(
+            {
+                "random_seed": int(log["config"]["random_seed"]),
+                "pure_strategy": int(environment["strategy_pure"]),
+                "cost_of_living": float(environment["cost_of_living"]),
+                "travel_cost": float(environment["travel_cost"]),
+                "step_index": step_index,
+                "counts": counts,
+            }
+        )
+    return runs
+
+
+def log_paths(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, "**", "*.json"), recursive=True))
+
+
+def iter_runs(paths: Sequence[str], workers: int = 0) -> Iterator[Dict[str, object]]:
+    # parsing dominates, so with workers > 0 files are parsed in processes
+    if workers <= 0:
+        for path in paths:
+            yield from read_run_log(path)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        for runs in pool.map(read_run_log, paths, chunksize=16):
+            yield from runs
+
+
+def group_reduce(
+    keys: Sequence[np.ndarray], *values: np.ndarray
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    # sort rows by keys, then sum every value over each run of equal keys
+    order = np.lexsort(tuple(keys)[::-1])
+    keys = [k[order] for k in keys]
+    changed = np.zeros(len(order), dtype=bool)
+    changed[:1] = True
+    for k in keys:
+        changed[1:] |= k[1:] != k[:-1]
+    starts = np.flatnonzero(changed)
+    return (
+        [k[starts] for k in keys],
+        [np.add.reduceat(v[order], starts, axis=0) for v in values],
+    )
+
+
+class GroupAccumulator:
+    # streaming mean / sd of rows of values per group of keys. Rows are
+    # buffered and merged into the per group sums every buffer_rows rows.
+    def __init__(self, key_names: Sequence[str], width: int, buffer_rows: int = 1 << 16):
+        self.key_names = list(key_names)
+        self.width = width
+        self.buffer_rows = buffer_rows
+        self.keys: List[np.ndarray] = [np.zeros(0) for _ in self.key_names]
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros((0, width))
+        self.total_sq = np.zeros((0, width))
+        self._buffer: List[Tuple[List[np.ndarray], np.ndarray]] = []
+        self._buffered = 0
+
+    def add(self, keys: Sequence[np.ndarray], values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64).reshape(-1, self.width)
+        keys = [np.broadcast_to(k, len(values)) for k in keys]
+        self._buffer.append((keys, values))
+        self._buffered += len(values)
+        if self._buffered >= self.buffer_rows:
+            self._merge()
+
+    def _merge(self) -> None:
+        if not self._buffer:
+            return
+        values = np.concatenate([v for _, v in self._buffer])
+        # the (empty, untyped) initial keys must not promote the key dtypes
+        merged = [self.keys] if len(self.count) else []
+        keys = [
+            np.concatenate([m[i] for m in merged] + [k[i] for k, _ in self._buffer])
+            for i in range(len(self.key_names))
+        ]
+        self.keys, (self.count, self.total, self.total_sq) = group_reduce(
+            keys,
+            np.concatenate([self.count, np.ones(len(values), dtype=np.int64)]),
+            np.concatenate([self.total, values]),
+            np.concatenate([self.total_sq, values * values]),
+        )
+        self._buffer = []
+        self._buffered = 0
+
+    def result(self) -> Dict[str, np.ndarray]:
+        # keys, n, mean (groups, width) and sample sd (groups, width)
+        self._merge()
+        n = self.count[:, None].astype(np.float64)
+        mean = self.total / np.maximum(n, 1)
+        variance = (self.total_sq - n * mean * mean) / np.maximum(n - 1, 1)
+        sd = np.where(n > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+        return {
+            **dict(zip(self.key_names, self.keys)),
+            "n": self.count,
+            "mean": mean,
+            "sd": sd,
+        }
+
+
+class RunSummary:
+    def __init__(self, strategy_names: Sequence[str] = STRATEGY_NAMES):
+        self.strategy_names = list(strategy_names)
+        self.strategy_count = len(strategy_names)
+        bins = self.strategy_count**2
+        self.runs = 0
+        self.final = GroupAccumulator(("pure_strategy", "cost_of_living"), bins)
+        self.trajectory = GroupAccumulator(
+            ("pure_strategy", "cost_of_living", "step_index"), bins
+        )
+        # counts summed by the strategy vs own trait, then vs other traits
+        self.harshness = GroupAccumulator(
+            ("pure_strategy", "environmental_harshness"), 2 * self.strategy_count
+        )
+
+    def add(self, run: Dict[str, object]) -> None:
+        counts: np.ndarray = run["counts"]  # type: ignore
+        pure = np.int64(run["pure_strategy"])
+        cost = np.float64(run["cost_of_living"])
+        final = counts[np.argmax(run["step_index"])]  # type: ignore
+        self.final.add([pure, cost], final)
+        self.trajectory.add([pure, cost, run["step_index"]], counts)  # type: ignore
+        by_type = final.reshape(self.strategy_count, self.strategy_count)
+        self.harshness.add(
+            [pure, harshness(cost, run["travel_cost"])],
+            np.concatenate([by_type.sum(axis=1), by_type.sum(axis=0)]),
+        )
+        self.runs += 1
+
+    def add_all(self, runs: Iterable[Dict[str, object]]) -> "RunSummary":
+        for run in runs:
+            self.add(run)
+        return self
+
+    def final_rows(self) -> List[dict]:
+        return _long_rows(
+            self.final.result(),
+            ("pure_strategy", "cost_of_living"),
+            strategy_labels(self.strategy_names),
+            "strategy",
+        )
+
+    def trajectory_rows(self) -> List[dict]:
+        return _long_rows(
+            self.trajectory.result(),
+            ("pure_strategy", "cost_of_living", "step_index"),
+            strategy_labels(self.strategy_names),
+            "strategy",
+        )
+
+    def harshness_rows(self) -> List[dict]:
+        names = [name.lower() for name in self.strategy_names]
+        labels = [f"type {name}" for name in names] + [f"other {name}" for name in names]
+        return _long_rows(
+            self.harshness.result(),
+            ("pure_strategy", "environmental_harshness"),
+            labels,
+            "strategy_group",
+        )
+
+
+def _long_rows(
+    result: Dict[str, np.ndarray],
+    key_names: Sequence[str],
+    labels: Sequence[str],
+    label_name: str,
+) -> List[dict]:
+    rows = []
+    for g in range(len(result["n"])):
+        keys = {name: result[name][g].item() for name in key_names}
+        for i, label in enumerate(labels):
+            rows.append(
+                {
+                    **keys,
+                    label_name: label,
+                    "n": int(result["n"][g]),
+                    "agent_count_mean": float(result["mean"][g, i]),
+                    "agent_count_sd": float(result["sd"][g, i]),
+                }
+            )
+    return rows
+
+
+def write_csv(path: str, rows: List[dict]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as csv_file:
+        if not rows:
+            return
+        writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def format_final_table(
+    rows: List[dict], pure_strategy: int, strategies: Optional[Sequence[str]] = None
+) -> str:
+    # strategy x cost_of_living table of "mean+/-sd" in units of 10^4 agents
+    rows = [
+        r
+        for r in rows
+        if r["pure_strategy"] == pure_strategy
+        and (strategies is None or r["strategy"] in strategies)
+    ]
+    costs = sorted({r["cost_of_living"] for r in rows})
+    cells = {
+        (r["strategy"], r["cost_of_living"]): "%.2f+/-%.2f"
+        % (r["agent_count_mean"] * 1e-4, r["agent_count_sd"] * 1e-4)
+        for r in rows
+    }
+    strategies = list(dict.fromkeys(r["strategy"] for r in rows))
+    width = max([len(s) for s in strategies] + [8])
+    lines = [" " * width + "".join(f"{c:>16g}" for c in costs)]
+    for strategy in strategies:
+        lines.append(
+            f"{strategy:<{width}}"
+            + "".join(f"{cells.get((strategy, c), ''):>16}" for c in costs)
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarise ensemble run logs")
+    parser.add_argument("directory", help="directory tree of run logs (*.json)")
+    parser.add_argument("--out", default=None, help="write the summaries as csv here")
+    parser.add_argument("--workers", type=int, default=0, help="parser processes")
+    args = parser.parse_args(argv)
+
+    paths = log_paths(args.directory)
+    summary = RunSummary().add_all(iter_runs(paths, args.workers))
+    print(f"{summary.runs} runs from {len(paths)} files")
+    final = summary.final_rows()
+    print("pure strategy runs, final agent count (10^4)")
+    print(format_final_table(final, 1, strategy_labels()[:: len(STRATEGY_NAMES) + 1]))
+    print("contingent strategy runs, final agent count (10^4)")
+    print(format_final_table(final, 0))
+    if args.out:
+        write_csv(os.path.join(args.out, "final.csv"), final)
+        write_csv(os.path.join(args.out, "trajectory.csv"), summary.trajectory_rows())
+        write_csv(os.path.join(args.out, "harshness.csv"), summary.harshness_rows())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+###
+# Agent and message schema registry
+# every agent and message variable of the model is declared once here,
+# grouped by the (sub)models that need it. From that single definition:
+#   declare_agent / declare_message   the FLAMEGPU descriptions (model.py)
+#   column_layout / numpy_columns     columnar arrays of the CPU backends
+#   schema_bytes / schema_report      bytes per agent and per message
+#   check_kernel                      type check of the getVariable /
+#                                     setVariable calls of RTC kernel source
+# print the memory / bandwidth cost of the current schema with
+#   python src/schema.py
+###
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# these mirror the constants in model.py
+ID_NOT_SET: int = 0
+AGENT_STATUS_READY: int = 1
+AGENT_MOVE_RESULT_NONE: int = 0
+
+# schema type -> (C++ type in RTC kernels, numpy dtype)
+SCHEMA_TYPES: Dict[str, Tuple[str, type]] = {
+    "ID": ("flamegpu::id_t", np.uint32),
+    "UInt": ("unsigned int", np.uint32),
+    "UInt8": ("uint8_t", np.uint8),
+    "Int8": ("int8_t", np.int8),
+    "Float": ("float", np.float32),
+}
+# other spellings of the same C++ types
+CPP_ALIASES: Dict[str, str] = {
+    "id_t": "flamegpu::id_t",
+    "uint32_t": "unsigned int",
+    "unsigned char": "uint8_t",
+}
+
+
+class Variable(NamedTuple):
+    name: str
+    type: str
+    # 0 = scalar, otherwise the length of an array variable
+    length: int = 0
+    default: Any = None
+
+    @property
+    def nbytes(self) -> int:
+        return np.dtype(SCHEMA_TYPES[self.type][1]).itemsize * max(self.length, 1)
+
+
+### Registry
+
+
+def agent_schema(
+    trait_count: int,
+    spaces_within_radius: int,
+    visualisation: bool = False,
+    orient: bool = False,
+) -> Dict[str, List[Variable]]:
+    # variable groups of the prisoner agent, see AGENT_MODEL_GROUPS
+    spaces = spaces_within_radius
+    core = [
+        Variable("id", "ID"),
+        Variable("x_a", "UInt"),
+        Variable("y_a", "UInt"),
+        Variable("energy", "Float"),
+        Variable("agent_status", "UInt", default=AGENT_STATUS_READY),
+        Variable("agent_trait", "UInt8"),
+        # this allows flexible setting of agent colors
+        Variable("agent_color", "UInt"),
+        # this is to hold a strategy per opponent trait
+        Variable("agent_strategies", "UInt8", trait_count),
+        Variable("agent_strategy_id", "UInt8", default=0),
+        # row of the strategy tables, see strategy_tables.py
+        Variable("agent_strategy_genome", "UInt", default=0),
+        # id of the parent, for lineage recording (initial agents have none)
+        Variable("parent_id", "ID", default=ID_NOT_SET),
+        Variable("neighbour_list", "ID", spaces, ID_NOT_SET),
+        Variable("neighbour_rolls", "Float", spaces, 0.0),
+        # -1 = no neighbour, 0 = I respond, 1 = I challenge
+        Variable("my_actions", "Int8", spaces, -1),
+        Variable("die_roll", "Float", default=0.0),
+        Variable("my_bucket", "UInt", default=0),
+        Variable("move_result", "UInt8", default=AGENT_MOVE_RESULT_NONE),
+    ]
+    if visualisation:
+        core += [Variable("x", "Float"), Variable("y", "Float")]
+        if orient:
+            core.append(Variable("pitch", "Float"))
+    return {
+        "core": core,
+        # mapped into the pdgame submodel, reset at the start of each step
+        "stats": [Variable("games_played", "UInt8", default=0)],
+        "memory": [
+            Variable("game_memory", "ID", spaces, ID_NOT_SET),
+            Variable("game_memory_choices", "UInt8", spaces, 0),
+        ],
+        "pdgame": [
+            # which neighbour is the target
+            Variable("challenge_sequence", "UInt8", default=0),
+            Variable("response_sequence", "UInt8", default=spaces),
+            Variable("round_resolved", "UInt8", default=0),
+            Variable("games_played", "UInt8", default=0),
+        ],
+        # grid bucket an agent asks to move / reproduce into
+        "request": [Variable("request_bucket", "UInt", default=0)],
+        "movement": [
+            Variable("last_move_attempt", "UInt", default=spaces + 1),
+            Variable("move_sequence", "UInt", default=0),
+        ],
+        "god": [
+            Variable("last_reproduction_attempt", "UInt", default=spaces + 1),
+            Variable("reproduce_sequence", "UInt", default=0),
+            Variable("agents_spawned", "UInt8", default=0),
+        ],
+    }
+
+
+# agent variable groups of each (sub)model
+AGENT_MODEL_GROUPS: Dict[str, List[str]] = {
+    "prisoners_dilemma": ["core", "stats"],
+    "pdgame_model": ["core", "memory", "pdgame"],
+    "movement_model": ["core", "request", "movement"],
+    "neighbourhood_model": ["core"],
+    "god_model": ["core", "request", "god"],
+}
+
+
+def message_schema(trait_count: int) -> Dict[str, List[Variable]]:
+    return {
+        "player_search_msg": [
+            Variable("id", "ID"),
+            Variable("die_roll", "Float"),
+        ],
+        "player_challenge_msg": [
+            Variable("challenger_id", "ID"),
+            Variable("responder_id", "ID"),
+            Variable("challenger_strategies", "UInt8", trait_count),
+            Variable("challenger_trait", "UInt8"),
+            Variable("challenger_energy", "Float"),
+            Variable("challenger_roll", "Float"),
+            Variable("challenger_x", "UInt"),
+            Variable("challenger_y", "UInt"),
+            Variable("challenger_bucket", "UInt"),
+            Variable("challenger_game_memory_id", "ID"),
+            Variable("challenger_game_memory_choice", "UInt8"),
+        ],
+        "play_resolve_msg": [
+            Variable("challenger_id", "ID"),
+            Variable("responder_id", "ID"),
+            Variable("challenger_energy", "Float"),
+            Variable("challenger_strategy", "UInt8"),
+            Variable("responder_response", "UInt8"),
+        ],
+        "agent_move_request_msg": [
+            Variable("requester_id", "ID"),
+            Variable("requester_roll", "Float"),
+            Variable("requested_x", "UInt"),
+            Variable("requested_y", "UInt"),
+        ],
+        "neighbourhood_broadcast_msg": [Variable("id", "ID")],
+        "god_go_forth_msg": [
+            Variable("id", "ID"),
+            Variable("requested_x", "UInt"),
+            Variable("requested_y", "UInt"),
+            Variable("die_roll", "Float"),
+        ],
+    }
+
+
+def model_variables(
+    schema: Dict[str, List[Variable]], groups: Sequence[str]
+) -> List[Variable]:
+    # variables of the given groups, a name shared by two groups only once
+    variables: Dict[str, Variable] = {}
+    for group in groups:
+        for variable in schema[group]:
+            if variable.name in variables and variables[variable.name] != variable:
+                raise ValueError(
+                    f"agent variable {variable.name} is declared differently in "
+                    f"group {group}"
+                )
+            variables.setdefault(variable.name, variable)
+    return list(variables.values())
+
+
+# agent columns of the CPU backends (batch_engine.py, domain_decomposition.py),
+# where positions are signed and ids are 64 bit.
+CPU_AGENT_COLUMNS: List[str] = [
+    "x_a",
+    "y_a",
+    "id",
+    "energy",
+    "agent_trait",
+    "agent_strategies",
+    "agent_strategy_id",
+    "game_memory",
+    "game_memory_choices",
+]
+CPU_AGENT_DTYPES: Dict[str, type] = {
+    "x_a": np.int32,
+    "y_a": np.int32,
+    "id": np.int64,
+    "game_memory": np.int64,
+}
+
+
+### FLAMEGPU descriptions
+
+
+def declare_agent(agent: Any, variables: Sequence[Variable]) -> None:
+    for v in variables:
+        if v.length:
+            method = getattr(agent, f"newVariableArray{v.type}")
+            if v.default is None:
+                method(v.name, v.length)
+            else:
+                method(v.name, v.length, [v.default] * v.length)
+        elif v.default is None:
+            getattr(agent, f"newVariable{v.type}")(v.name)
+        else:
+            getattr(agent, f"newVariable{v.type}")(v.name, v.default)
+
+
+def declare_message(message: Any, variables: Sequence[Variable]) -> None:
+    for v in variables:
+        if v.length:
+            getattr(message, f"newVariableArray{v.type}")(v.name, v.length)
+        else:
+            getattr(message, f"newVariable{v.type}")(v.name)
+
+
+### CPU backends
+
+
+def column_layout(
+    variables: Sequence[Variable],
+    names: Optional[Sequence[str]] = None,
+    dtypes: Optional[Dict[str, type]] = None,
+) -> Dict[str, Tuple[tuple, type]]:
+    # name -> (shape after the agent axis, dtype), dtypes overrides the schema
+    by_name = {v.name: v for v in variables}
+    dtypes = dtypes or {}
+    layout: Dict[str, Tuple[tuple, type]] = {}
+    for name in names if names is not None else list(by_name):
+        v = by_name[name]
+        shape = (v.length,) if v.length else ()
+        layout[name] = (shape, dtypes.get(name, SCHEMA_TYPES[v.type][1]))
+    return layout
+
+
+def numpy_columns(
+    variables: Sequence[Variable],
+    n: int,
+    names: Optional[Sequence[str]] = None,
+    dtypes: Optional[Dict[str, type]] = None,
+) -> Dict[str, np.ndarray]:
+    # n rows of every column, filled with the schema defaults
+    defaults = {v.name: v.default for v in variables}
+    return {
+        name: np.full(
+            (n, *shape),
+            defaults[name] if defaults[name] is not None else 0,
+            dtype=dtype,
+        )
+        for name, (shape, dtype) in column_layout(variables, names, dtypes).items()
+    }
+
+
+def cpu_agent_layout(
+    trait_count: int, spaces_within_radius: int
+) -> Dict[str, Tuple[tuple, type]]:
+    variables = model_variables(
+        agent_schema(trait_count, spaces_within_radius), ["core", "memory"]
+    )
+    return column_layout(variables, CPU_AGENT_COLUMNS, CPU_AGENT_DTYPES)
+
+
+def cpu_agent_columns(
+    trait_count: int, spaces_within_radius: int, n: int
+) -> Dict[str, np.ndarray]:
+    variables = model_variables(
+        agent_schema(trait_count, spaces_within_radius), ["core", "memory"]
+    )
+    return numpy_columns(variables, n, CPU_AGENT_COLUMNS, CPU_AGENT_DTYPES)
+
+
+### Byte accounting
+
+
+def schema_bytes(variables: Sequence[Variable]) -> int:
+    return sum(v.nbytes for v in variables)
+
+
+def schema_report(
+    agent: Dict[str, List[Variable]], messages: Dict[str, List[Variable]]
+) -> str:
+    lines = ["bytes per agent"]
+    for model_name, groups in AGENT_MODEL_GROUPS.items():
+        variables = model_variables(agent, groups)
+        lines.append(
+            f"  {model_name:<28}{schema_bytes(variables):>6} "
+            f"({len(variables)} variables)"
+        )
+    lines.append("bytes per message")
+    for message_name, variables in messages.items():
+        lines.append(
+            f"  {message_name:<28}{schema_bytes(variables):>6} "
+            f"({len(variables)} variables)"
+        )
+    return "\n".join(lines)
+
+
+### Kernel checks
+
+# FLAMEGPU->getVariable<T>("x"), FLAMEGPU->agent_out.setVariable<T, N>("x", ...),
+# FLAMEGPU->message_out.setVariable<T>("x", ...), message.getVariable<T>("x")
+KERNEL_ACCESS = re.compile(
+    r"(FLAMEGPU->agent_out\.|FLAMEGPU->message_out\.|FLAMEGPU->|\bmessage\.)"
+    r"(?:get|set)Variable<\s*([\w:\s]+?)\s*(?:,\s*([^>]+?))?\s*>\(\s*\"(\w+)\""
+)
+
+
+def _cpp_type(name: str) -> str:
+    name = " ".join(name.split())
+    return CPP_ALIASES.get(name, name)
+
+
+def check_kernel(
+    kernel: str,
+    source: str,
+    agent: Sequence[Variable],
+    message_in: Optional[Sequence[Variable]] = None,
+    message_out: Optional[Sequence[Variable]] = None,
+) -> List[str]:
+    # every variable access of the kernel against the schema, as error strings
+    targets = {
+        "FLAMEGPU->": ("agent", agent),
+        "FLAMEGPU->agent_out.": ("agent_out", agent),
+        "FLAMEGPU->message_out.": ("message_out", message_out),
+        "message.": ("message_in", message_in),
+    }
+    errors: List[str] = []
+    for match in KERNEL_ACCESS.finditer(source):
+        prefix, cpp_type, length, name = match.groups()
+        kind, variables = targets[prefix]
+        where = f"{kernel}: {kind} variable {name}"
+        if variables is None:
+            errors.append(f"{where} accessed without a {kind} schema")
+            continue
+        declared = {v.name: v for v in variables}.get(name)
+        if declared is None:
+            errors.append(f"{where} is not declared")
+            continue
+        expected = SCHEMA_TYPES[declared.type][0]
+        if _cpp_type(cpp_type) != expected:
+            errors.append(f"{where} accessed as {cpp_type}, declared {expected}")
+        if bool(length) != bool(declared.length):
+            errors.append(
+                f"{where} accessed as {'an array' if length else 'a scalar'}"
+            )
+        elif length and length.strip().isdigit() and int(length) != declared.length:
+            errors.append(
+                f"{where} accessed with length {length}, declared {declared.length}"
+            )
+    return errors
+
+
+if __name__ == "__main__":
+    print(schema_report(agent_schema(4, 8), message_schema(4)))
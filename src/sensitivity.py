@@ -0,0 +1,162 @@
+###
+# Global (variance based) sensitivity analysis
+# a Saltelli design over k env properties: every base sample j of a 2k
+# dimensional Sobol sequence gives two points A_j (first k coordinates) and B_j
+# (last k), plus k points AB_j^i (A_j with coordinate i taken from B_j), so
+# n base samples cost n * (k + 2) runs. Points are generated lazily, grouped
+# per base sample: A_j, B_j, AB_j^1 .. AB_j^k.
+# From the run outputs f:
+#   first order  S_i  = mean(f(B) * (f(AB^i) - f(A))) / Var(f)  (Saltelli 2010)
+#   total        ST_i = mean((f(A) - f(AB^i))^2) / 2 Var(f)     (Jansen 1999)
+# with bootstrap 95% confidence half widths.
+###
+import glob
+import itertools
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from sweep_spec import SOBOL_BITS, SOBOL_MAX_DIMENSIONS, sobol_points
+
+SENSITIVITY_MAX_PARAMETERS: int = SOBOL_MAX_DIMENSIONS // 2
+
+
+class SaltelliDesign:
+    method: str = "saltelli"
+
+    def __init__(
+        self,
+        parameters: Dict[str, Tuple[float, float]],
+        base_samples: int,
+    ):
+        if not 0 < len(parameters) <= SENSITIVITY_MAX_PARAMETERS:
+            raise ValueError(
+                f"sensitivity analysis needs 1 to {SENSITIVITY_MAX_PARAMETERS} parameters"
+            )
+        for name, bounds in parameters.items():
+            if len(bounds) != 2 or bounds[0] >= bounds[1]:
+                raise ValueError(f"range of {name} must be (low, high), low < high")
+        self.parameters = dict(parameters)
+        self.base_samples = base_samples
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.parameters)
+
+    @property
+    def group_size(self) -> int:
+        return len(self.parameters) + 2
+
+    def __len__(self) -> int:
+        return self.base_samples * self.group_size
+
+    def __iter__(self) -> Iterator[Dict[str, float]]:
+        k = len(self.parameters)
+        low = np.array([b[0] for b in self.parameters.values()], dtype=np.float64)
+        span = np.array([b[1] for b in self.parameters.values()]) - low
+        # points with A_j == B_j (the origin, the centre, ...) tell nothing
+        samples = (
+            u for u in sobol_points(2 * k, 1 << SOBOL_BITS) if np.any(u[:k] != u[k:])
+        )
+        for u in itertools.islice(samples, self.base_samples):
+            a = low + u[:k] * span
+            b = low + u[k:] * span
+            yield dict(zip(self.parameters, a.tolist()))
+            yield dict(zip(self.parameters, b.tolist()))
+            for i in range(k):
+                ab = a.copy()
+                ab[i] = b[i]
+                yield dict(zip(self.parameters, ab.tolist()))
+
+
+def _indices(f_a: np.ndarray, f_b: np.ndarray, f_ab: np.ndarray) -> tuple:
+    variance = np.concatenate([f_a, f_b]).var()
+    if variance <= 0.0:
+        nan = np.full(f_ab.shape[1], np.nan)
+        return nan, nan
+    first = np.mean(f_b[:, None] * (f_ab - f_a[:, None]), axis=0) / variance
+    total = 0.5 * np.mean((f_a[:, None] - f_ab) ** 2, axis=0) / variance
+    return first, total
+
+
+def sobol_indices(
+    outputs: np.ndarray,
+    parameter_count: int,
+    bootstrap: int = 200,
+    seed: int = 0,
+) -> Dict[str, np.ndarray]:
+    # outputs in design order (length n * (k + 2)), groups with a missing
+    # (NaN) output are dropped
+    groups = np.asarray(outputs, dtype=np.float64).reshape(-1, parameter_count + 2)
+    groups = groups[~np.isnan(groups).any(axis=1)]
+    f_a, f_b, f_ab = groups[:, 0], groups[:, 1], groups[:, 2:]
+    first, total = _indices(f_a, f_b, f_ab)
+    result = {
+        "samples": np.array(len(groups)),
+        "first_order": first,
+        "total": total,
+        "first_order_conf": np.full(parameter_count, np.nan),
+        "total_conf": np.full(parameter_count, np.nan),
+    }
+    if bootstrap > 0 and len(groups) > 1:
+        rng = np.random.default_rng(seed)
+        resampled = [
+            _indices(f_a[r], f_b[r], f_ab[r])
+            for r in rng.integers(0, len(groups), (bootstrap, len(groups)))
+        ]
+        result["first_order_conf"] = 1.96 * np.std([s for s, _ in resampled], axis=0)
+        result["total_conf"] = 1.96 * np.std([t for _, t in resampled], axis=0)
+    return result
+
+
+def final_state(run_directory: str) -> Optional[Tuple[int, np.ndarray]]:
+    # (agent count, population_strat_count) at the end of a run, from the
+    # exit log of the FLAMEGPU JSON logger (or batch_engine.export_logs), or
+    # the last step log if there is no exit log. None if nothing was logged.
+    for path in sorted(glob.glob(os.path.join(run_directory, "*.json"))):
+        with open(path, "r") as log_file:
+            try:
+                log = json.load(log_file)
+            except json.JSONDecodeError:
+                continue
+        last = log.get("exit") or (log.get("steps") or [None])[-1]
+        if not last:
+            continue
+        counts = np.asarray(last["environment"]["population_strat_count"], np.int64)
+        agents = last.get("agents", {}).get("prisoner", {}).get("default", {})
+        return int(agents.get("count", counts.sum())), counts
+    return None
+
+
+def run_outputs(
+    agent_count: int,
+    population_strat_count: np.ndarray,
+    strategy_names: Sequence[str],
+) -> Dict[str, float]:
+    # final population size and the share of each strategy (vs own trait)
+    outputs = {"population": float(agent_count)}
+    per_strategy = np.asarray(population_strat_count).reshape(
+        len(strategy_names), -1
+    ).sum(axis=1)
+    total = per_strategy.sum()
+    for name, count in zip(strategy_names, per_strategy):
+        outputs[f"share_{name}"] = float(count / total) if total > 0 else 0.0
+    return outputs
+
+
+def format_indices(
+    names: Sequence[str], indices: Dict[str, Dict[str, np.ndarray]]
+) -> str:
+    lines = []
+    for output, result in indices.items():
+        lines.append(f"{output} ({int(result['samples'])} base samples)")
+        lines.append(f"  {'parameter':<26}{'S1':>16}{'ST':>16}")
+        for i, name in enumerate(names):
+            lines.append(
+                f"  {name:<26}"
+                f"{result['first_order'][i]:>8.3f} ±{result['first_order_conf'][i]:<6.3f}"
+                f"{result['total'][i]:>8.3f} ±{result['total_conf'][i]:<6.3f}"
+            )
+    return "\n".join(lines)
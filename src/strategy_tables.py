@@ -0,0 +1,84 @@
+###
+# Strategy vector lookup tables
+# every valid agent_strategies vector of a configuration is enumerated once as a
+# "genome". Genomes 0 .. strategy_count - 1 are the pure strategies, followed by
+# the genomes of the configured mixed mode:
+#   kin        (strategy vs same trait, strategy vs other traits), 2 components
+#   per trait  one strategy per opponent trait, trait_count components
+# component c of a mixed genome is digit c of (genome - strategy_count) in base
+# strategy_count. Init and reproduction then only gather from the tables:
+#   vectors[genome, trait]        agent_strategies of an agent with that trait
+#   strategy_ids[genome, trait]   agent_strategy_id ("base 10" my/other)
+#   pop_index[genome, trait]      bin of population_strat_count
+#   mutations[strategy]           the candidate strategies to mutate to
+###
+from typing import Dict, Sequence
+
+import numpy as np
+
+
+def mixed_components(trait_count: int, per_trait: bool) -> int:
+    return trait_count if per_trait else 2
+
+
+def genome_count(strategy_count: int, trait_count: int, per_trait: bool) -> int:
+    return strategy_count + strategy_count ** mixed_components(trait_count, per_trait)
+
+
+def build_strategy_tables(
+    strategy_count: int, trait_count: int, per_trait: bool
+) -> Dict[str, np.ndarray]:
+    components = mixed_components(trait_count, per_trait)
+    genomes = genome_count(strategy_count, trait_count, per_trait)
+    traits = np.arange(trait_count)
+
+    # digits[genome, component], pure genomes repeat their strategy
+    mixed = np.arange(genomes - strategy_count)
+    digits = np.empty((genomes, components), dtype=np.int64)
+    digits[:strategy_count] = np.arange(strategy_count)[:, None]
+    for c in range(components):
+        digits[strategy_count:, c] = (mixed // strategy_count**c) % strategy_count
+
+    # vectors[genome, trait of the agent, trait of the opponent]
+    if per_trait:
+        vectors = np.broadcast_to(
+            digits[:, None, :], (genomes, trait_count, trait_count)
+        ).copy()
+    else:
+        same = traits[None, :, None] == traits[None, None, :]
+        vectors = np.where(same, digits[:, 0, None, None], digits[:, 1, None, None])
+
+    # my = strategy vs own trait, other = strategy vs the first other trait
+    strat_my = vectors[:, traits, traits]
+    other = np.where(traits == 0, 1, 0) if trait_count > 1 else traits
+    strat_other = vectors[:, traits, other]
+
+    # candidates: strategy s mutates to mutations[s, r], r < strategy_count - 1
+    mutations = np.array(
+        [[c for c in range(strategy_count) if c != s] for s in range(strategy_count)],
+        dtype=np.uint8,
+    ).reshape(strategy_count, max(strategy_count - 1, 0))
+
+    return {
+        "digits": digits,
+        "vectors": vectors.astype(np.uint8),
+        "strategy_ids": (strat_my * 10 + strat_other).astype(np.uint8),
+        "pop_index": (strat_my * strategy_count + strat_other).astype(np.uint32),
+        "mutations": mutations,
+    }
+
+
+def genome_weights(
+    tables: Dict[str, np.ndarray], strategy_weights: Sequence[float], pure: bool
+) -> np.ndarray:
+    # initial probability of each genome: the product of its component weights
+    weights = np.asarray(strategy_weights, dtype=np.float64)
+    weights = weights / weights.sum()
+    strategy_count = len(weights)
+    genome_p = np.prod(weights[tables["digits"]], axis=1)
+    if pure:
+        genome_p[strategy_count:] = 0.0
+        genome_p[:strategy_count] = weights
+    else:
+        genome_p[:strategy_count] = 0.0
+    return genome_p / genome_p.sum()
@@ -0,0 +1,159 @@
+###
+# Parameter sweep specifications
+# a sweep is a dict of env property name -> levels or range:
+#   [v0, v1, ...]   discrete levels
+#   (low, high)     continuous range (sampled methods only)
+# and a method:
+#   factorial  every combination of the levels
+#   lhs        Latin hypercube of `samples` points
+#   sobol      the first `samples` points of the Sobol sequence
+# points are generated lazily one at a time, chunked() groups them into fixed
+# size lists so a sweep of any size holds at most one chunk of run plans.
+###
+import itertools
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, TypeVar, Union
+
+import numpy as np
+
+Levels = Union[Sequence[float], Tuple[float, float]]
+T = TypeVar("T")
+
+SWEEP_METHODS: Tuple[str, ...] = ("factorial", "lhs", "sobol")
+
+# Joe & Kuo (2008) direction numbers (new-joe-kuo-6.21201) of dimensions 2..21:
+# (degree s, polynomial coefficients a, initial m_1 .. m_s). Dimension 1 is the
+# van der Corput sequence.
+SOBOL_DIRECTIONS: List[Tuple[int, int, Tuple[int, ...]]] = [
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+    (6, 19, (1, 1, 1, 15, 7, 5)),
+    (6, 22, (1, 3, 1, 15, 13, 25)),
+    (6, 25, (1, 1, 5, 5, 19, 61)),
+    (7, 1, (1, 3, 7, 11, 23, 15, 103)),
+    (7, 4, (1, 3, 7, 13, 13, 15, 69)),
+]
+SOBOL_MAX_DIMENSIONS: int = len(SOBOL_DIRECTIONS) + 1
+SOBOL_BITS: int = 32
+
+
+def _sobol_direction_vectors(dimensions: int) -> np.ndarray:
+    # v[bit, dimension], already shifted to SOBOL_BITS bit integers
+    if dimensions > SOBOL_MAX_DIMENSIONS:
+        raise ValueError(
+            f"sobol sampling supports at most {SOBOL_MAX_DIMENSIONS} dimensions"
+        )
+    v = np.zeros((SOBOL_BITS, dimensions), dtype=np.uint64)
+    v[:, 0] = [1 << (SOBOL_BITS - 1 - k) for k in range(SOBOL_BITS)]
+    for d in range(1, dimensions):
+        s, a, m = SOBOL_DIRECTIONS[d - 1]
+        column = [m[k] << (SOBOL_BITS - 1 - k) for k in range(s)]
+        for k in range(s, SOBOL_BITS):
+            value = column[k - s] ^ (column[k - s] >> s)
+            for l in range(1, s):
+                if (a >> (s - 1 - l)) & 1:
+                    value ^= column[k - l]
+            column.append(value)
+        v[:, d] = column
+    return v
+
+
+def sobol_points(dimensions: int, count: int) -> Iterator[np.ndarray]:
+    # Gray code construction, one point in [0, 1)^dimensions per iteration
+    v = _sobol_direction_vectors(dimensions)
+    x = np.zeros(dimensions, dtype=np.uint64)
+    scale = 1.0 / (1 << SOBOL_BITS)
+    for i in range(count):
+        yield x * scale
+        # flip the direction number of the lowest zero bit of i
+        x = x ^ v[(~i & (i + 1)).bit_length() - 1]
+
+
+def latin_hypercube_points(
+    dimensions: int, count: int, seed: int = 0
+) -> Iterator[np.ndarray]:
+    # point i falls in stratum strata[i, d] of every dimension d, jittered
+    rng = np.random.default_rng(seed)
+    strata = np.stack(
+        [rng.permutation(count) for _ in range(dimensions)], axis=1
+    ).astype(np.int32)
+    for i in range(count):
+        yield (strata[i] + rng.random(dimensions)) / count
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
+
+
+class SweepSpec:
+    def __init__(
+        self,
+        parameters: Dict[str, Levels],
+        method: str = "factorial",
+        samples: int = 0,
+        seed: int = 0,
+    ):
+        if method not in SWEEP_METHODS:
+            raise ValueError(f"unknown sweep method {method}, use one of {SWEEP_METHODS}")
+        for name, levels in parameters.items():
+            if isinstance(levels, tuple):
+                if method == "factorial":
+                    raise ValueError(f"factorial sweeps need levels for {name}")
+                if len(levels) != 2:
+                    raise ValueError(f"range of {name} must be (low, high)")
+            elif len(levels) == 0:
+                raise ValueError(f"{name} has no levels")
+        self.parameters = dict(parameters)
+        self.method = method
+        self.samples = samples
+        self.seed = seed
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.parameters)
+
+    def __len__(self) -> int:
+        if self.method == "factorial":
+            return int(np.prod([len(v) for v in self.parameters.values()]))
+        return self.samples
+
+    def __iter__(self) -> Iterator[Dict[str, float]]:
+        if self.method == "factorial":
+            for values in itertools.product(*self.parameters.values()):
+                yield dict(zip(self.parameters, values))
+            return
+        for u in self.unit_points():
+            yield self.scale(u)
+
+    def unit_points(self) -> Iterator[np.ndarray]:
+        if self.method == "sobol":
+            return sobol_points(len(self.parameters), self.samples)
+        return latin_hypercube_points(len(self.parameters), self.samples, self.seed)
+
+    def scale(self, u: np.ndarray) -> Dict[str, float]:
+        # unit point -> parameter values, levels are picked by equal sized bins
+        point: Dict[str, float] = {}
+        for (name, levels), x in zip(self.parameters.items(), u):
+            if isinstance(levels, tuple):
+                low, high = levels
+                point[name] = float(low + x * (high - low))
+            else:
+                point[name] = levels[min(int(x * len(levels)), len(levels) - 1)]
+        return point
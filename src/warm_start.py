@@ -0,0 +1,131 @@
+###
+# Warm starts from a population snapshot
+# the population of a burnt-in run is saved once and later runs (single runs,
+# every run of an ensemble or sweep, and the CPU engines) start from it
+# instead of the random init_fn layout. A snapshot is an .npz of per agent
+# columns
+#   x_a, y_a, energy, agent_trait, agent_strategies, agent_strategy_id
+#   and, where known, id, agent_strategy_genome, game_memory, game_memory_choices
+# plus "meta", a JSON document with the step and environment of the run it
+# was taken from. Only the grid size and the number of traits have to match
+# the new run, any other env property (e.g. cost_of_living) may differ.
+# A snapshot can also be cut from the checkpoints of a decomposed run:
+#   python src/warm_start.py CHECKPOINT_DIR --step 2000 --out data/burn_in.npz
+###
+import argparse
+import json
+import os
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from schema import ID_NOT_SET, cpu_agent_columns
+
+REQUIRED_COLUMNS: Tuple[str, ...] = (
+    "x_a",
+    "y_a",
+    "energy",
+    "agent_trait",
+    "agent_strategies",
+    "agent_strategy_id",
+)
+OPTIONAL_COLUMNS: Tuple[str, ...] = (
+    "id",
+    "agent_strategy_genome",
+    "game_memory",
+    "game_memory_choices",
+)
+
+
+def write_snapshot(
+    path: str, agents: Dict[str, np.ndarray], step: int, environment: dict
+) -> None:
+    missing = [name for name in REQUIRED_COLUMNS if name not in agents]
+    if missing:
+        raise ValueError(f"a snapshot needs the columns {', '.join(missing)}")
+    columns = {
+        name: np.asarray(agents[name])
+        for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+        if name in agents
+    }
+    meta = json.dumps({"step": int(step), "environment": environment}, default=float)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # np.savez would add .npz to any other suffix
+    with open(path, "wb") as snapshot_file:
+        np.savez_compressed(snapshot_file, meta=np.array(meta), **columns)
+
+
+def read_snapshot(path: str) -> Tuple[Dict[str, np.ndarray], dict]:
+    # (agent columns, meta)
+    with np.load(path) as snapshot:
+        meta = json.loads(str(snapshot["meta"]))
+        agents = {name: snapshot[name] for name in snapshot.files if name != "meta"}
+    return agents, meta
+
+
+def check_snapshot(
+    agents: Dict[str, np.ndarray], env_max: int, trait_count: int
+) -> None:
+    # raise if the snapshot can not seed a run on this grid
+    if agents["x_a"].size and max(agents["x_a"].max(), agents["y_a"].max()) >= env_max:
+        raise ValueError(f"snapshot agents lie outside of a {env_max}^2 grid")
+    if agents["agent_strategies"].shape[1] != trait_count:
+        raise ValueError(
+            f"snapshot agents have {agents['agent_strategies'].shape[1]} traits, "
+            f"the model has {trait_count}"
+        )
+    cells = agents["x_a"].astype(np.int64) * env_max + agents["y_a"]
+    if np.unique(cells).size != cells.size:
+        raise ValueError("snapshot has more than one agent in a cell")
+
+
+def cpu_population(
+    agents: Dict[str, np.ndarray],
+    spaces_within_radius: int,
+    first_id: int = ID_NOT_SET + 1,
+) -> Dict[str, np.ndarray]:
+    # the columns of the CPU engines (schema.cpu_agent_columns), ids renumbered
+    # from first_id and game memory cleared unless the snapshot has it
+    n = agents["x_a"].size
+    population = cpu_agent_columns(
+        agents["agent_strategies"].shape[1], spaces_within_radius, n
+    )
+    for name in REQUIRED_COLUMNS:
+        population[name][:] = agents[name]
+    population["id"][:] = np.arange(first_id, first_id + n)
+    if n and "game_memory" in agents and "id" in agents:
+        # remembered opponents keep pointing at the same agents
+        old_ids = agents["id"].astype(np.int64)
+        order = np.argsort(old_ids)
+        memory = agents["game_memory"].astype(np.int64)
+        slot = order[np.minimum(np.searchsorted(old_ids, memory, sorter=order), n - 1)]
+        known = old_ids[slot] == memory
+        population["game_memory"][:] = np.where(known, population["id"][slot], ID_NOT_SET)
+        population["game_memory_choices"][:] = agents["game_memory_choices"]
+    return population
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from checkpoints import read_config, replay
+
+    parser = argparse.ArgumentParser(
+        description="Cut a warm start snapshot from the checkpoints of a run"
+    )
+    parser.add_argument("directory", help="checkpoint directory of the run")
+    parser.add_argument("--step", type=int, required=True)
+    parser.add_argument("--out", required=True, help="snapshot (.npz) to write")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    start, agents = replay(args.directory, args.step, args.workers)
+    write_snapshot(
+        args.out, agents, args.step, read_config(args.directory)["environment"]
+    )
+    print(
+        f"replayed steps {start} to {args.step}, "
+        f"{agents['id'].size} agents written to {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
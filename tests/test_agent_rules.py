@@ -0,0 +1,92 @@
+import numpy as np
+
+import agent_rules
+from agent_rules import (
+    AGENT_STRATEGY_COOP,
+    AGENT_STRATEGY_DEFECT,
+    AGENT_STRATEGY_RANDOM,
+    AGENT_STRATEGY_TIT_FOR_TAT,
+)
+
+
+def test_strategy_id():
+    strategies = np.array([[0, 1, 1, 1], [2, 3, 3, 3], [1, 2, 2, 2]], dtype=np.uint8)
+    trait = np.array([0, 1, 3], dtype=np.uint8)
+    np.testing.assert_array_equal(
+        agent_rules.strategy_id(strategies, trait), [1, 32, 21]
+    )
+
+
+def test_decide_and_remember():
+    agents = {
+        "id": np.array([1, 2, 3, 4], dtype=np.int64),
+        "game_memory": np.zeros((4, 8), dtype=np.int64),
+        "game_memory_choices": np.zeros((4, 8), dtype=np.uint8),
+    }
+    me = np.arange(4)
+    strategy = np.array(
+        [
+            AGENT_STRATEGY_COOP,
+            AGENT_STRATEGY_DEFECT,
+            AGENT_STRATEGY_TIT_FOR_TAT,
+            AGENT_STRATEGY_RANDOM,
+        ]
+    )
+    opponent = np.array([2, 1, 4, 3], dtype=np.int64)
+    no_noise = np.ones(4)
+    coop = agent_rules.decide(
+        agents, me, opponent, 0, strategy, np.full(4, 0.7), no_noise, 0.0
+    )
+    np.testing.assert_array_equal(coop, [True, False, True, True])
+    # tit for tat repeats a remembered defection of the same opponent
+    agent_rules.remember(agents, me, opponent, 0, strategy, np.zeros(4, dtype=bool))
+    np.testing.assert_array_equal(agents["game_memory"][:, 0], [0, 0, 4, 0])
+    coop = agent_rules.decide(
+        agents, me, opponent, 0, strategy, np.full(4, 0.2), no_noise, 0.0
+    )
+    np.testing.assert_array_equal(coop, [True, False, False, False])
+    # noise flips every decision
+    coop = agent_rules.decide(
+        agents, me, opponent, 0, strategy, np.full(4, 0.2), np.zeros(4), 0.5
+    )
+    np.testing.assert_array_equal(coop, [False, True, True, True])
+
+
+def test_payoff():
+    my_coop = np.array([True, True, False, False])
+    other_coop = np.array([True, False, True, False])
+    np.testing.assert_array_equal(
+        agent_rules.payoff(my_coop, other_coop, 3.0, -1.0, 5.0, 0.0),
+        [3.0, -1.0, 5.0, 0.0],
+    )
+
+
+def test_mutation_always_changes_strategy():
+    strategies = np.arange(4, dtype=np.uint8)[:, None].repeat(3, axis=1)
+    for shift in (1, 2, 3):
+        mutated = agent_rules.mutate(strategies, np.zeros((4, 3)), shift, 0.5, 4)
+        assert np.all(mutated != strategies)
+        assert np.all(mutated < 4)
+    unchanged = agent_rules.mutate(strategies, np.ones((4, 3)), 1, 0.5, 4)
+    np.testing.assert_array_equal(unchanged, strategies)
+
+
+def test_inherit_strategies_by_mode():
+    strategies = np.array([[0, 1, 1], [0, 1, 1], [0, 1, 1]], dtype=np.uint8)
+    trait = np.zeros(3, dtype=np.uint8)
+    pure = np.array([True, False, False])
+    per_trait = np.array([False, True, False])
+    children = agent_rules.inherit_strategies(
+        strategies, trait, pure, per_trait, lambda s: s
+    )
+    # pure children copy the first column, kin children the (own, other) pair
+    np.testing.assert_array_equal(children, [[0, 0, 0], [0, 1, 1], [0, 1, 1]])
+
+
+def test_child_energy():
+    parent_energy = np.array([80.0, 80.0])
+    inheritence = np.array([0.5, 0.0])
+    energy = agent_rules.child_energy(
+        parent_energy, np.array([1.0, -10.0]), inheritence, 50.0, 10.0, 5.0, 150.0
+    )
+    np.testing.assert_array_equal(energy, [40.0, 5.0])
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+
+from batch_engine import (
+    STOP_REASON_EXTINCT,
+    STOP_REASON_FIXATION,
+    STOP_REASON_NONE,
+    STOP_REASON_STEADY_STATE,
+    BatchSimulation,
+)
+
+ENVIRONMENT = {
+    "env_max": 16,
+    "init_agent_count": 80,
+    "max_agents": 200,
+    "mutation_rate": 0.05,
+    "env_noise": 0.05,
+}
+
+
+def replicate_state(batch: BatchSimulation, replicate: int) -> dict:
+    # agents of one replicate in cell order, ids left out (they are numbered
+    # over the whole batch)
+    a = batch.agents
+    mine = np.flatnonzero(a["replicate"] == replicate)
+    mine = mine[np.lexsort((a["y_a"][mine], a["x_a"][mine]))]
+    return {
+        name: a[name][mine]
+        for name in ("x_a", "y_a", "energy", "agent_trait", "agent_strategies")
+    }
+
+
+def assert_same_state(left: dict, right: dict) -> None:
+    assert left.keys() == right.keys()
+    for name in left:
+        np.testing.assert_array_equal(left[name], right[name], err_msg=name)
+
+
+def test_replicate_does_not_depend_on_its_batch():
+    batch = BatchSimulation([1, 2, 3], ENVIRONMENT)
+    alone = BatchSimulation([2], ENVIRONMENT)
+    for _ in range(25):
+        batch.step()
+        alone.step()
+        np.testing.assert_array_equal(
+            batch.population_strat_count[1], alone.population_strat_count[0]
+        )
+    assert_same_state(replicate_state(batch, 1), replicate_state(alone, 0))
+
+
+def test_replicate_environments_apply_per_replicate():
+    batch = BatchSimulation(
+        [5, 5],
+        ENVIRONMENT,
+        replicate_environments=[{}, {"cost_of_living": 1000.0}],
+    )
+    batch.step()
+    counts = batch.population_strat_count.sum(axis=1)
+    assert counts[0] > 0
+    assert counts[1] == 0
+
+
+def test_shared_properties_must_match():
+    with pytest.raises(ValueError):
+        BatchSimulation(
+            [1, 2],
+            ENVIRONMENT,
+            replicate_environments=[{}, {"env_max": 32}],
+        )
+
+
+def test_counts_match_agents():
+    batch = BatchSimulation([7, 8], ENVIRONMENT)
+    batch.simulate(10, log_every_n_steps=5)
+    counts = batch.population_strat_count
+    for k in range(2):
+        assert counts[k].sum() == np.count_nonzero(batch.agents["replicate"] == k)
+        assert len(batch.step_logs[k]) == 2
+    assert np.unique(batch.agents["id"]).size == batch.agent_count
+
+
+def run_states(steps: int, **options) -> tuple:
+    # (counts of every step + final state of each replicate, the batch)
+    batch = BatchSimulation([11, 12], ENVIRONMENT, **options)
+    states = []
+    for _ in range(steps):
+        batch.step()
+        states.append(batch.population_strat_count.copy())
+    return states + [replicate_state(batch, k) for k in range(2)], batch
+
+
+def test_sparse_cell_index_matches_dense():
+    dense, dense_batch = run_states(20, sparse_density_threshold=0.0)
+    sparse, sparse_batch = run_states(20, sparse_density_threshold=1.0)
+    assert dense_batch.cell_index.name == "dense"
+    assert sparse_batch.cell_index.name == "sparse"
+    for left, right in zip(dense[:20], sparse[:20]):
+        np.testing.assert_array_equal(left, right)
+    for left, right in zip(dense[20:], sparse[20:]):
+        assert_same_state(left, right)
+
+
+def test_tiled_processing_matches_untiled():
+    untiled, _ = run_states(20)
+    # small enough for several tiles and row chunks
+    tiled, tiled_batch = run_states(20, tile_memory_budget=4096)
+    assert tiled_batch.tile_side < tiled_batch.env_max
+    assert len(tiled_batch._row_chunks(tiled_batch.agent_count)) > 1
+    for left, right in zip(untiled[:20], tiled[:20]):
+        np.testing.assert_array_equal(left, right)
+    for left, right in zip(untiled[20:], tiled[20:]):
+        assert_same_state(left, right)
+
+
+def test_extinct_replicate_stops_alone():
+    batch = BatchSimulation(
+        [5, 5],
+        ENVIRONMENT,
+        replicate_environments=[{}, {"cost_of_living": 1000.0}],
+    )
+    alone = BatchSimulation([5], ENVIRONMENT)
+    batch.simulate(10)
+    alone.simulate(10)
+    assert batch.step_counter == 10
+    assert batch.stop_reason.tolist() == [STOP_REASON_NONE, STOP_REASON_EXTINCT]
+    assert batch.stop_step[1] == 1
+    np.testing.assert_array_equal(
+        batch.population_strat_count[0], alone.population_strat_count[0]
+    )
+    assert_same_state(replicate_state(batch, 0), replicate_state(alone, 0))
+
+
+def test_fixation_stops_without_mutation():
+    environment = dict(
+        ENVIRONMENT, mutation_rate=0.0, agent_strategy_weights=[1.0, 0.0, 0.0, 0.0]
+    )
+    batch = BatchSimulation(
+        [1, 2],
+        environment,
+        replicate_environments=[{}, {"mutation_rate": 0.1}],
+        stop_on_fixation=True,
+    )
+    batch.simulate(10)
+    # with mutation a lost strategy can come back, so that run carries on
+    assert batch.stop_reason.tolist() == [STOP_REASON_FIXATION, STOP_REASON_NONE]
+    assert batch.stop_step[0] == 1
+    assert batch.step_counter == 10
+
+
+def test_steady_state_stops_and_keeps_final_population():
+    # every share is within 1.0 of itself, so the run stops once the window is full
+    batch = BatchSimulation(
+        [1, 2], ENVIRONMENT, steady_state_window=3, steady_state_epsilon=1.0
+    )
+    reference = BatchSimulation([1, 2], ENVIRONMENT)
+    batch.simulate(10, log_every_n_steps=1)
+    reference.simulate(3)
+    assert batch.stop_reason.tolist() == [STOP_REASON_STEADY_STATE] * 2
+    assert batch.stop_step.tolist() == [3, 3]
+    assert batch.agent_count == 0
+    np.testing.assert_array_equal(
+        batch.population_strat_count, reference.population_strat_count
+    )
+    assert [len(logs) for logs in batch.step_logs] == [3, 3]
+    grid = batch.snapshot_grid(1)
+    np.testing.assert_array_equal(grid, reference.snapshot_grid(1))
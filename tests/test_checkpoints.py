@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from checkpoints import (
+    checkpoint_steps,
+    load_checkpoint,
+    nearest_checkpoint,
+    replay,
+    write_config,
+)
+from domain_decomposition import DecomposedSimulation
+
+ENVIRONMENT = {"env_max": 16, "init_agent_count": 80, "max_agents": 200}
+
+
+def checkpointed_run(directory: str, steps: int, workers: int = 2) -> None:
+    simulation = DecomposedSimulation(
+        3,
+        ENVIRONMENT,
+        workers=workers,
+        checkpoints={"directory": directory, "every_n_steps": 5},
+    )
+    simulation.simulate(steps)
+
+
+def test_replay_matches_a_direct_run(tmp_path):
+    directory = str(tmp_path / "checkpoints")
+    checkpointed_run(directory, 20)
+    assert checkpoint_steps(directory) == [0, 5, 10, 15, 20]
+    assert nearest_checkpoint(directory, 13) == 10
+
+    direct = str(tmp_path / "direct")
+    DecomposedSimulation(3, ENVIRONMENT, workers=1).simulate(
+        13, final_state_directory=direct
+    )
+    expected = load_checkpoint(direct, 13)
+    for workers in (1, 4):
+        start, agents = replay(directory, 13, workers=workers)
+        assert start == 10
+        for name in expected:
+            np.testing.assert_array_equal(agents[name], expected[name])
+
+
+def test_replay_of_a_checkpointed_step_loads_it(tmp_path):
+    directory = str(tmp_path / "checkpoints")
+    checkpointed_run(directory, 10)
+    start, agents = replay(directory, 10)
+    assert start == 10
+    np.testing.assert_array_equal(agents["id"], load_checkpoint(directory, 10)["id"])
+
+
+def test_a_directory_holds_one_run(tmp_path):
+    directory = str(tmp_path / "checkpoints")
+    checkpointed_run(directory, 5, workers=4)
+    with pytest.raises(FileExistsError):
+        checkpointed_run(directory, 5, workers=2)
+    with pytest.raises(FileExistsError):
+        write_config(directory, 4, ENVIRONMENT, 4)
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from count_series import (
+    CountSeries,
+    CountSeriesWriter,
+    decode_block,
+    decode_varints,
+    encode_block,
+    encode_varints,
+)
+from output_pipeline import OutputPipeline
+
+
+def test_varints_round_trip():
+    values = np.array(
+        [0, 1, -1, 63, -64, 64, 300, -300, 2**40, -(2**40), 2**63 - 1, -(2**63)],
+        dtype=np.int64,
+    )
+    np.testing.assert_array_equal(decode_varints(encode_varints(values)), values)
+    # zig-zag: small magnitudes of either sign take one byte
+    assert len(encode_varints(np.array([0, -1, 1, -64, 63]))) == 5
+    assert decode_varints(b"").size == 0
+
+
+def test_block_round_trip():
+    rows = np.array([[10, 5, 0, 7], [11, 6, 0, 3], [12, 6, 1, 0]], dtype=np.int64)
+    np.testing.assert_array_equal(decode_block(encode_block(rows), 4), rows)
+
+
+def random_counts(steps: int, bins: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return np.cumsum(rng.integers(-3, 4, (steps, bins)), axis=0) + 1000
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_series_round_trip(tmp_path, workers):
+    path = str(tmp_path / "run.counts")
+    counts = random_counts(1000, 16)
+    pipeline = OutputPipeline(workers) if workers else None
+    writer = CountSeriesWriter(path, 16, block_steps=64, pipeline=pipeline)
+    for step, row in enumerate(counts):
+        # every other step, as with OUTPUT_EVERY_N_STEPS = 2
+        writer.append(2 * step, row)
+    writer.close()
+    if pipeline is not None:
+        pipeline.close()
+
+    series = CountSeries(path)
+    assert len(series) == 1000
+    assert len(series.index) == -(-1000 // 64)
+    steps, read = series.read()
+    np.testing.assert_array_equal(steps, 2 * np.arange(1000))
+    np.testing.assert_array_equal(read, counts)
+
+
+def test_series_reads_a_step_range(tmp_path):
+    path = str(tmp_path / "run.counts")
+    counts = random_counts(500, 4)
+    writer = CountSeriesWriter(path, 4, block_steps=50)
+    for step, row in enumerate(counts):
+        writer.append(step, row)
+    writer.close()
+
+    series = CountSeries(path)
+    steps, read = series.read(123, 321)
+    np.testing.assert_array_equal(steps, np.arange(123, 322))
+    np.testing.assert_array_equal(read, counts[123:322])
+    steps, read = series.read(first_step=480)
+    np.testing.assert_array_equal(steps, np.arange(480, 500))
+    steps, read = series.read(600, 700)
+    assert steps.size == 0 and read.shape == (0, 4)
+
+
+def test_unclosed_series_is_refused(tmp_path):
+    path = str(tmp_path / "run.counts")
+    writer = CountSeriesWriter(path, 4, block_steps=2)
+    for step in range(5):
+        writer.append(step, [step, 0, 0, 0])
+    writer._file.close()
+    with pytest.raises(ValueError):
+        CountSeries(path)
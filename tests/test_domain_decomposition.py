@@ -0,0 +1,39 @@
+import numpy as np
+
+from checkpoints import load_checkpoint
+from domain_decomposition import DecomposedSimulation, counter_uniform
+
+ENVIRONMENT = {
+    "env_max": 16,
+    "init_agent_count": 80,
+    "max_agents": 200,
+    "mutation_rate": 0.05,
+    "env_noise": 0.05,
+}
+
+
+def test_counter_uniform_is_keyed_by_id():
+    ids = np.arange(1, 1001)
+    values = counter_uniform(1, 2, 3, ids)
+    assert np.all((values >= 0.0) & (values < 1.0))
+    # the same value for an id, whatever else is drawn with it
+    np.testing.assert_array_equal(counter_uniform(1, 2, 3, ids[::-1]), values[::-1])
+    assert not np.array_equal(counter_uniform(1, 3, 3, ids), values)
+
+
+def test_counts_do_not_depend_on_worker_count(tmp_path):
+    runs = {}
+    for workers in (1, 2, 4):
+        simulation = DecomposedSimulation(7, ENVIRONMENT, workers=workers)
+        directory = str(tmp_path / f"workers_{workers}")
+        counts = simulation.simulate(30, final_state_directory=directory)
+        assert simulation.workers == workers
+        assert simulation.step_counter == 30
+        runs[workers] = counts, load_checkpoint(directory, 30)
+    counts, agents = runs[1]
+    assert counts.shape == (30, 16)
+    assert counts[-1].sum() == agents["id"].size > 0
+    for workers in (2, 4):
+        np.testing.assert_array_equal(runs[workers][0], counts)
+        for name in agents:
+            np.testing.assert_array_equal(runs[workers][1][name], agents[name])
@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from output_pipeline import DoubleBuffer, OutputPipeline
+
+
+def test_tasks_of_a_key_run_in_order():
+    pipeline = OutputPipeline(workers=3, queue_size=2)
+    done = {key: [] for key in "abcd"}
+    threads = {key: set() for key in "abcd"}
+
+    def task(key, value):
+        done[key].append(value)
+        threads[key].add(threading.get_ident())
+
+    for value in range(50):
+        for key in done:
+            pipeline.submit(key, task, key, value)
+    pipeline.drain()
+    assert all(values == list(range(50)) for values in done.values())
+    # a key is only ever written by one thread
+    assert all(len(idents) == 1 for idents in threads.values())
+    pipeline.close()
+    assert pipeline.tasks_done == 200
+
+
+def test_a_failed_task_is_raised_again():
+    pipeline = OutputPipeline(workers=1, queue_size=1)
+
+    def fail():
+        raise OSError("disk full")
+
+    pipeline.submit("a", fail)
+    with pytest.raises(RuntimeError) as raised:
+        pipeline.drain()
+    assert isinstance(raised.value.__cause__, OSError)
+    # later tasks still run, the error is only raised once
+    done = []
+    pipeline.submit("a", done.append, 1)
+    pipeline.close()
+    assert done == [1]
+    with pytest.raises(RuntimeError):
+        pipeline.submit("a", done.append, 2)
+
+
+def test_double_buffer_waits_for_release():
+    buffers = DoubleBuffer(list)
+    buffers.front.append(1)
+    filled, release = buffers.swap()
+    assert filled == [1] and buffers.front == []
+    buffers.front.append(2)
+    swapped = []
+    thread = threading.Thread(target=lambda: swapped.append(buffers.swap()))
+    thread.start()
+    thread.join(0.1)
+    # the first buffer is still being written
+    assert thread.is_alive()
+    release()
+    thread.join(1.0)
+    assert swapped[0][0] == [2] and buffers.front is filled
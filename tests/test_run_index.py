@@ -0,0 +1,77 @@
+import json
+import sqlite3
+
+import pytest
+
+from run_index import RunIndex, main, query
+
+
+def record(seed: int, **config) -> dict:
+    return {
+        "config": config,
+        "random_seed": seed,
+        "steps": 100,
+        "steps_completed": 100,
+        "stop_reason": 0,
+        "output_subdirectory": f"run_{seed}",
+    }
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    path = str(tmp_path / "runs.sqlite")
+    index = RunIndex(path)
+    index.insert(1, record(1, cost_of_living=2 / 3, strategy_pure=1), [3, 1])
+    index.insert(2, record(2, cost_of_living=1.5, strategy_pure=1), [0, 0])
+    index.insert(3, record(3, cost_of_living=2 / 3, strategy_pure=0, env_noise=0.1, label="low"))
+    index.close()
+    return path
+
+
+def test_insert_and_query(index_path):
+    names, rows = query(index_path)
+    assert len(rows) == 3
+    assert {"cost_of_living", "strategy_pure", "env_noise", "final_share_1"} <= set(names)
+    # only numbers get a column, anything else stays in the config JSON
+    assert "label" not in names
+
+    names, rows = query(
+        index_path,
+        {"cost_of_living": 0.6666666666666667, "strategy_pure": 1},
+        ["random_seed", "final_count_0", "final_share_0", "config"],
+    )
+    assert names == ["random_seed", "final_count_0", "final_share_0", "config"]
+    assert len(rows) == 1
+    seed, count, share, config = rows[0]
+    assert (seed, count, share) == (1, 3, 0.75)
+    assert json.loads(config) == {"cost_of_living": 2 / 3, "strategy_pure": 1}
+    # a run without final counts has none
+    _, rows = query(index_path, {"env_noise": 0.1}, ["random_seed", "final_count_0"])
+    assert rows == [(3, None)]
+    # a total of 0 gives shares of 0
+    _, rows = query(index_path, {"cost_of_living": 1.5}, ["final_share_0"])
+    assert rows == [(0.0,)]
+
+
+def test_insert_replaces_a_run(index_path):
+    index = RunIndex(index_path)
+    index.insert(1, dict(record(1, cost_of_living=2 / 3), steps_completed=50))
+    index.close()
+    _, rows = query(index_path, {"random_seed": 1}, ["steps_completed"])
+    assert rows == [(50,)]
+
+
+def test_config_columns_are_indexed(index_path):
+    connection = sqlite3.connect(index_path)
+    plan = connection.execute(
+        'EXPLAIN QUERY PLAN SELECT * FROM runs WHERE "cost_of_living" BETWEEN ? AND ?',
+        (0.6, 0.7),
+    ).fetchall()
+    connection.close()
+    assert "USING INDEX" in plan[0][-1]
+
+
+def test_command_line(index_path, capsys):
+    main([index_path, "--where", "strategy_pure=1", "--columns", "random_seed"])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == ["random_seed", "1", "2", "2 runs"]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from sensitivity import SaltelliDesign, run_outputs, sobol_indices
+
+
+def ishigami(x1: float, x2: float, x3: float, a: float = 7.0, b: float = 0.1) -> float:
+    return np.sin(x1) + a * np.sin(x2) ** 2 + b * x3**4 * np.sin(x1)
+
+
+def test_design_groups():
+    design = SaltelliDesign({"p": (0.0, 1.0), "q": (10.0, 20.0)}, base_samples=8)
+    points = list(design)
+    assert len(points) == len(design) == 8 * 4
+    for j in range(8):
+        a, b, ab_p, ab_q = points[4 * j : 4 * j + 4]
+        assert a != b
+        assert ab_p == {"p": b["p"], "q": a["q"]}
+        assert ab_q == {"p": a["p"], "q": b["q"]}
+    assert all(0.0 <= p["p"] < 1.0 and 10.0 <= p["q"] < 20.0 for p in points)
+
+
+def test_design_skips_points_with_equal_halves():
+    # with one parameter the Sobol sequence repeats coordinates most often
+    points = list(SaltelliDesign({"p": (0.0, 1.0)}, base_samples=64))
+    assert all(points[j] != points[j + 1] for j in range(0, len(points), 3))
+
+
+def test_design_rejects_bad_ranges():
+    with pytest.raises(ValueError):
+        SaltelliDesign({"p": (1.0, 0.0)}, base_samples=8)
+    with pytest.raises(ValueError):
+        SaltelliDesign({}, base_samples=8)
+
+
+def test_ishigami_indices():
+    # analytic values for a = 7, b = 0.1
+    first_order = np.array([0.3139, 0.4424, 0.0])
+    total = np.array([0.5576, 0.4424, 0.2437])
+    design = SaltelliDesign({f"x{i}": (-np.pi, np.pi) for i in (1, 2, 3)}, 4096)
+    outputs = np.array([ishigami(**point) for point in design])
+    indices = sobol_indices(outputs, 3, bootstrap=50)
+    assert int(indices["samples"]) == 4096
+    np.testing.assert_allclose(indices["first_order"], first_order, atol=0.03)
+    np.testing.assert_allclose(indices["total"], total, atol=0.03)
+    assert np.all(indices["first_order_conf"] < 0.1)
+    assert np.all(indices["total_conf"] < 0.1)
+
+
+def test_missing_outputs_drop_their_group():
+    outputs = np.arange(4 * 5, dtype=np.float64)
+    outputs[6] = np.nan
+    assert int(sobol_indices(outputs, 2, bootstrap=0)["samples"]) == 4
+
+
+def test_run_outputs_shares():
+    outputs = run_outputs(10, np.array([1, 1, 0, 0, 4, 4]), ["coop", "defect", "tft"])
+    assert outputs == {
+        "population": 10.0,
+        "share_coop": 0.2,
+        "share_defect": 0.0,
+        "share_tft": 0.8,
+    }